@@ -0,0 +1 @@
+"""Benchmarks of the analysis functions (python -m benchmarks.run --help)"""
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the superposition in align_res_env
+
+python benchmarks/bench_superimpose.py --models 2000 --atoms 12 --env-atoms 300
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+
+from script.utilities.superimpose import SuperImposer, kabsch_batch, transform_batch  # noqa: E402
+
+
+def make_models(n_models: int, n_atoms: int, n_env_atoms: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ref = rng.normal(size=(n_atoms, 3)) * 3
+    probes, envs = [], []
+    for _ in range(n_models):
+        q, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        shift = rng.normal(size=3) * 10
+        probes.append(ref @ q + shift + rng.normal(scale=0.1, size=ref.shape))
+        envs.append(rng.normal(size=(n_env_atoms, 3)) * 8 @ q + shift)
+    return ref, np.array(probes), np.array(envs)
+
+
+def loop(sup, ref, probes, envs):
+    return [sup.fit(probe, ref).transform(env) for probe, env in zip(probes, envs)]
+
+
+def batch(ref, probes, envs):
+    rots, trans = kabsch_batch(probes, ref)
+    return transform_batch(envs, rots, trans)
+
+
+def run(n_models: int, n_atoms: int, n_env_atoms: int, repeat: int) -> dict:
+    """
+    output:
+        {name: the best time [s] of each implementation}
+    """
+    ref, probes, envs = make_models(n_models, n_atoms, n_env_atoms)
+    cases = {
+        "numpy SuperImposer (loop)": lambda: loop(SuperImposer(), ref, probes, envs),
+        "numpy kabsch_batch": lambda: batch(ref, probes, envs),
+    }
+    try:
+        from script.utilities.Bio.sklearn_interface import SuperImposer as SklearnSuperImposer
+
+        cases = {"sklearn SuperImposer (loop)": lambda: loop(SklearnSuperImposer(), ref, probes, envs), **cases}
+    except ImportError:
+        print("scikit-learn is not installed: the previous implementation is skipped")
+
+    # the implementations give the same coordinates
+    results = [np.asarray(func()) for func in cases.values()]
+    for result in results[1:]:
+        np.testing.assert_allclose(result, results[0], atol=1e-6)
+
+    return {name: min(timeit.repeat(func, number=1, repeat=repeat)) for name, func in cases.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the superposition of probe environments")
+    parser.add_argument("--models", type=int, default=2000, help="number of models (snapshots)")
+    parser.add_argument("--atoms", type=int, default=12, help="number of probe atoms to be fitted")
+    parser.add_argument("--env-atoms", type=int, default=300, help="number of atoms moved in each model")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    times = run(args.models, args.atoms, args.env_atoms, args.repeat)
+    base = next(iter(times.values()))
+    for name, sec in times.items():
+        print(f"{name:30s} {sec * 1000:10.2f} ms  x{base / sec:.1f}")
@@ -0,0 +1,123 @@
+"""
+Benchmark cases: {name: (setup, {size: parameters})}
+
+setup(workdir, **parameters) generates the inputs in workdir and returns the function to be measured,
+so that only the function (not the generation of its inputs) is timed.
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+from . import synthetic
+
+
+def setup_gen_distance_grid(workdir: Path, n_points: int, n_residues: int) -> Callable:
+    from script.utilities.GridUtil import gen_distance_grid
+
+    pdb = synthetic.write_protein_pdb(workdir / "protein.pdb", n_residues)
+    grid = synthetic.make_grid(n_points, n_residues)
+    return lambda: gen_distance_grid(grid, pdb, verbose=False)
+
+
+def setup_estimate_volume(workdir: Path, n_residues: int) -> Callable:
+    from script.utilities.scipy.spatial_func import estimate_volume
+
+    coords, _ = synthetic.protein_coords(n_residues)
+    radii = np.full(len(coords), 1.7 + 1.7)  # VdW radius of carbon + solvent, as estimate_exclute_volume
+    return lambda: estimate_volume(coords, radii)
+
+
+def setup_resenv(workdir: Path, n_models: int, n_residues: int, n_probes: int) -> Callable:
+    from script.resenv import resenv
+    from script.utilities.Bio import PDB as uPDB
+
+    traj = synthetic.write_trajectory_pdb(workdir / "traj.pdb", n_models, n_residues, n_probes)
+    grid = synthetic.make_grid(48, n_residues)
+    return lambda: resenv(grid, uPDB.MultiModelPDBReader(str(traj)), synthetic.PROBE_RESN, [" C1 "], threshold=0.2)
+
+
+def setup_align_res_env(workdir: Path, n_models: int, n_residues: int, n_probes: int) -> Callable:
+    from script.alignresenv import align_res_env
+    from script.utilities.Bio import PDB as uPDB
+
+    # one probe with its environment per model, as the output of resenv
+    traj = synthetic.write_trajectory_pdb(workdir / "env.pdb", n_models, n_residues, n_probes)
+    struct = uPDB.get_structure(traj)
+    reference = struct[0]
+    focused = [name for name, _, _ in synthetic.PROBE_ATOMS[:3]]
+    return lambda: align_res_env(struct, reference, synthetic.PROBE_RESN, focused)
+
+
+def setup_grid_max(workdir: Path, n_grids: int, n_points: int) -> Callable:
+    from script.maxpmap import grid_max
+
+    grids = [synthetic.make_grid(n_points, seed=seed) for seed in range(n_grids)]
+    return lambda: grid_max(grids)
+
+
+def setup_gen_max_pmap(workdir: Path, n_grids: int, n_points: int) -> Callable:
+    from script.maxpmap import gen_max_pmap
+
+    paths = [str(synthetic.write_dx(workdir / f"pmap{seed}.dx", n_points, seed=seed)) for seed in range(n_grids)]
+    return lambda: gen_max_pmap(paths, str(workdir / "maxpmap.dx"))
+
+
+def setup_gro_parse(workdir: Path, n_atoms: int) -> Callable:
+    from script.utilities.gromacs import Gro
+
+    gro = synthetic.write_gro(workdir / "system.gro", n_atoms)
+    return lambda: Gro(str(gro))
+
+
+CASES: Dict[str, Tuple[Callable, Dict[str, dict]]] = {
+    "gen_distance_grid": (
+        setup_gen_distance_grid,
+        {
+            "small": {"n_points": 24, "n_residues": 50},
+            "medium": {"n_points": 48, "n_residues": 200},
+            "large": {"n_points": 80, "n_residues": 1000},
+        },
+    ),
+    "estimate_volume": (
+        setup_estimate_volume,
+        {"small": {"n_residues": 100}, "medium": {"n_residues": 1000}, "large": {"n_residues": 10000}},
+    ),
+    "resenv": (
+        setup_resenv,
+        {
+            "small": {"n_models": 5, "n_residues": 50, "n_probes": 10},
+            "medium": {"n_models": 20, "n_residues": 200, "n_probes": 20},
+            "large": {"n_models": 100, "n_residues": 300, "n_probes": 40},
+        },
+    ),
+    "align_res_env": (
+        setup_align_res_env,
+        {
+            "small": {"n_models": 20, "n_residues": 8, "n_probes": 1},
+            "medium": {"n_models": 200, "n_residues": 8, "n_probes": 1},
+            "large": {"n_models": 1000, "n_residues": 8, "n_probes": 1},
+        },
+    ),
+    "grid_max": (
+        setup_grid_max,
+        {
+            "small": {"n_grids": 4, "n_points": 32},
+            "medium": {"n_grids": 8, "n_points": 64},
+            "large": {"n_grids": 8, "n_points": 128},
+        },
+    ),
+    "gen_max_pmap": (
+        setup_gen_max_pmap,
+        {
+            "small": {"n_grids": 4, "n_points": 32},
+            "medium": {"n_grids": 8, "n_points": 64},
+            "large": {"n_grids": 8, "n_points": 128},
+        },
+    ),
+    "Gro.parse": (
+        setup_gro_parse,
+        {"small": {"n_atoms": 3000}, "medium": {"n_atoms": 30000}, "large": {"n_atoms": 300000}},
+    ),
+}
@@ -0,0 +1,163 @@
+"""
+Runner of the benchmarks
+
+python -m benchmarks.run --sizes small medium -o results.json       # time and peak memory of each case and size
+python -m benchmarks.run --sizes small --compare baseline.json       # exit with 1 if a case is slower than baseline
+
+Time is the best of --repeat runs (perf_counter), and peak memory is the peak of the memory allocated
+by the function (tracemalloc, including NumPy arrays) in a separate run, since tracing slows the function down.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .cases import CASES
+
+# a case is a regression if its time or peak memory exceeds THRESHOLD x the baseline
+THRESHOLD = 1.2
+# differences of times smaller than this are noise [s]
+MIN_TIME_DIFF = 0.005
+
+
+def measure(func: Callable, repeat: int = 3) -> dict:
+    """
+    output:
+        {"time_s": the best time [s], "times_s": all times [s], "peak_mb": peak allocated memory [MB]}
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time_s": min(times), "times_s": times, "peak_mb": peak / 2**20}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        cwd = Path(__file__).parents[1]
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def environment() -> dict:
+    import numpy
+
+    return {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "node": platform.node(),
+    }
+
+
+def run(names: List[str], sizes: List[str], repeat: int = 3, verbose: bool = True) -> Dict[str, dict]:
+    """
+    output:
+        {"{case}/{size}": {"case", "size", "parameters", "time_s", "times_s", "peak_mb"}}
+    """
+    results = {}
+    for name in names:
+        setup, presets = CASES[name]
+        for size in sizes:
+            if size not in presets:
+                continue
+            with tempfile.TemporaryDirectory() as tmpdir:
+                func = setup(Path(tmpdir), **presets[size])
+                result = measure(func, repeat)
+            results[f"{name}/{size}"] = {"case": name, "size": size, "parameters": presets[size], **result}
+            if verbose:
+                print(f"{name + '/' + size:32s} {result['time_s'] * 1000:12.2f} ms {result['peak_mb']:10.2f} MB")
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = THRESHOLD) -> List[dict]:
+    """
+    changes of time and peak memory of the cases in both results
+    output:
+        [{"key", "metric", "baseline", "current", "ratio", "regression"}]
+    """
+    ret = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric, min_diff in [("time_s", MIN_TIME_DIFF), ("peak_mb", 0.1)]:
+            base, current = baseline[key][metric], result[metric]
+            ratio = current / base if base > 0 else float("inf")
+            regression = ratio > threshold and current - base > min_diff
+            ret.append(
+                {
+                    "key": key,
+                    "metric": metric,
+                    "baseline": base,
+                    "current": current,
+                    "ratio": ratio,
+                    "regression": regression,
+                }
+            )
+    return ret
+
+
+def format_comparison(changes: List[dict]) -> str:
+    lines = [f"{'case':32s} {'metric':8s} {'baseline':>12s} {'current':>12s} {'ratio':>7s}"]
+    for c in changes:
+        mark = "  REGRESSION" if c["regression"] else ""
+        lines.append(
+            f"{c['key']:32s} {c['metric']:8s} {c['baseline']:12.4f} {c['current']:12.4f} {c['ratio']:7.2f}{mark}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks of time and peak memory of the analysis functions")
+    parser.add_argument("cases", nargs="*", default=list(CASES), help=f"cases (default: all of {list(CASES)})")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=["small", "medium", "large"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", type=Path, help="results file (json)")
+    parser.add_argument("--compare", type=Path, help="baseline results file (json) to be compared with")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="ratio to the baseline of regressions")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {sorted(unknown)}")
+
+    results = run(args.cases, args.sizes, args.repeat)
+    if args.output is not None:
+        args.output.write_text(json.dumps({"environment": environment(), "results": results}, indent=2))
+    if args.compare is None:
+        return 0
+
+    baseline = json.loads(args.compare.read_text())
+    changes = compare(results, baseline["results"], args.threshold)
+    print(f"\nbaseline: {args.compare} (commit {baseline['environment'].get('commit')})")
+    print(format_comparison(changes))
+    regressions = [c for c in changes if c["regression"]]
+    if regressions:
+        print(f"{len(regressions)} regressions (> {args.threshold} x baseline)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Generators of synthetic inputs of the benchmarks (proteins, MSMD trajectories with probes, DX grids, GRO files)
+
+The inputs have realistic formats and densities, not realistic structures:
+residues are placed on a lattice filling a sphere and probes are placed around the protein at random.
+Every generator is deterministic for a seed.
+"""
+
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+# alanine with the backbone (relative positions [A] from CA)
+RESIDUE_ATOMS = [
+    (" N  ", "N", (-1.2, 0.6, 0.0)),
+    (" CA ", "C", (0.0, 0.0, 0.0)),
+    (" C  ", "C", (1.2, 0.7, 0.3)),
+    (" O  ", "O", (1.3, 1.9, 0.2)),
+    (" CB ", "C", (0.0, -1.5, 0.4)),
+]
+# benzene-like probe
+PROBE_RESN = "BEN"
+PROBE_ATOMS = [(f" C{i + 1} ", "C", (1.4 * np.cos(i * np.pi / 3), 1.4 * np.sin(i * np.pi / 3), 0.0)) for i in range(6)]
+RESIDUE_SPACING = 4.8  # [A] the density of atoms is close to that of proteins
+
+
+def _pdb_line(record: str, serial: int, name: str, resn: str, resi: int, xyz, element: str) -> str:
+    x, y, z = xyz
+    return (
+        f"{record:6s}{serial % 100000:5d} {name:4s} {resn:3s} A{resi % 10000:4d}    "
+        f"{x:8.3f}{y:8.3f}{z:8.3f}{1.0:6.2f}{0.0:6.2f}          {element:>2s}\n"
+    )
+
+
+def residue_centers(n_residues: int) -> np.ndarray:
+    """
+    centers of n_residues residues on a cubic lattice, ordered by the distance from the origin (a globule)
+    """
+    n = int(np.ceil(n_residues ** (1 / 3))) + 2
+    axis = (np.arange(n) - (n - 1) / 2) * RESIDUE_SPACING
+    lattice = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+    order = np.argsort(np.linalg.norm(lattice, axis=1), kind="stable")
+    return lattice[order[:n_residues]]
+
+
+def protein_coords(n_residues: int, seed: int = 0) -> Tuple[np.ndarray, List[Tuple[str, str, int]]]:
+    """
+    output:
+        coords: (n_residues * 5, 3) coordinates [A]
+        atoms: [(atom name, element, residue number)]
+    """
+    rng = np.random.default_rng(seed)
+    offsets = np.array([xyz for _, _, xyz in RESIDUE_ATOMS])
+    centers = residue_centers(n_residues) + rng.normal(scale=0.3, size=(n_residues, 3))
+    coords = (centers[:, None, :] + offsets[None, :, :]).reshape(-1, 3)
+    atoms = [(name, element, i + 1) for i in range(n_residues) for name, element, _ in RESIDUE_ATOMS]
+    return coords, atoms
+
+
+def probe_positions(n_residues: int, n_probes: int, rng: np.random.Generator) -> np.ndarray:
+    """centers of probes in the shell of 3-8 A around the protein surface"""
+    radius = np.linalg.norm(residue_centers(n_residues), axis=1).max()
+    directions = rng.normal(size=(n_probes, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    return directions * (radius + rng.uniform(3.0, 8.0, size=(n_probes, 1)))
+
+
+def write_protein_pdb(path: Path, n_residues: int, seed: int = 0) -> Path:
+    coords, atoms = protein_coords(n_residues, seed)
+    with open(path, "w") as fout:
+        for serial, ((name, element, resi), xyz) in enumerate(zip(atoms, coords), 1):
+            fout.write(_pdb_line("ATOM", serial, name, "ALA", resi, xyz, element))
+        fout.write("END\n")
+    return path
+
+
+def write_trajectory_pdb(path: Path, n_models: int, n_residues: int, n_probes: int, seed: int = 0) -> Path:
+    """
+    multi-model PDB of a protein (fluctuating around the same structure) and probes moving at random
+    (the format of the trajectories without water written by exprorer_msmd)
+    """
+    rng = np.random.default_rng(seed)
+    coords, atoms = protein_coords(n_residues, seed)
+    probe_offsets = np.array([xyz for _, _, xyz in PROBE_ATOMS])
+    with open(path, "w") as fout:
+        for k in range(n_models):
+            fout.write(f"MODEL     {k + 1:4d}\n")
+            serial = 0
+            model = coords + rng.normal(scale=0.2, size=coords.shape)
+            for (name, element, resi), xyz in zip(atoms, model):
+                serial += 1
+                fout.write(_pdb_line("ATOM", serial, name, "ALA", resi, xyz, element))
+            fout.write("TER\n")
+            for p, center in enumerate(probe_positions(n_residues, n_probes, rng)):
+                rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+                for (name, element, _), xyz in zip(PROBE_ATOMS, probe_offsets @ rot + center):
+                    serial += 1
+                    fout.write(_pdb_line("HETATM", serial, name, PROBE_RESN, n_residues + p + 1, xyz, element))
+            fout.write("ENDMDL\n")
+        fout.write("END\n")
+    return path
+
+
+def make_grid(n_points: int, n_residues: int = 0, delta: float = 1.0, seed: int = 0):
+    """
+    gridData.Grid of n_points^3 points centered at the origin (covering the protein of n_residues residues)
+    with probabilities in [0, 0.4), which are sparse (zero) in half of the points
+    """
+    from gridData import Grid
+
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0, 0.4, size=(n_points,) * 3)
+    values[rng.random(size=values.shape) < 0.5] = 0
+    size = max(n_points * delta, 2 * np.linalg.norm(residue_centers(n_residues), axis=1).max() if n_residues else 0)
+    delta = size / n_points
+    return Grid(values, origin=np.full(3, -size / 2 + delta / 2), delta=delta)
+
+
+def write_dx(path: Path, n_points: int, n_residues: int = 0, seed: int = 0) -> Path:
+    make_grid(n_points, n_residues, seed=seed).export(str(path), type="double")
+    return path
+
+
+def write_gro(path: Path, n_atoms: int, seed: int = 0) -> Path:
+    """GRO file of a box of water (3 atoms per SOL residue)"""
+    rng = np.random.default_rng(seed)
+    box = (n_atoms / 100.0) ** (1 / 3)  # [nm] ~100 atoms/nm^3 like water
+    coords = rng.uniform(0, box, size=(n_atoms, 3))
+    names = ["OW", "HW1", "HW2"]
+    with open(path, "w") as fout:
+        fout.write("synthetic water box\n")
+        fout.write(f"{n_atoms:5d}\n")
+        for i, (x, y, z) in enumerate(coords):
+            resi = i // 3 + 1
+            fout.write(
+                f"{resi % 100000:5d}{'SOL':<5s}{names[i % 3]:>5s}{(i + 1) % 100000:5d}{x:8.3f}{y:8.3f}{z:8.3f}\n"
+            )
+        fout.write(f"{box:10.5f}{box:10.5f}{box:10.5f}\n")
+    return path
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from benchmarks import synthetic
+from benchmarks.run import compare, main, measure
+from script.utilities.Bio import PDB as uPDB
+from script.utilities.gromacs import Gro
+
+
+def test_synthetic_files(tmp_path):
+    protein = uPDB.get_structure(synthetic.write_protein_pdb(tmp_path / "protein.pdb", 30))
+    assert len(list(protein.get_atoms())) == 30 * len(synthetic.RESIDUE_ATOMS)
+
+    traj = synthetic.write_trajectory_pdb(tmp_path / "traj.pdb", 3, 30, 4)
+    models = list(uPDB.MultiModelPDBReader(str(traj)))
+    assert len(models) == 3
+    probes = [a for a in models[0].get_atoms() if uPDB.get_resname(a) == synthetic.PROBE_RESN]
+    assert len(probes) == 4 * len(synthetic.PROBE_ATOMS)
+
+    gro = Gro(str(synthetic.write_gro(tmp_path / "system.gro", 300)))
+    assert gro.natoms == len(gro.atoms) == 300
+
+    grid = synthetic.make_grid(16, 30)
+    assert grid.grid.shape == (16, 16, 16)
+    assert 0 < (grid.grid > 0).mean() < 1
+
+
+def test_measure():
+    result = measure(lambda: bytearray(8 * 2**20), repeat=2)
+    assert len(result["times_s"]) == 2 and result["time_s"] == min(result["times_s"])
+    assert result["peak_mb"] == pytest.approx(8, rel=0.1)
+
+
+def test_compare():
+    baseline = {"a/small": {"time_s": 1.0, "peak_mb": 10.0}, "b/small": {"time_s": 0.001, "peak_mb": 1.0}}
+    results = {
+        "a/small": {"time_s": 1.5, "peak_mb": 10.0},
+        "b/small": {"time_s": 0.002, "peak_mb": 1.0},  # slower, but within the noise
+        "c/small": {"time_s": 1.0, "peak_mb": 1.0},  # not in the baseline
+    }
+    regressions = [(c["key"], c["metric"]) for c in compare(results, baseline) if c["regression"]]
+    assert regressions == [("a/small", "time_s")]
+
+
+def test_main(tmp_path, capsys):
+    output = tmp_path / "results.json"
+    assert main(["grid_max", "Gro.parse", "--sizes", "small", "--repeat", "1", "-o", str(output)]) == 0
+    results = json.loads(output.read_text())
+    assert set(results["results"]) == {"grid_max/small", "Gro.parse/small"}
+    assert results["environment"]["numpy"]
+
+    # a baseline 10 times faster
+    for result in results["results"].values():
+        result["time_s"] /= 10
+    output.write_text(json.dumps(results))
+    assert main(["Gro.parse", "--sizes", "small", "--repeat", "1", "--compare", str(output)]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
@@ -5,6 +5,7 @@ from string import Template
 import yaml
 
 from script.utilities import util
+from script.utilities.const import REQUEUE_EXIT_CODE
 from script.utilities.logger import logger
 
 
@@ -40,10 +41,13 @@ if __name__ == "__main__":
     GROUP = ""
     QTYPE = ""
     MAXTIME = ""
+    SIGNAL_TIME = 300
     if environment["use_scheduler"] == True:
         GROUP = environment["scheduler"]["group"]
         QTYPE = environment["scheduler"]["qtype"]
         MAXTIME = environment["scheduler"]["maxtime"]
+        # seconds before the time limit to checkpoint simulations
+        SIGNAL_TIME = environment["scheduler"].get("signal_time", 300)
 
     use_singularity = environment["use_singularity"]
     singularity_sifpath = ""
@@ -89,6 +93,8 @@ if __name__ == "__main__":
                         "ITER_INDEX": ITER_INDEX,
                         "YAML": SETTING_YAML,
                         "NGPUS": len(gr),
+                        "SIGNAL_TIME": SIGNAL_TIME,
+                        "REQUEUE_EXIT_CODE": REQUEUE_EXIT_CODE,
                     }
                 )
             )
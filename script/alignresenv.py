@@ -2,13 +2,14 @@ import tempfile
 from pathlib import Path
 from typing import List
 
+import numpy as np
 from Bio.PDB.Atom import Atom
 from Bio.PDB.Model import Model
 from Bio.PDB.Structure import Structure
 from tqdm import tqdm
 
 from script.utilities.Bio import PDB as uPDB
-from script.utilities.Bio.sklearn_interface import SuperImposer
+from script.utilities.superimpose import kabsch_batch
 
 DESCRIPTION = """
 superimpose structures in accordance with specific atoms
@@ -54,16 +55,18 @@ def align_res_env(
         raise ValueError("No reference atom to align")
     # print(ref_probe_c_coords)
 
-    sup = SuperImposer()
+    # superposition of all models at once
+    models = list(struct)
+    probe_coords = np.array([uPDB.get_attr(model, "coord", sele=selector) for model in models])
+    rots, trans = kabsch_batch(probe_coords, ref_probe_c_coords)
+
     tmppdb = Path(tempfile.mkstemp(suffix=".pdb")[1])
     with uPDB.PDBIOhelper(tmppdb) as pdbio:
-        for model in tqdm(struct, desc="[align res. env.]", disable=not verbose):
-
-            # print(struct, i)
-            probe_coords = uPDB.get_attr(model, "coord", sele=selector)
-            sup.fit(probe_coords, ref_probe_c_coords)
+        for model, rot, tran in tqdm(
+            zip(models, rots, trans), total=len(models), desc="[align res. env.]", disable=not verbose
+        ):
             all_coords = uPDB.get_attr(model, "coord")
-            uPDB.set_attr(model, "coord", sup.transform(all_coords))
+            uPDB.set_attr(model, "coord", all_coords @ rot + tran)
 
             pdbio.save(model)
             # print(len(pdbio))
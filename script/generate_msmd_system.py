@@ -6,12 +6,22 @@ from pathlib import Path
 from subprocess import getoutput as gop
 from typing import Literal, Tuple
 
+import numpy as np
+import parmed as pmd
+
 from script.utilities import const
+from script.utilities.box import required_size
 from script.utilities.executable import Packmol, Parmchk, TLeap
 from script.utilities.logger import logger
+from script.utilities.pmd import cut_box
+from script.utilities.probe_packer import ProbePacker
+from script.utilities.trace import span
 
 VERSION = "2.0.0"
 
+# distance between the protein and the edges of the box [A]
+SOLVATION_BUFFER = 10.0
+
 tmp_leap = """
 source leaprc.protein.ff14SB
 source leaprc.water.tip3p
@@ -20,7 +30,7 @@ prot = loadPDB {pdbfile}
 
 addIons2 prot Na+ 0
 addIons2 prot Cl- 0
-solvateBox prot TIP3PBOX 10.0
+solvateBox prot TIP3PBOX {buffer}
 
 center prot
 charge prot
@@ -44,12 +54,13 @@ def protein_pdb_preparation(pdbfile: Path) -> Path:
     return tmp1
 
 
+@span("tleap:boxsize")
 def __calculate_boxsize(pdbfile: Path) -> float:
     tmpdir = tempfile.mkdtemp()
     tmp_prefix = f"{tmpdir}/{const.TMP_PREFIX}"
     with open(f"{tmp_prefix}.in", "w") as fout:
-        fout.write(tmp_leap.format(pdbfile=str(pdbfile), tmp_prefix=tmp_prefix))
-    logger.info(gop(f"tleap -f {tmp_prefix}.in | tee {tmp_prefix}.in.result"))
+        fout.write(tmp_leap.format(pdbfile=str(pdbfile), tmp_prefix=tmp_prefix, buffer=SOLVATION_BUFFER))
+    logger.info(gop(f"{TLeap().exe} -f {tmp_prefix}.in | tee {tmp_prefix}.in.result"))
 
     try:
         size = calculate_boxsize(Path(f"{tmp_prefix}.rst7"))
@@ -74,6 +85,27 @@ def calculate_boxsize(rst7: Path) -> float:
     return box_size
 
 
+def calculate_boxsize_of_shape(pdbfile: Path, box_shape: str) -> float:
+    """
+    get box size (distance between periodic images) of a dodecahedron / octahedron box
+    keeping the same distance between the protein and its images as the cubic box
+    """
+    struct = pmd.load_file(str(pdbfile))
+    return required_size(struct.coordinates, box_shape, SOLVATION_BUFFER)
+
+
+def _origin_of(box_pdb: Path, parm7: Path, rst7: Path) -> np.ndarray:
+    """
+    the origin of the packmol coordinates in the tleap output (solvateBox translates the system)
+    """
+    ref = pmd.load_file(str(box_pdb))
+    system = pmd.load_file(str(parm7), xyz=str(rst7))
+    ref_atom = next(a for a in ref.atoms if a.name == "CA")
+    atom = next(a for a in system.atoms if a.name == "CA")
+    return np.array([atom.xx, atom.xy, atom.xz]) - np.array([ref_atom.xx, ref_atom.xy, ref_atom.xz])
+
+
+@span("parmchk")
 def _create_frcmod(mol2file: Path, atomtype: Literal["gaff", "gaff2"], debug: bool = False) -> Path:
     """
     create frcmod file from mol2 file
@@ -90,29 +122,49 @@ def _create_frcmod(mol2file: Path, atomtype: Literal["gaff", "gaff2"], debug: bo
 
 
 def create_system(
-    setting_protein: dict, setting_probe: dict, probe_frcmod: Path, debug: bool = False, seed: int = -1
+    setting_protein: dict,
+    setting_probe: dict,
+    probe_frcmod: Path,
+    debug: bool = False,
+    seed: int = -1,
+    box_shape: str = "cubic",
 ) -> Tuple[Path, Path]:
     """
     create system from protein and probe
+    box_shape: cubic, dodecahedron or octahedron (see utilities.box)
     """
     pdbpath = protein_pdb_preparation(Path(setting_protein["pdb"]))
-    boxsize = __calculate_boxsize(pdbpath)
+    if box_shape == "cubic":
+        boxsize = __calculate_boxsize(pdbpath)
+    else:
+        boxsize = calculate_boxsize_of_shape(pdbpath, box_shape)
     ssbonds = setting_protein["ssbond"]
     cmol = Path(setting_probe["mol2"])
     cpdb = Path(setting_probe["pdb"])
     cid = setting_probe["cid"]
     atomtype = setting_probe["atomtype"]
     probemolar = float(setting_probe["molar"])
+    placement = setting_probe.get("placement", "packmol")
 
     box_pdb = Path(tempfile.mkstemp(suffix=".pdb")[1])
-    Packmol(debug=debug).set(pdbpath, cpdb, boxsize, probemolar).run(box_pdb, seed=seed)
-
-    tleap_obj = TLeap(debug=debug).set(cid, cmol, probe_frcmod, box_pdb, boxsize, ssbonds, atomtype)
+    if placement == "packmol":
+        packer = Packmol(debug=debug)
+    elif placement == "grid":
+        packer = ProbePacker(debug=debug)
+    else:
+        raise ValueError(f"Invalid probe placement method: {placement}")
+    with span(f"placement:{placement}"):
+        packer.set(pdbpath, cpdb, boxsize, probemolar, box_shape=box_shape).run(box_pdb, seed=seed)
+
+    tleap_obj = TLeap(debug=debug).set(
+        cid, cmol, probe_frcmod, box_pdb, boxsize, ssbonds, atomtype, box_shape=box_shape
+    )
 
     while True:
         _, fileprefix = tempfile.mkstemp(suffix="")
         os.system(f"rm {fileprefix}")
-        tleap_obj.run(fileprefix)
+        with span("tleap"):
+            tleap_obj.run(fileprefix)
         system_charge = tleap_obj._final_charge_value
 
         if system_charge == 0:
@@ -120,9 +172,16 @@ def create_system(
         else:
             logger.warn("the system is not neutral. generate system again")
 
+    if box_shape != "cubic":
+        with span("cut_box"):
+            origin = _origin_of(box_pdb, tleap_obj.parm7, tleap_obj.rst7)
+            cut_box(tleap_obj.parm7, tleap_obj.rst7, box_shape, boxsize, origin)
+        logger.info(f"{box_shape} box (distance between periodic images: {boxsize:.2f} A)")
+
     return tleap_obj.parm7, tleap_obj.rst7
 
 
+@span("generate_msmd_system")
 def generate_msmd_system(setting: dict, debug: bool = False, seed: int = -1) -> tuple[Path, Path]:
     """
     generate msmd system
@@ -138,5 +197,12 @@ def generate_msmd_system(setting: dict, debug: bool = False, seed: int = -1) ->
     cfrcmod = _create_frcmod(
         Path(setting["input"]["probe"]["mol2"]), setting["input"]["probe"]["atomtype"], debug=debug
     )
-    parm7, rst7 = create_system(setting["input"]["protein"], setting["input"]["probe"], cfrcmod, debug=debug, seed=seed)
+    parm7, rst7 = create_system(
+        setting["input"]["protein"],
+        setting["input"]["probe"],
+        cfrcmod,
+        debug=debug,
+        seed=seed,
+        box_shape=setting["input"].get("box_shape", "cubic"),
+    )
     return parm7, rst7
@@ -1,21 +1,26 @@
 #!/usr/bin/python3
 
+import json
 import os
 from pathlib import Path
-from typing import Optional, Literal
+from typing import Dict, List, Literal, Optional
 
 import gridData
 import numpy as np
 import numpy.typing as npt
 from scipy import constants
 
-from script.utilities import GridUtil, util
+from script.utilities import GridUtil, const, util
 from script.utilities.Bio import PDB as uPDB
 from script.utilities.executable import Cpptraj
+from script.utilities.sparse_grid import SparseGrid
+from script.utilities.time_resolved_grid import TimeResolvedGrid
+from script.utilities.trace import span
 
 VERSION = "1.0.0"
 
 
+@span("mask_generator")
 def mask_generator(ref_struct: Path, reference_grid: gridData.Grid, distance: Optional[float] = None) -> gridData.Grid:
     """
     input
@@ -34,51 +39,158 @@ def mask_generator(ref_struct: Path, reference_grid: gridData.Grid, distance: Op
     return mask
 
 
+# the number of voxels processed at once in the free energy conversion
+_CHUNK_VOXELS = 2**20
+
+
+def _prefixed_path(grid_path, prefix: str, ext: Optional[str] = None) -> str:
+    path = os.path.dirname(grid_path) + "/" + prefix + "_" + os.path.basename(grid_path)
+    return path if ext is None else os.path.splitext(path)[0] + ext
+
+
 def convert_to_proba(
     g: gridData.Grid, mask_grid: Optional[npt.NDArray] = None, normalize: Literal["total", "snapshot"] = "snapshot", frames: int = 1
 ) -> gridData.Grid:
+    """
+    Convert a count grid into a probability grid in place.
+    Voxels outside of the mask are filled with -1
+    (or the minimum value in the mask if it is smaller than -1).
+    """
+    if g.grid.dtype != np.float64:
+        g.grid = g.grid.astype(np.float64)
+    grid = g.grid
     if mask_grid is not None:
-        values = g.grid[np.where(mask_grid)]
-        # print(np.sum(g.grid), np.sum(values), np.where(mask_grid))
+        mask = np.asarray(mask_grid, dtype=bool)
         if normalize == "snapshot":
-            values /= frames
+            denominator = frames
         elif normalize == "total":
-            values /= np.sum(values)
+            denominator = np.sum(grid, where=mask)
         else:
             raise ValueError("Invalid normalization method")
-        g.grid = np.full_like(g.grid, np.min([np.min(values), -1]))  # assign -1 for outside of mask
-        g.grid[np.where(mask_grid)] = values
+        grid /= denominator
+        fill_value = min(np.min(grid, where=mask, initial=np.inf), -1)  # assign -1 for outside of mask
+        np.copyto(grid, fill_value, where=~mask)
     else:
-        g.grid /= np.sum(g.grid)
+        grid /= np.sum(grid)
     return g
 
 
-def convert_to_gfe(grid_path: str, mean_proba: float, temperature: float = 300) -> str:
-    pmap = gridData.Grid(grid_path)
-    pmap.grid = np.where(pmap.grid <= 0, 1e-10, pmap.grid)  # avoid log(0)
-    pmap.grid = -(constants.R / constants.calorie / constants.kilo) * temperature * np.log(pmap.grid / mean_proba)
-    pmap.grid = np.where(pmap.grid > 3, 3, pmap.grid)  # Definition of GFE in the paper Raman et al., JCIM, 2013
+def convert_proba_to_gfe(g: gridData.Grid, mean_proba: float, temperature: float = 300) -> gridData.Grid:
+    """
+    Convert a probability grid into a grid free energy (GFE) grid in place.
+    The grid is processed in chunks to bound the size of temporary arrays.
+    """
+    flat = g.grid.reshape(-1)  # a view of the contiguous grid
+    for start in range(0, flat.size, _CHUNK_VOXELS):
+        _proba_to_gfe(flat[start : start + _CHUNK_VOXELS], mean_proba, temperature)
+    return g
+
+
+def _proba_to_gfe(chunk: npt.NDArray[np.float_], mean_proba: float, temperature: float) -> npt.NDArray[np.float_]:
+    RT = (constants.R / constants.calorie / constants.kilo) * temperature
+    np.copyto(chunk, 1e-10, where=chunk <= 0)  # avoid log(0)
+    chunk /= mean_proba
+    np.log(chunk, out=chunk)
+    chunk *= -RT
+    np.minimum(chunk, 3, out=chunk)  # Definition of GFE in the paper Raman et al., JCIM, 2013
+    return chunk
 
-    gfe_path = os.path.dirname(grid_path) + "/" + "GFE" + "_" + os.path.basename(grid_path)
+
+def export_gfe(pmap: gridData.Grid, grid_path, mean_proba: float, temperature: float = 300) -> str:
+    """
+    Write GFE and InvGFE grids derived from an in-memory PMAP.
+    Note that ``pmap`` is overwritten by the InvGFE grid.
+    """
+    convert_proba_to_gfe(pmap, mean_proba, temperature)
+    gfe_path = _prefixed_path(grid_path, "GFE")
     pmap.export(gfe_path, type="double")
 
-    pmap.grid = -pmap.grid
-    invgfe_path = os.path.dirname(grid_path) + "/" + "InvGFE" + "_" + os.path.basename(grid_path)
-    pmap.export(invgfe_path, type="double")
+    np.negative(pmap.grid, out=pmap.grid)
+    pmap.export(_prefixed_path(grid_path, "InvGFE"), type="double")
 
     return gfe_path
 
 
+def convert_to_gfe(grid_path: str, mean_proba: float, temperature: float = 300) -> str:
+    pmap = gridData.Grid(grid_path)
+    if pmap.grid.dtype != np.float64:
+        pmap.grid = pmap.grid.astype(np.float64)
+    return export_gfe(pmap, grid_path, mean_proba, temperature)
+
+
+def convert_sparse_count_grid(
+    grid: SparseGrid,
+    grid_path: Path,
+    normalize: Literal["total", "snapshot"] = "snapshot",
+    frames: int = 1,
+    mean_proba: Optional[float] = None,
+    temperature: float = 300,
+) -> Dict[str, str]:
+    """
+    Sparse version of convert_count_grid. Outputs are written as npz files.
+    Note that ``grid`` is overwritten in place.
+    """
+    pmap = grid.normalize(normalize, frames)
+
+    paths = {"PMAP": _prefixed_path(grid_path, "PMAP", const.EXT_NPZ)}
+    pmap.save(paths["PMAP"])
+    if mean_proba is not None:
+        pmap.apply(lambda v: _proba_to_gfe(v.copy(), mean_proba, temperature))
+        paths["GFE"] = _prefixed_path(grid_path, "GFE", const.EXT_NPZ)
+        pmap.save(paths["GFE"])
+        pmap.apply(np.negative)
+        paths["InvGFE"] = _prefixed_path(grid_path, "InvGFE", const.EXT_NPZ)
+        pmap.save(paths["InvGFE"])
+    return paths
+
+
+@span("convert_count_grid")
+def convert_count_grid(
+    grid: gridData.Grid,
+    grid_path: Path,
+    mask: npt.NDArray,
+    normalize: Literal["total", "snapshot"] = "snapshot",
+    frames: int = 1,
+    mean_proba: Optional[float] = None,
+    temperature: float = 300,
+    map_format: Literal["dx", "sparse", "both"] = "dx",
+) -> Dict[str, str]:
+    """
+    Convert an in-memory count grid into PMAP (and GFE/InvGFE if ``mean_proba`` is given).
+    All outputs are written from the same array, which is overwritten in place.
+    input:
+        grid: count grid read from ``grid_path``
+        grid_path: path to the count grid, used to name output files
+        mask: boolean array of valid voxels
+        map_format: "dx" (dense OpenDX), "sparse" (npz holding only masked non-zero voxels) or "both"
+    output:
+        paths: {"PMAP": path[, "GFE": path, "InvGFE": path]}
+               dx paths are returned if map_format is "both"
+    """
+    if map_format not in ("dx", "sparse", "both"):
+        raise ValueError(f"Invalid map format: {map_format}")
+    if map_format != "dx":
+        sparse = SparseGrid.from_grid(grid, mask)
+        paths = convert_sparse_count_grid(sparse, grid_path, normalize, frames, mean_proba, temperature)
+        if map_format == "sparse":
+            return paths
+
+    pmap = convert_to_proba(grid, mask, frames=frames, normalize=normalize)
+
+    paths = {"PMAP": _prefixed_path(grid_path, "PMAP")}
+    pmap.export(paths["PMAP"], type="double")
+    if mean_proba is not None:
+        paths["GFE"] = export_gfe(pmap, grid_path, mean_proba, temperature)
+        paths["InvGFE"] = _prefixed_path(grid_path, "InvGFE")
+    return paths
+
+
 def convert_to_pmap(
     grid_path: Path, ref_struct: Path, valid_distance: float, normalize: Literal["total", "snapshot"] = "snapshot", frames: int = 1
 ):
     grid = gridData.Grid(grid_path)
     mask = mask_generator(ref_struct, grid, valid_distance)
-    pmap = convert_to_proba(grid, mask.grid, frames=frames, normalize=normalize)
-
-    pmap_path = os.path.dirname(grid_path) + "/" + "PMAP" + "_" + os.path.basename(grid_path)
-    pmap.export(pmap_path, type="double")
-    return pmap_path
+    return convert_count_grid(grid, grid_path, mask.grid, normalize=normalize, frames=frames)["PMAP"]
 
 
 def parse_snapshot_setting(string: str):
@@ -115,9 +227,44 @@ def parse_snapshot_setting(string: str):
     return start, stop, offset
 
 
-def gen_pmap(
-    dirpath: Path, setting_general: dict, setting_input: dict, setting_pmap: dict, traj: Path, top: Path, debug=False
-):
+def gen_window_pmap(
+    grid4d_path: Path,
+    ref_struct: Path,
+    valid_dist: Optional[float] = None,
+    start: Optional[int] = None,
+    stop: Optional[int] = None,
+    normalize: Literal["total", "snapshot"] = "snapshot",
+) -> gridData.Grid:
+    """
+    Generate a PMAP from windows[start:stop] of a time-resolved count grid
+    without reading the trajectory again.
+    input:
+        grid4d_path: {JOB_NAME}_{suffix}_4d directory written by gen_pmap with "window" setting
+    output:
+        PMAP (gridData.Grid)
+    """
+    g, frames = TimeResolvedGrid(grid4d_path).sum(start, stop)
+    mask = mask_generator(ref_struct, g, valid_dist).grid
+    return convert_to_proba(g, mask, normalize=normalize, frames=frames)
+
+
+def gen_count_grids(
+    dirpath: Path,
+    setting_general: dict,
+    setting_input: dict,
+    setting_pmap: dict,
+    traj: Path,
+    top: Path,
+    debug=False,
+    n_workers: int = 1,
+) -> Path:
+    """
+    Count probe atoms on grids with cpptraj (the gridding stage)
+    n_workers: the number of cpptraj processes gridding chunks of the trajectory
+    output:
+        {JOB_NAME}_grids.json: the count grids of maps, the number of frames and the volume of the last frame
+        (paths are relative to dirpath, so that the directory can be moved, e.g. from scratch)
+    """
 
     traj_start, traj_stop, traj_offset = parse_snapshot_setting(setting_pmap["snapshot"])
 
@@ -129,38 +276,106 @@ def gen_pmap(
     probe_id: str = setting_input["probe"]["cid"]
     maps: list = setting_pmap["maps"]
     box_size: int = setting_pmap["map_size"]
-    box_center: npt.NDArray[np.float_] = uPDB.get_attr(
-        uPDB.get_structure(setting_input["protein"]["pdb"]), "coord"
-    ).mean(axis=0)
+    ref_struct_obj = uPDB.get_structure(ref_struct)
+    box_center: npt.NDArray[np.float_] = uPDB.get_attr(ref_struct_obj, "coord").mean(axis=0)
     # structure.center_of_mass() may return "[ nan nan nan ]" due to unspecified atomic weight
 
     cpptraj_obj = Cpptraj(debug=debug)
-    cpptraj_obj.set(topology, trajectory, ref_struct, probe_id)
-    cpptraj_obj.run(
-        basedir=dirpath,
-        prefix=name,
-        box_size=box_size,
-        box_center=box_center,
-        traj_start=traj_start,
-        traj_stop=traj_stop,
-        traj_offset=traj_offset,
-        maps=maps,
-    )
+    cpptraj_obj.set(topology, trajectory, ref_struct, probe_id, box_shape=setting_input.get("box_shape", "cubic"))
+    with span("cpptraj", n_workers=n_workers):
+        cpptraj_obj.run(
+            basedir=dirpath,
+            prefix=name,
+            box_size=box_size,
+            box_center=box_center,
+            interval=setting_pmap.get("interval", 1.0),
+            traj_start=traj_start,
+            traj_stop=traj_stop,
+            traj_offset=traj_offset,
+            maps=maps,
+            n_workers=n_workers,
+            window_ns=setting_pmap.get("window"),
+        )
+
+    grid_info = Path(dirpath) / f"{name}_grids.json"
+    info = {
+        "frames": cpptraj_obj.frames,
+        "last_volume": cpptraj_obj.last_volume,
+        "maps": [
+            {
+                k: os.path.relpath(v, dirpath) if isinstance(v, Path) else v
+                for k, v in map.items()
+                if k != "atominfofile"
+            }
+            for map in cpptraj_obj.maps
+        ],
+    }
+    grid_info.write_text(json.dumps(info, indent=1))
+    return grid_info
+
+
+def count_grid_files(grid_info: Path) -> List[Path]:
+    """
+    count grids (and time-resolved grids) listed in {JOB_NAME}_grids.json written by gen_count_grids
+    (grids.json is often unchanged when the grids are regenerated, so they are inputs of the pmap stage)
+    """
+    info = json.loads(Path(grid_info).read_text())
+    return [Path(grid_info).parent / map[key] for map in info["maps"] for key in ["grid", "grid4d"] if key in map]
+
+
+def gen_pmap_from_grids(grid_info: Path, setting_input: dict, setting_pmap: dict) -> List[str]:
+    """
+    Convert count grids into PMAPs (the pmap stage)
+    input:
+        grid_info: output of gen_count_grids
+    output:
+        paths to PMAPs (GFE grids if normalization is GFE)
+    """
+    info = json.loads(Path(grid_info).read_text())
+    ref_struct = Path(setting_input["protein"]["pdb"])
+
+    if setting_pmap["normalization"] == "GFE":
+        # the excluded volume is shared by all maps (and memoized across systems)
+        protein_volume = uPDB.estimate_exclute_volume(uPDB.get_structure(ref_struct))
 
+    mask = None  # all maps share the same grid geometry
     pmap_paths = []
-    for map in cpptraj_obj.maps:
-        pmap_path = convert_to_pmap(
+    for map in info["maps"]:
+        map["grid"] = str(Path(grid_info).parent / map["grid"])
+        grid = gridData.Grid(map["grid"])
+        if mask is None:
+            mask = mask_generator(ref_struct, grid, setting_pmap["valid_dist"]).grid
+        mean_proba = None
+        if setting_pmap["normalization"] == "GFE":
+            mean_proba = map["num_probe_atoms"] / (info["last_volume"] - protein_volume)
+        paths = convert_count_grid(
+            grid,
             map["grid"],
-            ref_struct,
-            setting_pmap["valid_dist"],
-            frames=cpptraj_obj.frames,
-            normalize=setting_pmap["normalization"] if setting_pmap["normalization"] != "GFE" else "snapshot"
+            mask,
+            frames=info["frames"],
+            normalize=setting_pmap["normalization"] if setting_pmap["normalization"] != "GFE" else "snapshot",
+            mean_proba=mean_proba,
+            temperature=300,  # TODO: read temperature from setting
+            map_format=setting_pmap.get("format", "dx"),
         )
-        if setting_pmap["normalization"] == "GFE":
-            struct_obj = uPDB.get_structure(ref_struct)
-            protein_volume = uPDB.estimate_exclute_volume(struct_obj)
-            mean_proba = map["num_probe_atoms"] / (cpptraj_obj.last_volume - protein_volume)
-            pmap_path = convert_to_gfe(pmap_path, mean_proba, temperature=300)  # TODO: read temperature from setting
-        pmap_paths.append(pmap_path)
+        pmap_paths.append(paths["GFE"] if setting_pmap["normalization"] == "GFE" else paths["PMAP"])
 
     return pmap_paths
+
+
+def gen_pmap(
+    dirpath: Path,
+    setting_general: dict,
+    setting_input: dict,
+    setting_pmap: dict,
+    traj: Path,
+    top: Path,
+    debug=False,
+    n_workers: int = 1,
+):
+    """
+    gridding and pmap stages at once (see gen_count_grids and gen_pmap_from_grids)
+    n_workers: the number of cpptraj processes gridding chunks of the trajectory
+    """
+    grid_info = gen_count_grids(dirpath, setting_general, setting_input, setting_pmap, traj, top, debug, n_workers)
+    return gen_pmap_from_grids(grid_info, setting_input, setting_pmap)
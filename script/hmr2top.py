@@ -0,0 +1,98 @@
+import re
+from typing import Dict, List, Sequence, Tuple
+
+VERSION = "1.0.0"
+
+# molecules without repartitioning (rigid water is constrained by SETTLE)
+EXCLUDED_MOLECULES = ["WAT", "HOH", "SOL"]
+
+# 1 amu = mass of hydrogen atoms (1.008) is regarded as a hydrogen atom
+_HYDROGEN_MASS_RANGE = (0.5, 1.5)
+
+
+def _fields(line: str) -> List[Tuple[int, int]]:
+    """spans of whitespace-separated fields before a comment"""
+    content = line.split(";", 1)[0]
+    return [m.span() for m in re.finditer(r"\S+", content)]
+
+
+def _replace_field(line: str, span: Tuple[int, int], value: str) -> str:
+    # keep the column alignment of the original line
+    width = span[1] - span[0]
+    return line[: span[0]] + value.rjust(width) + line[span[1] :]
+
+
+def _is_hydrogen(mass: float) -> bool:
+    return _HYDROGEN_MASS_RANGE[0] < mass < _HYDROGEN_MASS_RANGE[1]
+
+
+def hmr2top(
+    top_string: str, hydrogen_mass: float = 3.024, excluded_molecules: Sequence[str] = EXCLUDED_MOLECULES
+) -> str:
+    """TOPファイルの水素原子の質量を結合している重原子から再分配する (hydrogen mass repartitioning)
+
+    各水素原子の質量を hydrogen_mass にし、増加分を結合している重原子の質量から差し引く。
+    分子の総質量は変わらない。水分子 (excluded_molecules および settles を持つ分子) は対象外。
+
+    Args:
+        top_string: 入力TOPファイルの内容
+        hydrogen_mass: 再分配後の水素原子の質量 (amu)
+        excluded_molecules: 再分配しない分子名のリスト
+
+    Returns:
+        str: 水素原子の質量が再分配されたTOPファイルの内容
+
+    Raises:
+        ValueError: 重原子の質量が水素原子の質量より小さくなる場合
+    """
+    if not top_string:
+        return ""
+
+    lines = top_string.split("\n")
+
+    # 1st pass: atoms (line index and mass) and bonds of each molecule
+    molecules: List[Dict] = []
+    current_section = None
+    for i, line in enumerate(lines):
+        content = line.split(";", 1)[0].strip()
+        if content.startswith("["):
+            current_section = content[content.find("[") + 1 : content.find("]")].strip()
+            if current_section == "moleculetype":
+                molecules.append({"name": None, "atoms": {}, "bonds": [], "settles": False})
+            elif current_section == "settles" and molecules:
+                molecules[-1]["settles"] = True
+            continue
+        if not content or not molecules or content.startswith("#"):
+            continue
+        fields = content.split()
+        if current_section == "moleculetype" and molecules[-1]["name"] is None:
+            molecules[-1]["name"] = fields[0]
+        elif current_section == "atoms" and len(fields) >= 8:
+            molecules[-1]["atoms"][int(fields[0])] = (i, float(fields[7]))
+        elif current_section == "bonds" and len(fields) >= 2:
+            molecules[-1]["bonds"].append((int(fields[0]), int(fields[1])))
+
+    # 2nd pass: repartition masses
+    new_masses: Dict[int, float] = {}  # line index -> mass
+    for molecule in molecules:
+        if molecule["settles"] or molecule["name"] in excluded_molecules:
+            continue
+        atoms = molecule["atoms"]
+        masses = {nr: mass for nr, (_, mass) in atoms.items()}
+        for a, b in molecule["bonds"]:
+            for h, heavy in [(a, b), (b, a)]:
+                if h in atoms and heavy in atoms and _is_hydrogen(atoms[h][1]) and not _is_hydrogen(atoms[heavy][1]):
+                    masses[heavy] -= hydrogen_mass - atoms[h][1]
+                    masses[h] = hydrogen_mass
+        for nr, mass in masses.items():
+            if mass != atoms[nr][1]:
+                if mass < hydrogen_mass:
+                    raise ValueError(
+                        f"The mass of atom {nr} in {molecule['name']} becomes {mass:.3f} by hydrogen mass repartitioning"
+                    )
+                new_masses[atoms[nr][0]] = mass
+
+    for i, mass in new_masses.items():
+        lines[i] = _replace_field(lines[i], _fields(lines[i])[7], f"{mass:.6f}")
+
+    return "\n".join(lines)
@@ -1,11 +1,14 @@
 #!/usr/bin/python3
 
-from typing import List
+import os
+from typing import List, Literal, Union
 
 import numpy as np
 from gridData import Grid
 
+from script.utilities import const
 from script.utilities.logger import logger
+from script.utilities.sparse_grid import SparseGrid, sparse_max, sparse_mean
 
 VERSION = "1.0.0"
 
@@ -33,33 +36,90 @@ def _check(gs: List[Grid]) -> None:
             raise ValueError("Grids have different deltas")
 
 
-def grid_max(gs: List[Grid]) -> Grid:
+def _to_sparse(gs: List[Union[Grid, SparseGrid]]) -> List[SparseGrid]:
+    return [g if isinstance(g, SparseGrid) else SparseGrid.from_grid(g) for g in gs]
+
+
+def grid_max(gs: List[Union[Grid, SparseGrid]]) -> Union[Grid, SparseGrid]:
     """複数のグリッドデータから各点の最大値を計算する
     
     Args:
-        gs: Gridオブジェクトのリスト
+        gs: Gridオブジェクト（またはSparseGridオブジェクト）のリスト
         
     Returns:
         Grid: 最大値を持つ新しいGridオブジェクト
+              SparseGridが含まれる場合はSparseGridオブジェクト
         
     Raises:
         ValueError: グリッドリストが空の場合、またはグリッドのサイズやポジションが異なる場合
     """
     if not gs:
         raise ValueError("Empty grid list")
-        
+    if any(isinstance(g, SparseGrid) for g in gs):
+        return sparse_max(_to_sparse(gs))
+
     _check(gs)
     ret = gs[0]
     ret.grid = np.max([g.grid for g in gs], axis=0)
     return ret
 
 
-def gen_max_pmap(inpaths: List[str], outpath: str) -> str:
-    """複数のpmapファイルから最大値のpmapファイルを生成する
+def grid_mean(gs: List[Union[Grid, SparseGrid]]) -> Union[Grid, SparseGrid]:
+    """複数のグリッドデータから各点の平均値を計算する
+
+    Args:
+        gs: Gridオブジェクト（またはSparseGridオブジェクト）のリスト
+
+    Returns:
+        Grid: 平均値を持つ新しいGridオブジェクト
+              SparseGridが含まれる場合はSparseGridオブジェクト
+
+    Raises:
+        ValueError: グリッドリストが空の場合、またはグリッドのサイズやポジションが異なる場合
+    """
+    if not gs:
+        raise ValueError("Empty grid list")
+    if any(isinstance(g, SparseGrid) for g in gs):
+        return sparse_mean(_to_sparse(gs))
+
+    _check(gs)
+    ret = gs[0]
+    ret.grid = np.mean([g.grid for g in gs], axis=0)
+    return ret
+
+
+def grid_aggregate(gs: List[Union[Grid, SparseGrid]], aggregation: Literal["max", "mean"] = "max") -> Union[Grid, SparseGrid]:
+    """複数のグリッドデータを集約する（aggregation: max または mean）"""
+    if aggregation == "max":
+        return grid_max(gs)
+    elif aggregation == "mean":
+        return grid_mean(gs)
+    raise ValueError(f"Invalid aggregation method: {aggregation}")
+
+
+def load_pmap(path: str) -> Union[Grid, SparseGrid]:
+    """pmapファイルを読み込む（npz形式はSparseGrid、それ以外はGrid）"""
+    if os.path.splitext(str(path))[1] == const.EXT_NPZ:
+        return SparseGrid.load(path)
+    return Grid(str(path))
+
+
+def save_pmap(g: Union[Grid, SparseGrid], outpath: str) -> str:
+    """pmapファイルを書き出す（拡張子がnpzの場合は疎な形式、それ以外は密なdx形式）"""
+    if os.path.splitext(str(outpath))[1] == const.EXT_NPZ:
+        (g if isinstance(g, SparseGrid) else SparseGrid.from_grid(g)).save(outpath)
+    else:
+        g.export(outpath, type="double")
+    return outpath
+
+
+def gen_aggregated_pmap(inpaths: List[str], outpath: str, aggregation: Literal["max", "mean"] = "max") -> str:
+    """複数のpmapファイルを集約したpmapファイルを生成する
     
     Args:
-        inpaths: 入力pmapファイル（dx形式）のパスのリスト
-        outpath: 出力pmapファイル（dx形式）のパス
+        inpaths: 入力pmapファイル（dx形式またはnpz形式）のパスのリスト
+        outpath: 出力pmapファイル（dx形式またはnpz形式）のパス
+        aggregation: 集約方法（max または mean）
         
     Returns:
         str: 出力ファイルのパス
@@ -69,8 +129,22 @@ def gen_max_pmap(inpaths: List[str], outpath: str) -> str:
     """
     if not inpaths:
         raise ValueError("No input files provided")
+
+    gs = [load_pmap(n) for n in inpaths]
+    return save_pmap(grid_aggregate(gs, aggregation), outpath)
+
+
+def gen_max_pmap(inpaths: List[str], outpath: str) -> str:
+    """複数のpmapファイルから最大値のpmapファイルを生成する
+    
+    Args:
+        inpaths: 入力pmapファイル（dx形式またはnpz形式）のパスのリスト
+        outpath: 出力pmapファイル（dx形式またはnpz形式）のパス
         
-    gs = [Grid(n) for n in inpaths]
-    max_pmap = grid_max(gs)
-    max_pmap.export(outpath, type="double")
-    return outpath
+    Returns:
+        str: 出力ファイルのパス
+        
+    Raises:
+        ValueError: 入力ファイルリストが空の場合、またはグリッドのサイズやポジションが異なる場合
+    """
+    return gen_aggregated_pmap(inpaths, outpath, aggregation="max")
@@ -1,16 +1,36 @@
 #! /usr/bin/python3
 
 
+import fnmatch
+import json
 import os
+import re
+import signal
+import subprocess
+import threading
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Optional, Set, Tuple
 
 import jinja2
 
+from .utilities import const
 from .utilities.logger import logger
 
 VERSION = "1.0.0"
 
+RUN_STATE_FILE = "run_state.json"
+
+# mdrun.sh processes running in this process (signals are forwarded to their process groups)
+_running: Set[subprocess.Popen] = set()
+_preempted = threading.Event()
+_received_signal: Optional[str] = None
+
+# maximum time steps [ps] of dynamics
+MAX_DT_HBONDS = 0.0025  # bonds with hydrogen atoms are constrained
+MAX_DT_HMR = 0.004  # hydrogen mass repartitioning (see hmr2top)
+
 def gen_mdp(protocol_dict: dict, MD_DIR: Path):
     env = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.dirname(__file__)))
     if not protocol_dict['type'] in ["minimization", "heating", "equilibration", "production"]:
@@ -24,8 +44,57 @@ def gen_mdp(protocol_dict: dict, MD_DIR: Path):
             protocol_dict["initial_temp"] = 0
         protocol_dict["duration"] = protocol_dict["nsteps"] * protocol_dict["dt"]
 
+    if protocol_dict.get("strip_water"):
+        protocol_dict["output_group"] = const.OUTPUT_GROUP
+
+    mdp_string = template.render(protocol_dict)
+    if protocol_dict["type"] != "minimization":
+        check_time_step(mdp_string, protocol_dict.get("hmr", False))
+
     with open(MD_DIR / f"{protocol_dict['name']}.mdp", "w") as fout:
-        fout.write(template.render(protocol_dict))
+        fout.write(mdp_string)
+
+
+def check_time_step(mdp_string: str, hmr: bool) -> None:
+    """
+    raise ValueError if the time step (dt) is too large for the constraints and hydrogen masses
+    (hydrogen atoms move too fast for dt > 2 fs unless they are constrained, and for dt > 2.5 fs unless they are heavy)
+    """
+    params = {}
+    for line in mdp_string.splitlines():
+        content = line.split(";", 1)[0]
+        if "=" in content:
+            key, value = content.split("=", 1)
+            params[key.strip().replace("_", "-")] = value.strip()
+    if not params.get("dt"):
+        return
+    dt = float(params["dt"])
+    constraints = params.get("constraints", "none").lower()
+
+    if dt > 0.002 and constraints not in ["h-bonds", "hbonds", "all-bonds", "all-angles", "h-angles"]:
+        raise ValueError(f"dt = {dt} ps requires constraints of bonds with hydrogen atoms (constraints = {constraints})")
+    if dt > MAX_DT_HBONDS and not hmr:
+        raise ValueError(f"dt = {dt} ps requires hydrogen mass repartitioning (exprorer_msmd.general.hmr: true)")
+    if dt > MAX_DT_HMR:
+        raise ValueError(f"dt = {dt} ps is too large (maximum: {MAX_DT_HMR} ps)")
+
+
+def gen_output_group(gro: Path, ndx: Path, name: str = const.OUTPUT_GROUP) -> int:
+    """
+    append an index group of non-water and non-ion atoms (protein, probes and virtual atoms) to a gromacs index file
+    output:
+        the number of atoms in the group
+    """
+    from .utilities.gromacs import Gro  # numpy and scipy are loaded only when the group is needed
+
+    excluded = const.WATERS + const.IONS
+    atom_ids = [a.atom_id for a in Gro(gro).atoms if not any(fnmatch.fnmatchcase(a.resn, p) for p in excluded)]
+    with open(ndx, "a") as fout:
+        fout.write(f"[ {name} ]\n")
+        for i in range(0, len(atom_ids), 15):
+            fout.write(" ".join(f"{n:>4d}" for n in atom_ids[i : i + 15]) + "\n")
+    logger.debug(f"{name} group ({len(atom_ids)} atoms) is added to {ndx}")
+    return len(atom_ids)
 
 
 def gen_mdrun_job(
@@ -38,6 +107,7 @@ def gen_mdrun_job(
         "OUT_TRAJ": out_traj,
         "POST_COMMAND": post_comm,
         "STEP_NAMES": " ".join(step_names),
+        "REQUEUE_EXIT_CODE": const.REQUEUE_EXIT_CODE,
     }
 
     env = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.dirname(__file__)))
@@ -67,17 +137,215 @@ def prepare_md_files(
         gen_mdp(step, targetdir)
     gen_mdrun_job([d["name"] for d in sequence], jobname, targetdir / "mdrun.sh", top, gro, out_traj)
 
-def run_md_sequence(gpuid: int, simdirpath: Path, exe_gromacs: Path, ncpus: int, jobname: str) -> Path:
+
+def simulation_inputs(simdirpath: Path, step_names: List[str]) -> List[Path]:
+    """
+    files generated by prepare_md_files (and the index file), which determine the results of a simulation sequence
+    """
+    names = ["input.top", "input.gro", "index.ndx", "mdrun.sh"] + [f"{name}.mdp" for name in step_names]
+    return [simdirpath / name for name in names if (simdirpath / name).exists()]
+
+
+def reset_simulation(simdirpath: Path, step_names: List[str], out_traj: Optional[Path] = None) -> None:
+    """
+    discard the progress of a simulation sequence (finished steps and checkpoints),
+    so that mdrun.sh runs all steps again (e.g. the inputs are changed)
+    """
+    paths = [simdirpath / "finished_step_list", simdirpath / RUN_STATE_FILE]
+    for name in step_names:
+        paths += [simdirpath / f"{name}{ext}" for ext in [".cpt", ".tpr", ".gro", ".log"]]
+    if out_traj is not None:
+        paths.append(out_traj)
+    for path in paths:
+        if path.exists() or path.is_symlink():
+            path.unlink()
+    logger.info(f"the progress of {simdirpath} is discarded")
+
+
+def _terminate(proc: subprocess.Popen) -> None:
+    # mdrun writes a checkpoint and stops at the next neighbor search step on SIGTERM
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+def _forward_signal(signum, frame):
+    global _received_signal
+    _received_signal = signal.Signals(signum).name
+    _preempted.set()
+    for proc in list(_running):
+        _terminate(proc)
+
+
+def install_preemption_handler(signals=(signal.SIGTERM, signal.SIGUSR1)) -> None:
+    """
+    forward preemption signals (e.g. "#SBATCH --signal") to running simulations
+    (must be called from the main thread)
+    """
+    for signum in signals:
+        signal.signal(signum, _forward_signal)
+
+
+@contextmanager
+def preemption_handler(signals=(signal.SIGTERM, signal.SIGUSR1)) -> Iterator[None]:
+    """
+    install_preemption_handler during the simulation stage: the previous handlers are restored after the block,
+    so that the signals stop the other stages (e.g. gridding) instead of being swallowed
+    """
+    previous = {signum: signal.getsignal(signum) for signum in signals}
+    install_preemption_handler(signals)
+    try:
+        yield
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+def is_preempted() -> bool:
+    return _preempted.is_set()
+
+
+def write_run_state(simdirpath: Path, status: str, returncode: Optional[int] = None) -> Path:
+    """
+    record the progress of a simulation sequence
+    status: "finished", "failed" or "preempted" (resumed from checkpoints by the next run)
+    """
+    finished_info = simdirpath / "finished_step_list"
+    state = {
+        "status": status,
+        "returncode": returncode,
+        "signal": _received_signal if status == "preempted" else None,
+        "finished_steps": finished_info.read_text().split() if finished_info.exists() else [],
+        "updated": datetime.now().isoformat(timespec="seconds"),
+    }
+    path = simdirpath / RUN_STATE_FILE
+    path.write_text(json.dumps(state, indent=1))
+    return path
+
+
+def read_run_state(simdirpath: Path) -> Optional[str]:
+    """status written by write_run_state (None if not run yet)"""
+    path = simdirpath / RUN_STATE_FILE
+    return json.loads(path.read_text())["status"] if path.exists() else None
+
+
+def read_step_times(simdirpath: Path, step_names: List[str]) -> List[Tuple[str, datetime, datetime]]:
+    """
+    (step name, start, finish) of every mdrun run in the logs of a simulation sequence
+    (a step resumed from checkpoints has several runs in its log)
+    """
+    ret = []
+    for name in step_names:
+        log = simdirpath / f"{name}.log"
+        if not log.exists():
+            continue
+        start = None
+        for line in log.read_text(errors="replace").splitlines():
+            m = re.match(r"^(Started|Finished) mdrun on rank 0 (.+)$", line.strip())
+            if m is None:
+                continue
+            try:
+                stamp = datetime.strptime(m.group(2).strip(), "%a %b %d %H:%M:%S %Y")
+            except ValueError:
+                continue
+            if m.group(1) == "Started":
+                start = stamp
+            elif start is not None:
+                ret.append((name, start, stamp))
+                start = None
+    return ret
+
+
+def _run_script(cwd: Path, args: List[str], env: dict) -> int:
+    """run a job script in a new process group (preemption signals are forwarded to the group)"""
+    proc = subprocess.Popen(args, cwd=cwd, env=env, start_new_session=True)
+    _running.add(proc)
+    if _preempted.is_set():  # the signal arrived before the process was registered
+        _terminate(proc)
+    try:
+        return proc.wait()
+    finally:
+        _running.discard(proc)
+
+
+def _record_result(simdirpaths: List[Path], returncode: int, script: str) -> None:
+    for simdirpath in simdirpaths:
+        if is_preempted():
+            logger.warn(f"{simdirpath} is stopped by {_received_signal} and will be resumed from the checkpoint")
+            write_run_state(simdirpath, "preempted", returncode)
+        else:
+            write_run_state(simdirpath, "finished" if returncode == 0 else "failed", returncode)
+            if returncode != 0:
+                logger.error(f"{script} failed with exit status {returncode}: {simdirpath}")
+
+
+def run_md_sequence(
+    gpuid: int, simdirpath: Path, exe_gromacs: Path, ncpus: int, jobname: str, mdrun_options: str = ""
+) -> Path:
+    """
+    run a simulation sequence (mdrun.sh) in a new process group
+    If a preemption signal is received (see install_preemption_handler), mdrun is stopped with a checkpoint,
+    and the sequence is resumed from the checkpoint by the next run.
+    mdrun_options: options of all mdrun in the sequence (see tune_mdrun), "-nt {ncpus}" if empty
+    """
+    traj = simdirpath / f"{jobname}.xtc"
+    if is_preempted():
+        logger.warn(f"{simdirpath} is not started due to preemption")
+        write_run_state(simdirpath, "preempted")
+        return traj
+
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES=str(gpuid), GMX=str(exe_gromacs), MDRUN_OPTIONS=mdrun_options)
+    env.pop("OMP_NUM_THREADS", None)
+    returncode = _run_script(simdirpath, ["bash", "mdrun.sh", str(ncpus)], env)
+    _record_result([simdirpath], returncode, "mdrun.sh")
+
+    return traj
+
+
+def gen_mdrun_multidir_job(
+    step_names: List[str], simdirpaths: List[Path], path: Path, top: str, gro: str, out_traj: str
+) -> Path:
+    """
+    generate a shell script to run each step of replicas with "gmx mdrun -multidir"
+    input:
+        simdirpaths: simulation directories prepared by prepare_md_files (relative to the script)
+        top, gro, out_traj: file names in each simulation directory
+    """
+    data = {
+        "TOP": top,
+        "GRO": gro,
+        "OUT_TRAJ": out_traj,
+        "DIRS": " ".join(str(d) for d in simdirpaths),
+        "STEP_NAMES": " ".join(step_names),
+        "REQUEUE_EXIT_CODE": const.REQUEUE_EXIT_CODE,
+    }
+
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.dirname(__file__)))
+    template = env.get_template("./template/mdrun_multidir.sh")
+    with open(path, "w") as fout:
+        fout.write(template.render(data))
+    logger.debug(f"generate {path}")
+    return path
+
+
+def run_md_multidir(
+    gpuid: int, jobpath: Path, simdirpaths: List[Path], exe_gromacs: Path, exe_mpirun: Path, ncpus: int, jobname: str
+) -> List[Path]:
     """
-    run a simulation sequence with os.system
+    run a simulation sequence of replicas in one "gmx mdrun -multidir" invocation per step
+    (replicas share a process and a GPU context)
     """
+    trajs = [simdirpath / f"{jobname}.xtc" for simdirpath in simdirpaths]
+    if is_preempted():
+        logger.warn(f"{jobpath} is not started due to preemption")
+        for simdirpath in simdirpaths:
+            write_run_state(simdirpath, "preempted")
+        return trajs
 
-    # execute simulation
-    os.system(f"""
-    unset OMP_NUM_THREADS ; \
-    export CUDA_VISIBLE_DEVICES="{gpuid}" ; \
-    cd {simdirpath} && \
-    GMX={exe_gromacs} bash mdrun.sh {ncpus}
-    """)
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES=str(gpuid), GMX=str(exe_gromacs), MPIRUN=str(exe_mpirun))
+    env.pop("OMP_NUM_THREADS", None)
+    returncode = _run_script(jobpath.parent, ["bash", jobpath.name, str(ncpus)], env)
+    _record_result(simdirpaths, returncode, jobpath.name)
 
-    return simdirpath / f"{jobname}.xtc"
\ No newline at end of file
+    return trajs
@@ -0,0 +1,212 @@
+"""
+Performance report of the simulations of a job from the mdrun logs (system*/simulation/{step}.log)
+
+python -m script.performance_report setting.yaml
+"""
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .setting import parse_yaml
+from .utilities import util
+from .utilities.gmx_log import parse_log
+from .utilities.logger import logger
+
+VERSION = "1.0.0"
+
+# runs slower than SLOW_RATIO x the median of the step are reported (e.g. slow nodes or GPUs)
+SLOW_RATIO = 0.8
+
+
+def collect_runs(workdir: Path, indices: List[int], step_names: List[str]) -> List[dict]:
+    """
+    mdrun runs of the systems (a step resumed from checkpoints has several runs)
+    output:
+        [{"system", "step", "run", ...counters of gmx_log.parse_log}]
+    """
+    ret = []
+    for index in indices:
+        simdirpath = Path(workdir) / f"system{index}" / "simulation"
+        for step in step_names:
+            log = simdirpath / f"{step}.log"
+            if not log.exists():
+                continue
+            for k, run in enumerate(parse_log(log)):
+                ret.append({"system": index, "step": step, "run": k, **run})
+    return ret
+
+
+def _mean(values: list) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return statistics.fmean(values) if values else None
+
+
+def _aggregate(runs: List[dict]) -> dict:
+    """
+    ns/day weighted by the wall time (= simulated ns / days), and the means of the load counters
+    """
+    timed = [run for run in runs if run.get("ns_per_day") is not None and run.get("wall_time_s")]
+    wall = sum(run["wall_time_s"] for run in timed)
+    rates = [run["ns_per_day"] for run in timed]
+    return {
+        "runs": len(runs),
+        "wall_time_s": wall,
+        "ns_per_day": sum(run["ns_per_day"] * run["wall_time_s"] for run in timed) / wall if wall else None,
+        "ns_per_day_min": min(rates) if rates else None,
+        "ns_per_day_max": max(rates) if rates else None,
+        "pme_mesh_force_load": _mean([run.get("pme_mesh_force_load") for run in runs]),
+        "pme_imbalance_percent": _mean([run.get("pme_imbalance_percent") for run in runs]),
+        "gpu_wait_percent": _mean([run.get("gpu_wait_percent") for run in runs]),
+        "gpu_cpu_force_ratio": _mean([run.get("gpu_cpu_force_ratio") for run in runs]),
+    }
+
+
+def _cycles(runs: List[dict]) -> Dict[str, dict]:
+    """cycle accounting rows summed over the runs ({row: {"wall_s", "percent"}})"""
+    walls: Dict[str, float] = {}
+    for run in runs:
+        for name, row in (run.get("cycles") or {}).items():
+            walls[name] = walls.get(name, 0.0) + row["wall_s"]
+    total = walls.get("Total", 0.0)
+    return {name: {"wall_s": wall, "percent": 100 * wall / total if total else None} for name, wall in walls.items()}
+
+
+def find_slow_runs(runs: List[dict], ratio: float = SLOW_RATIO) -> List[dict]:
+    """
+    runs slower than ratio x the median ns/day of the same step
+    """
+    ret = []
+    for step in dict.fromkeys(run["step"] for run in runs):
+        timed = [run for run in runs if run["step"] == step and run.get("ns_per_day") is not None]
+        if len(timed) < 2:
+            continue
+        median = statistics.median(run["ns_per_day"] for run in timed)
+        for run in timed:
+            if run["ns_per_day"] < ratio * median:
+                ret.append(
+                    {
+                        "system": run["system"],
+                        "step": step,
+                        "run": run["run"],
+                        "host": run.get("host"),
+                        "gpu": run.get("gpu"),
+                        "ns_per_day": run["ns_per_day"],
+                        "median_ns_per_day": median,
+                    }
+                )
+    return ret
+
+
+def build_report(runs: List[dict], step_names: List[str], ratio: float = SLOW_RATIO) -> dict:
+    """
+    output:
+        {"steps": {step: aggregate}, "cycles": {step: {row: {"wall_s", "percent"}}},
+         "hosts": {host: {step: aggregate}}, "versions": {"GROMACS x / CUDA y": {step: aggregate}},
+         "slow": [run], "runs": [run without the cycle table]}
+    """
+
+    def by_step(group: List[dict]) -> dict:
+        return {step: _aggregate(sel) for step in step_names if (sel := [run for run in group if run["step"] == step])}
+
+    def group_by(key) -> Dict[str, List[dict]]:
+        groups: Dict[str, List[dict]] = {}
+        for run in runs:
+            groups.setdefault(key(run), []).append(run)
+        return groups
+
+    hosts = group_by(lambda run: str(run.get("host")))
+    versions = group_by(lambda run: f"GROMACS {run.get('gromacs_version')} / CUDA {run.get('cuda_driver')}")
+    return {
+        "steps": by_step(runs),
+        "cycles": {step: _cycles([run for run in runs if run["step"] == step]) for step in by_step(runs)},
+        "hosts": {host: by_step(group) for host, group in sorted(hosts.items())},
+        "versions": {version: by_step(group) for version, group in sorted(versions.items())},
+        "slow": find_slow_runs(runs, ratio),
+        "runs": [{key: value for key, value in run.items() if key != "cycles"} for run in runs],
+    }
+
+
+def _fmt(value: Optional[float], spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def format_report(report: dict) -> str:
+    header = f"{'':24s} {'runs':>5s} {'wall [s]':>10s} {'ns/day':>9s} {'min':>9s} {'max':>9s} {'PME load':>9s} "
+    header += f"{'GPU wait%':>9s}"
+
+    def table(title: str, aggregates: Dict[str, dict]) -> List[str]:
+        lines = [f"{title:24s}" + header[24:]]
+        for name, agg in aggregates.items():
+            lines.append(
+                f"{name[:24]:24s} {agg['runs']:5d} {agg['wall_time_s']:10.1f} {_fmt(agg['ns_per_day'], '9.2f')} "
+                f"{_fmt(agg['ns_per_day_min'], '9.2f')} {_fmt(agg['ns_per_day_max'], '9.2f')} "
+                f"{_fmt(agg['pme_mesh_force_load'], '9.3f')} {_fmt(agg['gpu_wait_percent'], '9.1f')}"
+            )
+        return lines
+
+    lines = table("step", report["steps"])
+    for title, groups in [("host", report["hosts"]), ("version", report["versions"])]:
+        for name, steps in groups.items():
+            lines += ["", f"{title}: {name}"] + table("step", steps)
+    for step, rows in report["cycles"].items():
+        lines += ["", f"cycle accounting: {step}"]
+        lines += [
+            f"  {name[:30]:30s} {row['wall_s']:10.1f} s {_fmt(row['percent'], '6.1f')} %" for name, row in rows.items()
+        ]
+    if report["slow"]:
+        lines += ["", f"runs slower than {report.get('slow_ratio', SLOW_RATIO)} x the median of the step:"]
+        lines += [
+            f"  system{s['system']} {s['step']} (run {s['run']}) on {s['host']}: "
+            f"{s['ns_per_day']:.2f} ns/day (median {s['median_ns_per_day']:.2f})"
+            for s in report["slow"]
+        ]
+    return "\n".join(lines)
+
+
+def write_performance_report(setting: dict, indices: List[int], step_names: List[str]) -> Optional[Path]:
+    """
+    write {workdir}/{JOB_NAME}_performance.json and the tables to {workdir}/{JOB_NAME}_performance.txt
+    output:
+        path of the json file (None if no log is found)
+    """
+    workdir = Path(setting["general"]["workdir"])
+    runs = collect_runs(workdir, indices, step_names)
+    if not runs:
+        logger.warn(f"performance report: no mdrun log is found in {workdir}/system*/simulation")
+        return None
+    report = {
+        "name": setting["general"]["name"],
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "slow_ratio": SLOW_RATIO,
+        **build_report(runs, step_names),
+    }
+    path = workdir / f"{setting['general']['name']}_performance.json"
+    path.write_text(json.dumps(report, indent=2))
+    text = format_report(report)
+    path.with_suffix(".txt").write_text(text + "\n")
+    logger.info(f"performance report: {path}\n{text}")
+    for slow in report["slow"]:
+        logger.warn(
+            f"system{slow['system']} {slow['step']} on {slow['host']} is slow: "
+            f"{slow['ns_per_day']:.2f} ns/day (median {slow['median_ns_per_day']:.2f})"
+        )
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance report of the MSMD simulations from the mdrun logs")
+    parser.add_argument("setting_yaml")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logger.setLevel("info" if args.verbose else "warn")
+
+    setting = parse_yaml(Path(args.setting_yaml))
+    indices = util.expand_index(setting["general"]["iter_index"])
+    step_names = [step["name"] for step in setting["exprorer_msmd"]["sequence"]]
+    path = write_performance_report(setting, indices, step_names)
+    if path is not None:
+        print(path.with_suffix(".txt").read_text(), end="")
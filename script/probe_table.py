@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+
+import gridData
+import numpy as np
+import numpy.typing as npt
+
+from script.genpmap import convert_count_grid, mask_generator
+from script.utilities.Bio import PDB as uPDB
+from script.utilities.cpptraj_mask import evaluate_mask
+from script.utilities.logger import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+VERSION = "1.0.0"
+
+META_FILE = "meta.json"
+
+
+def _box_volume(a: float, b: float, c: float, alpha: float, beta: float, gamma: float) -> float:
+    cos_a, cos_b, cos_g = np.cos(np.radians([alpha, beta, gamma]))
+    return float(a * b * c * np.sqrt(1 - cos_a**2 - cos_b**2 - cos_g**2 + 2 * cos_a * cos_b * cos_g))
+
+
+def _iter_frames(pdb: Path, resn: str) -> Iterator[Tuple[List[str], List[int], List[List[float]], Optional[float]]]:
+    """
+    iterate probe atoms of each model in a multi-model pdb file
+    output (per frame):
+        atom names, residue numbers, coordinates, box volume (None if CRYST1 is missing)
+    """
+    names: List[str] = []
+    resids: List[int] = []
+    coords: List[List[float]] = []
+    volume: Optional[float] = None
+    has_atoms = False
+    with open(pdb) as fin:
+        for line in fin:
+            record = line[:6]
+            if record in ("ATOM  ", "HETATM"):
+                has_atoms = True
+                if line[17:21].strip() == resn:
+                    names.append(line[12:16].strip())
+                    resids.append(int(line[22:26]))
+                    coords.append([float(line[30:38]), float(line[38:46]), float(line[46:54])])
+            elif record == "CRYST1":
+                volume = _box_volume(*[float(x) for x in line[6:54].split()])
+            elif record.startswith("ENDMDL") or (record.rstrip() == "END" and has_atoms):
+                yield names, resids, coords, volume
+                names, resids, coords, volume = [], [], [], None
+                has_atoms = False
+    if has_atoms:
+        yield names, resids, coords, volume
+
+
+class ProbeTableWriter(object):
+    """
+    Write a columnar table of probe atom coordinates in compressed shards.
+    Columns: frame (int32), resid (int32), atom (index of atom names, uint16), xyz (float32)
+    Shards are Parquet files if pyarrow is installed, otherwise compressed npz files.
+    """
+
+    def __init__(self, outdir: Path, resn: str, frames_per_shard: int = 1000, fmt: Optional[str] = None):
+        self.outdir = Path(outdir)
+        self.resn = resn
+        self.frames_per_shard = frames_per_shard
+        self.fmt = fmt if fmt is not None else ("parquet" if pq is not None else "npz")
+        if self.fmt == "parquet" and pq is None:
+            raise ImportError("pyarrow is required to write Parquet shards")
+        self.atom_names: List[str] = []
+        self._atom_indices: Dict[str, int] = {}
+        self.shards: List[str] = []
+        self.volumes: List[float] = []
+        self.n_frames = 0
+        self._buffer: Dict[str, list] = {"frame": [], "resid": [], "atom": [], "xyz": []}
+
+    def _atom_index(self, name: str) -> int:
+        if name not in self._atom_indices:
+            self._atom_indices[name] = len(self.atom_names)
+            self.atom_names.append(name)
+        return self._atom_indices[name]
+
+    def add_frame(self, names: List[str], resids: List[int], coords: List[List[float]], volume: Optional[float]):
+        n = len(names)
+        self._buffer["frame"].append(np.full(n, self.n_frames, dtype=np.int32))
+        self._buffer["resid"].append(np.array(resids, dtype=np.int32))
+        self._buffer["atom"].append(np.array([self._atom_index(name) for name in names], dtype=np.uint16))
+        self._buffer["xyz"].append(np.array(coords, dtype=np.float32).reshape(n, 3))
+        self.volumes.append(np.nan if volume is None else volume)
+        self.n_frames += 1
+        if self.n_frames % self.frames_per_shard == 0:
+            self.flush()
+
+    def flush(self):
+        if len(self._buffer["frame"]) == 0:
+            return
+        columns = {key: np.concatenate(value) for key, value in self._buffer.items()}
+        name = f"shard_{len(self.shards):05d}.{self.fmt}"
+        if self.fmt == "parquet":
+            table = pa.table(
+                {
+                    "frame": columns["frame"],
+                    "resid": columns["resid"],
+                    "atom": columns["atom"],
+                    "x": columns["xyz"][:, 0],
+                    "y": columns["xyz"][:, 1],
+                    "z": columns["xyz"][:, 2],
+                }
+            )
+            pq.write_table(table, self.outdir / name, compression="zstd")
+        else:
+            np.savez_compressed(self.outdir / name, **columns)
+        self.shards.append(name)
+        self._buffer = {key: [] for key in self._buffer}
+
+    def close(self):
+        self.flush()
+        meta = {
+            "version": VERSION,
+            "resn": self.resn,
+            "format": self.fmt,
+            "n_frames": self.n_frames,
+            "atom_names": self.atom_names,
+            "volumes": [None if np.isnan(v) else v for v in self.volumes],
+            "shards": self.shards,
+        }
+        with open(self.outdir / META_FILE, "w") as fout:
+            json.dump(meta, fout)
+
+
+def extract_probe_table(pdb: Path, resn: str, outdir: Path, frames_per_shard: int = 1000) -> Path:
+    """
+    Extract probe atom coordinates from a (fitted, water-stripped) multi-model pdb trajectory,
+    e.g. {JOB_NAME}_woWAT_10ps.pdb written by cpptraj.
+    """
+    outdir = Path(outdir)
+    if outdir.exists():
+        shutil.rmtree(outdir)
+    outdir.mkdir(parents=True)
+    writer = ProbeTableWriter(outdir, resn, frames_per_shard)
+    for frame in _iter_frames(pdb, resn):
+        writer.add_frame(*frame)
+    writer.close()
+    logger.info(f"probe table: {writer.n_frames} frames, {len(writer.shards)} shards ({writer.fmt}) in {outdir}")
+    return outdir
+
+
+class ProbeTable(object):
+    """Reader of a probe-position table written by ProbeTableWriter"""
+
+    def __init__(self, tabledir: Path):
+        self.tabledir = Path(tabledir)
+        with open(self.tabledir / META_FILE) as fin:
+            self.meta = json.load(fin)
+        self.atom_names = np.array(self.meta["atom_names"], dtype=str)
+
+    @property
+    def n_frames(self) -> int:
+        return self.meta["n_frames"]
+
+    @property
+    def last_volume(self) -> Optional[float]:
+        volumes = [v for v in self.meta["volumes"] if v is not None]
+        return volumes[-1] if volumes else None
+
+    def iter_shards(self) -> Iterator[Dict[str, npt.NDArray]]:
+        for name in self.meta["shards"]:
+            path = self.tabledir / name
+            if name.endswith(".parquet"):
+                if pq is None:
+                    raise ImportError("pyarrow is required to read Parquet shards")
+                table = pq.read_table(path)
+                yield {
+                    "frame": table["frame"].to_numpy(),
+                    "resid": table["resid"].to_numpy(),
+                    "atom": table["atom"].to_numpy(),
+                    "xyz": np.stack([table[c].to_numpy() for c in "xyz"], axis=1),
+                }
+            else:
+                with np.load(path) as data:
+                    yield {key: data[key] for key in data.files}
+
+    def select(self, shard: Dict[str, npt.NDArray], selector: str) -> npt.NDArray[np.bool_]:
+        """evaluate "{resn}&{selector}" as the grid command of cpptraj_pmap.in"""
+        names = self.atom_names[shard["atom"]] if len(shard["atom"]) else np.array([], dtype=str)
+        resnames = np.full(len(names), self.meta["resn"])
+        return evaluate_mask(f":{self.meta['resn']}&{selector}", resnames, names, shard["resid"])
+
+    def count_grid(self, selector: str, box_center: npt.ArrayLike, box_size: float, interval: float) -> gridData.Grid:
+        """
+        count selected probe atoms in each voxel over all frames
+        (the same grid definition as "grid ... nx interval ... gridcenter" of cpptraj, see cpptraj.grid_voxel)
+        """
+        n = int(round(box_size / interval))
+        lower = np.asarray(box_center, dtype=np.float64) - n * interval / 2
+        edges = [lower[i] + np.arange(n + 1) * interval for i in range(3)]
+        counts = np.zeros((n, n, n), dtype=np.float64)
+        for shard in self.iter_shards():
+            sele = self.select(shard, selector)
+            counts += np.histogramdd(shard["xyz"][sele], bins=edges)[0]
+        return gridData.Grid(counts, origin=lower + interval / 2, delta=np.full(3, interval))
+
+    def num_probe_atoms(self, selector: str) -> int:
+        """the number of selected probe atoms in a frame"""
+        for shard in self.iter_shards():
+            return int(np.count_nonzero(self.select(shard, selector) & (shard["frame"] == shard["frame"][0])))
+        return 0
+
+
+def regrid(
+    dirpath: Path,
+    setting_general: dict,
+    setting_input: dict,
+    setting_pmap: dict,
+    tabledir: Path,
+) -> List[str]:
+    """
+    Rebuild PMAPs from a probe-position table without reading the trajectory again.
+    Outputs are the same as gen_pmap.
+    """
+    name: str = setting_general["name"]
+    table = ProbeTable(tabledir)
+    ref_struct = Path(setting_input["protein"]["pdb"])
+    ref_struct_obj = uPDB.get_structure(ref_struct)
+    box_center = uPDB.get_attr(ref_struct_obj, "coord").mean(axis=0)
+    normalization: Literal["total", "snapshot", "GFE"] = setting_pmap["normalization"]
+
+    if normalization == "GFE":
+        if table.last_volume is None:
+            raise ValueError("GFE normalization requires box information (CRYST1) in the probe table")
+        protein_volume = uPDB.estimate_exclute_volume(ref_struct_obj)
+
+    mask = None  # all maps share the same grid geometry
+    pmap_paths = []
+    for map in setting_pmap["maps"]:
+        interval = setting_pmap.get("interval", 1.0)
+        grid = table.count_grid(map["selector"], box_center, setting_pmap["map_size"], interval)
+        grid_path = Path(dirpath) / f"{name}_{map['suffix']}.dx"
+        grid.export(str(grid_path), type="double")
+        if mask is None:
+            mask = mask_generator(ref_struct, grid, setting_pmap["valid_dist"]).grid
+        mean_proba = None
+        if normalization == "GFE":
+            mean_proba = table.num_probe_atoms(map["selector"]) / (table.last_volume - protein_volume)
+        paths = convert_count_grid(
+            grid,
+            grid_path,
+            mask,
+            frames=table.n_frames,
+            normalize=normalization if normalization != "GFE" else "snapshot",
+            mean_proba=mean_proba,
+            temperature=300,  # TODO: read temperature from setting
+            map_format=setting_pmap.get("format", "dx"),
+        )
+        pmap_paths.append(paths["GFE"] if normalization == "GFE" else paths["PMAP"])
+    return pmap_paths
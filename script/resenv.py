@@ -9,6 +9,7 @@ from scipy.spatial import distance
 from tqdm import tqdm
 
 from script.utilities.Bio import PDB as uPDB
+from script.utilities.sparse_grid import SparseGrid
 
 VERSION = "0.3.0"
 DESCRIPTION = """
@@ -19,7 +20,11 @@ Output: residue environments
 
 
 def compute_SR_probe_resis(
-    model: Union[Structure, Model], dx: gridData.Grid, resn: str, threshold: float, lt: bool = False
+    model: Union[Structure, Model],
+    dx: Union[gridData.Grid, SparseGrid],
+    resn: str,
+    threshold: float,
+    lt: bool = False,
 ):
     """
     This function enumerates the residue numbers `resis` of probe molecules
@@ -29,7 +34,7 @@ def compute_SR_probe_resis(
         model: Union[Structure, Model]
             A snapshot of a molecular dynamics simulation
             containing probe molecules
-        dx: gridData.Grid,
+        dx: Union[gridData.Grid, SparseGrid],
             A grid data containing values of a property of interest
         resn: str,
             A residue name of probe molecules
@@ -43,8 +48,11 @@ def compute_SR_probe_resis(
     """
     resis = uPDB.get_attr(model, "resid", sele=lambda a: uPDB.get_resname(a) == resn and not uPDB.is_hydrogen(a))
     coords = uPDB.get_attr(model, "coord", sele=lambda a: uPDB.get_resname(a) == resn and not uPDB.is_hydrogen(a))
-    interp = RegularGridInterpolator(dx.midpoints, dx.grid, method="nearest", fill_value=-1, bounds_error=False)
-    values = interp(np.array(coords))
+    if isinstance(dx, SparseGrid):
+        values = dx.lookup(np.array(coords), fill_value=-1)
+    else:
+        interp = RegularGridInterpolator(dx.midpoints, dx.grid, method="nearest", fill_value=-1, bounds_error=False)
+        values = interp(np.array(coords))
 
     if lt:
         resis = np.array(resis)[values < threshold]
@@ -68,7 +76,7 @@ def __get_surrounded_resis_around_a_residue(
 
 def __wrapper(
     model_wo_water: Union[Structure, Model],
-    dx: gridData.Grid,
+    dx: Union[gridData.Grid, SparseGrid],
     focused_resname: str,
     res_atomnames: List[str] = [" CB "],
     threshold: float = 0.2,
@@ -102,7 +110,7 @@ def __wrapper(
 
 
 def resenv(
-    grid: gridData.Grid,
+    grid: Union[gridData.Grid, SparseGrid],
     trajectory: uPDB.MultiModelPDBReader,
     resn: str,
     res_atomnames: List[str],
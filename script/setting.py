@@ -22,6 +22,13 @@ def parse_yaml(yamlpath: Path) -> dict:
             "workdir": Path(""),
             "multiprocessing": -1,
             "num_process_per_gpu": 1,
+            "multidir": 1,
+            "mdrun_tuning": False,
+            "tuning_cache": None,
+            "scratch": None,
+            "scratch_discard": [],
+            "scratch_sync_interval": 300,
+            "trace": True,
         },
         "input": {
             "protein": {
@@ -29,21 +36,30 @@ def parse_yaml(yamlpath: Path) -> dict:
             },
             "probe": {
                 "cid": "",
+                "placement": "packmol",
             },
+            "box_shape": "cubic",
         },
         "exprorer_msmd": {
             "general": {
                 "dt": 0.002,
                 "temperature": 300,
                 "pressure": 1.0,
+                "strip_water": False,
+                "hmr": False,
+                "hydrogen_mass": 3.024,
             },
         },
         "map": {
             "snapshot": "",
             "valid_dist": 5.0,
             "map_size": 80,
+            "interval": 1.0,
             "normalization": "total",
             "aggregation": "max",
+            "format": "dx",
+            "probe_table": False,
+            "window": None,
             "maps": [
                 {
                     "suffix": "nVH",
@@ -9,11 +9,38 @@ now={{ GRO | replace(".gro", "") }}
 if [ A$GMX = "A" ];then
     GMX=gmx
 fi
+# options tuned by tune_mdrun (e.g. "-ntmpi 1 -ntomp 8 -nb gpu -pme gpu")
+mdrun_options=${MDRUN_OPTIONS:-"-nt $ncpus"}
 
 
 finished_info=finished_step_list
 touch $finished_info
 
+# a step is finished when its run reached nsteps: "Finished mdrun" and the -c structure are also written
+# when mdrun is stopped by a signal or -maxh, so dynamics are checked by the step of the checkpoint,
+# and minimizations (without checkpoints) by the log of the last run
+finished_step () {
+    [ -f $1.gro ] && [ -f $1.log ] || return 1
+    if [ -f $1.cpt ] ;then
+        nsteps=`awk -F '[=;]' '$1 ~ /^ *nsteps *$/ {n = $2} END {print n + 0}' $1.mdp`
+        step=`$GMX dump -cp $1.cpt 2> /dev/null | awk '$1 == "step" && $2 == "=" {print $3; exit}'`
+        [ A$step != "A" ] && [ $step -ge $nsteps ]
+    else
+        awk '/Log file opened/ {s = 0; f = 0} /Received the .* signal/ {s = 1} /Finished mdrun/ {f = 1}
+             END {exit !(f && !s)}' $1.log
+    fi
+}
+
+# wall and core time of the runs in a log
+compute_time () {
+    awk '$1 == "Time:" {core += $2; wall += $3} END {printf "%.0f s (%.0f core s)", wall, core}' $1
+}
+
+# the runner forwards preemption signals to the whole process group:
+# mdrun writes a checkpoint and stops, and the next step is not started
+interrupted=""
+trap 'interrupted=1' TERM USR1
+
 for stepname in {{ STEP_NAMES }}
 do
     prev=$now
@@ -22,24 +49,64 @@ do
     if [ `grep -x ${now} $finished_info | wc -l` = 1 ] ;then
        continue
     fi
-    
-    rm -f ${now}.out.mdp ${now}.tpr ${now}.log ${now}.gro ${now}.trr ${now}.edr ${now}.cpt
-    echo $GMX grompp -maxwarn 1 -f ${now}.mdp -o ${now}.tpr \
-      -c ${prev}.gro -p ${top} \
-      -r ${prev}.gro -n index.ndx
-    echo $GMX mdrun -nt $ncpus -v -s ${now}.tpr \
-      -cpo ${now}.cpt -x ${now}.xtc -c ${now}.gro -e ${now}.edr -g ${now}.log
-
-    $GMX grompp -maxwarn 1 -f ${now}.mdp -o ${now}.tpr \
-      -c ${prev}.gro -p ${top} \
-      -r ${prev}.gro -n index.ndx
-    $GMX mdrun -nt $ncpus -v -s ${now}.tpr \
-      -cpo ${now}.cpt -x ${now}.xtc -c ${now}.gro -e ${now}.edr -g ${now}.log \
-      || exit
+    if [ A$interrupted != "A" ] ;then
+       exit {{ REQUEUE_EXIT_CODE }}
+    fi
+    # completion is verified from the checkpoint or the log (e.g. the job was killed before updating $finished_info)
+    if finished_step ${now} ;then
+       echo $now >> $finished_info
+       continue
+    fi
+
+    # "-update" is available only for dynamics
+    step_options=$mdrun_options
+    if grep -Eiq "^ *integrator *= *(steep|cg|l-bfgs)" ${now}.mdp ;then
+       step_options=`echo $mdrun_options | sed 's/-update [a-z]*//'`
+    fi
 
+    # resume from the checkpoint of an interrupted run
+    resume_time=""
+    if [ -f ${now}.cpt ] && [ -f ${now}.tpr ] ;then
+       resume_time=`$GMX dump -cp ${now}.cpt 2> /dev/null | awk '$1 == "t" && $2 == "=" {print $3; exit}'`
+    fi
+
+    if [ A$resume_time != "A" ] ;then
+       total_time=`awk -F '[=;]' '$1 ~ /^ *nsteps/ {n = $2} $1 ~ /^ *dt/ {dt = $2} END {print n * dt}' ${now}.mdp`
+       echo "resume ${now} from ${now}.cpt: ${resume_time} / ${total_time} ps have already been simulated" \
+         "in `compute_time ${now}.log`"
+       echo $GMX mdrun $step_options -v -s ${now}.tpr -cpi ${now}.cpt -append \
+         -cpo ${now}.cpt -x ${now}.xtc -c ${now}.gro -e ${now}.edr -g ${now}.log
+
+       $GMX mdrun $step_options -v -s ${now}.tpr -cpi ${now}.cpt -append \
+         -cpo ${now}.cpt -x ${now}.xtc -c ${now}.gro -e ${now}.edr -g ${now}.log \
+         || exit
+    else
+       rm -f ${now}.out.mdp ${now}.tpr ${now}.log ${now}.gro ${now}.trr ${now}.edr ${now}.cpt
+       echo $GMX grompp -maxwarn 1 -f ${now}.mdp -o ${now}.tpr \
+         -c ${prev}.gro -p ${top} \
+         -r ${prev}.gro -n index.ndx
+       echo $GMX mdrun $step_options -v -s ${now}.tpr \
+         -cpo ${now}.cpt -x ${now}.xtc -c ${now}.gro -e ${now}.edr -g ${now}.log
+
+       $GMX grompp -maxwarn 1 -f ${now}.mdp -o ${now}.tpr \
+         -c ${prev}.gro -p ${top} \
+         -r ${prev}.gro -n index.ndx
+       $GMX mdrun $step_options -v -s ${now}.tpr \
+         -cpo ${now}.cpt -x ${now}.xtc -c ${now}.gro -e ${now}.edr -g ${now}.log \
+         || exit
+    fi
+
+    if [ A$interrupted != "A" ] ;then
+       echo "${now} is interrupted and will be resumed from ${now}.cpt"
+       exit {{ REQUEUE_EXIT_CODE }}
+    fi
+    if ! finished_step ${now} ;then
+       echo "${now} did not reach nsteps (see ${now}.log)"
+       exit 1
+    fi
     echo $now >> $finished_info
 
 done
 
 
-ln -s $stepname.xtc {{ OUT_TRAJ }}
+ln -sf $stepname.xtc {{ OUT_TRAJ }}
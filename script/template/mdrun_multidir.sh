@@ -0,0 +1,124 @@
+#!/bin/sh
+# run a simulation sequence of replicas with "gmx mdrun -multidir" (requires an MPI build of GROMACS)
+
+hostname
+ncpus=$1
+
+## initialize
+top={{ TOP }}
+now={{ GRO | replace(".gro", "") }}
+if [ A$GMX = "A" ];then
+    GMX=gmx_mpi
+fi
+if [ A$MPIRUN = "A" ];then
+    MPIRUN=mpirun
+fi
+dirs="{{ DIRS }}"
+
+finished_info=finished_step_list
+for dir in $dirs
+do
+    touch $dir/$finished_info
+done
+
+# a step is finished when its run reached nsteps: "Finished mdrun" and the -c structure are also written
+# when mdrun is stopped by a signal or -maxh, so dynamics are checked by the step of the checkpoint,
+# and minimizations (without checkpoints) by the log of the last run
+finished_step () {
+    [ -f $1.gro ] && [ -f $1.log ] || return 1
+    if [ -f $1.cpt ] ;then
+        nsteps=`awk -F '[=;]' '$1 ~ /^ *nsteps *$/ {n = $2} END {print n + 0}' $1.mdp`
+        step=`$GMX dump -cp $1.cpt 2> /dev/null | awk '$1 == "step" && $2 == "=" {print $3; exit}'`
+        [ A$step != "A" ] && [ $step -ge $nsteps ]
+    else
+        awk '/Log file opened/ {s = 0; f = 0} /Received the .* signal/ {s = 1} /Finished mdrun/ {f = 1}
+             END {exit !(f && !s)}' $1.log
+    fi
+}
+
+# wall and core time of the runs in a log
+compute_time () {
+    awk '$1 == "Time:" {core += $2; wall += $3} END {printf "%.0f s (%.0f core s)", wall, core}' $1
+}
+
+# the runner forwards preemption signals to the whole process group:
+# mdrun writes checkpoints and stops, and the next step is not started
+interrupted=""
+trap 'interrupted=1' TERM USR1
+
+for stepname in {{ STEP_NAMES }}
+do
+    prev=$now
+    now=$stepname
+
+    # completion is tracked per replica
+    running=""
+    for dir in $dirs
+    do
+        if [ `grep -x ${now} $dir/$finished_info | wc -l` = 1 ] ;then
+            continue
+        fi
+        if finished_step $dir/${now} ;then
+            echo $now >> $dir/$finished_info
+            continue
+        fi
+        running="$running $dir"
+    done
+    if [ "A$running" = "A" ] ;then
+        continue
+    fi
+    if [ A$interrupted != "A" ] ;then
+        exit {{ REQUEUE_EXIT_CODE }}
+    fi
+
+    for dir in $running
+    do
+        # resume from the checkpoint of an interrupted run (mdrun ignores -cpi of replicas without checkpoints)
+        resume_time=""
+        if [ -f $dir/${now}.cpt ] && [ -f $dir/${now}.tpr ] ;then
+            resume_time=`$GMX dump -cp $dir/${now}.cpt 2> /dev/null | awk '$1 == "t" && $2 == "=" {print $3; exit}'`
+        fi
+        if [ A$resume_time != "A" ] ;then
+            echo "resume $dir/${now} from ${now}.cpt: ${resume_time} ps have already been simulated" \
+              "in `compute_time $dir/${now}.log`"
+            continue
+        fi
+        rm -f $dir/${now}.out.mdp $dir/${now}.tpr $dir/${now}.log $dir/${now}.gro $dir/${now}.trr \
+          $dir/${now}.edr $dir/${now}.cpt $dir/${now}.xtc
+        (cd $dir && $GMX grompp -maxwarn 1 -f ${now}.mdp -o ${now}.tpr \
+          -c ${prev}.gro -p ${top} \
+          -r ${prev}.gro -n index.ndx) || exit
+    done
+
+    nrunning=`echo $running | wc -w`
+    ntomp=`expr $ncpus / $nrunning`
+    if [ $ntomp -lt 1 ] ;then
+        ntomp=1
+    fi
+    echo $MPIRUN -np $nrunning $GMX mdrun -multidir $running -ntomp $ntomp -v -s ${now}.tpr -cpi ${now}.cpt -append \
+      -cpo ${now}.cpt -x ${now}.xtc -c ${now}.gro -e ${now}.edr -g ${now}.log
+
+    $MPIRUN -np $nrunning $GMX mdrun -multidir $running -ntomp $ntomp -v -s ${now}.tpr -cpi ${now}.cpt -append \
+      -cpo ${now}.cpt -x ${now}.xtc -c ${now}.gro -e ${now}.edr -g ${now}.log \
+      || exit
+
+    if [ A$interrupted != "A" ] ;then
+        echo "${now} is interrupted and will be resumed from ${now}.cpt"
+        exit {{ REQUEUE_EXIT_CODE }}
+    fi
+    for dir in $running
+    do
+        if ! finished_step $dir/${now} ;then
+            echo "$dir/${now} did not reach nsteps (see $dir/${now}.log)"
+            exit 1
+        fi
+        echo $now >> $dir/$finished_info
+    done
+
+done
+
+
+for dir in $dirs
+do
+    ln -sf $stepname.xtc $dir/{{ OUT_TRAJ }}
+done
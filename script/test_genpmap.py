@@ -1,3 +1,5 @@
+import copy
+
 import pytest
 import numpy as np
 import gridData
@@ -10,11 +12,16 @@ import numpy.testing as npt
 from script.genpmap import (
     mask_generator,
     convert_to_proba,
+    convert_proba_to_gfe,
+    convert_count_grid,
     convert_to_gfe,
     convert_to_pmap,
     parse_snapshot_setting,
-    gen_pmap
+    gen_pmap,
+    count_grid_files,
 )
+from script.utilities.manifest import StageManifest
+from script.utilities.sparse_grid import SparseGrid
 
 # Basic grid-related fixtures
 @pytest.fixture
@@ -204,6 +211,54 @@ def test_convert_to_gfe(tmp_path):
     inv_gfe_path = Path(gfe_path).parent / f"InvGFE_{Path(grid_path).name}"
     assert inv_gfe_path.exists()
 
+def test_convert_count_grid_matches_file_based_chain(tmp_path, count_grid_fixture, mask_fixture):
+    """In-memory PMAP -> GFE/InvGFE conversion gives the same maps as the file-based chain"""
+    grid_path = tmp_path / "test_grid.dx"
+    count_grid_fixture.export(str(grid_path))
+    grid = gridData.Grid(str(grid_path))
+
+    paths = convert_count_grid(grid, grid_path, mask_fixture, normalize="snapshot", frames=10, mean_proba=0.4)
+    assert set(paths) == {"PMAP", "GFE", "InvGFE"}
+
+    pmap = gridData.Grid(paths["PMAP"])
+    np.testing.assert_array_almost_equal(pmap.grid[mask_fixture], count_grid_fixture.grid[mask_fixture] / 10)
+    assert np.all(pmap.grid[~mask_fixture] == -1)
+
+    expected_gfe = gridData.Grid(convert_to_gfe(paths["PMAP"], 0.4))
+    np.testing.assert_array_almost_equal(gridData.Grid(paths["GFE"]).grid, expected_gfe.grid)
+    np.testing.assert_array_almost_equal(gridData.Grid(paths["InvGFE"]).grid, -expected_gfe.grid)
+
+@pytest.mark.parametrize("normalize", ["snapshot", "total"])
+def test_convert_count_grid_sparse_matches_dense(tmp_path, count_grid_fixture, mask_fixture, normalize):
+    """Sparse outputs (npz) hold the same maps as the dense outputs (dx)"""
+    grid_path = tmp_path / "test_grid.dx"
+    count_grid_fixture.export(str(grid_path))
+
+    paths = convert_count_grid(
+        gridData.Grid(str(grid_path)), grid_path, mask_fixture, normalize=normalize, frames=10, mean_proba=0.4, map_format="both"
+    )
+    for key, path in paths.items():
+        assert path.endswith(".dx")
+        sparse = SparseGrid.load(Path(path).with_suffix(".npz"))
+        np.testing.assert_array_almost_equal(sparse.to_dense(), gridData.Grid(path).grid)
+
+    paths = convert_count_grid(gridData.Grid(str(grid_path)), grid_path, mask_fixture, map_format="sparse")
+    assert paths["PMAP"].endswith(".npz")
+
+def test_convert_count_grid_invalid_format(count_grid_fixture, mask_fixture, tmp_path):
+    with pytest.raises(ValueError):
+        convert_count_grid(count_grid_fixture, tmp_path / "test_grid.dx", mask_fixture, map_format="hdf5")
+
+def test_convert_proba_to_gfe_in_chunks(monkeypatch, count_grid_fixture):
+    """Chunked conversion gives the same values as the whole-grid conversion"""
+    expected = convert_proba_to_gfe(copy.deepcopy(count_grid_fixture), 4.0).grid
+    monkeypatch.setattr("script.genpmap._CHUNK_VOXELS", 3)
+    grid = count_grid_fixture.grid
+    result = convert_proba_to_gfe(count_grid_fixture, 4.0)
+    assert result.grid is grid  # converted in place
+    np.testing.assert_array_almost_equal(result.grid, expected)
+    assert np.all(result.grid <= 3)
+
 @patch('script.genpmap.mask_generator')
 @patch('script.genpmap.convert_to_proba')
 def test_convert_to_pmap_snapshot(mock_convert_to_proba, mock_mask_generator, pmap_test_data):
@@ -324,8 +379,10 @@ def gen_pmap_test_data(tmp_path):
 @patch('script.genpmap.uPDB.get_structure')
 @patch('script.genpmap.uPDB.get_attr')
 @patch('script.genpmap.Cpptraj')
-@patch('script.genpmap.convert_to_pmap')
-def test_gen_pmap_basic(mock_convert_to_pmap, mock_cpptraj, mock_get_attr, mock_get_structure, tmp_path, gen_pmap_test_data):
+@patch('script.genpmap.gridData')
+@patch('script.genpmap.mask_generator')
+@patch('script.genpmap.convert_count_grid')
+def test_gen_pmap_basic(mock_convert_count_grid, mock_mask_generator, mock_grid_data, mock_cpptraj, mock_get_attr, mock_get_structure, tmp_path, gen_pmap_test_data):
     """Test basic PMAP generation"""
     setting_general, setting_input, setting_pmap, traj, top = gen_pmap_test_data
     
@@ -336,7 +393,7 @@ def test_gen_pmap_basic(mock_convert_to_pmap, mock_cpptraj, mock_get_attr, mock_
     mock_cpptraj_instance.frames = 50
     mock_cpptraj_instance.last_volume = 1000.0
     mock_cpptraj.return_value = mock_cpptraj_instance
-    mock_convert_to_pmap.side_effect = ["test_data/pmap1.dx", "test_data/pmap2.dx"]
+    mock_convert_count_grid.side_effect = [{"PMAP": "test_data/pmap1.dx"}, {"PMAP": "test_data/pmap2.dx"}]
 
     # Test execution
     pmap_paths = gen_pmap(
@@ -349,18 +406,23 @@ def test_gen_pmap_basic(mock_convert_to_pmap, mock_cpptraj, mock_get_attr, mock_
     )
 
     # Verify results
-    assert len(pmap_paths) == 2
+    assert pmap_paths == ["test_data/pmap1.dx", "test_data/pmap2.dx"]
     mock_cpptraj_instance.set.assert_called_once()
     mock_cpptraj_instance.run.assert_called_once()
-    assert mock_convert_to_pmap.call_count == 2
+    assert mock_convert_count_grid.call_count == 2
+    # the mask is generated once and shared by all maps
+    mock_mask_generator.assert_called_once()
+    # each count grid is read once
+    assert mock_grid_data.Grid.call_count == 2
 
 @patch('script.genpmap.uPDB.get_structure')
 @patch('script.genpmap.uPDB.get_attr')
 @patch('script.genpmap.uPDB.estimate_exclute_volume')
 @patch('script.genpmap.Cpptraj')
-@patch('script.genpmap.convert_to_pmap')
-@patch('script.genpmap.convert_to_gfe')
-def test_gen_pmap_gfe(mock_convert_to_gfe, mock_convert_to_pmap, mock_cpptraj, 
+@patch('script.genpmap.gridData')
+@patch('script.genpmap.mask_generator')
+@patch('script.genpmap.convert_count_grid')
+def test_gen_pmap_gfe(mock_convert_count_grid, mock_mask_generator, mock_grid_data, mock_cpptraj,
                      mock_estimate_volume, mock_get_attr, mock_get_structure, tmp_path, gen_pmap_test_data):
     """Test PMAP generation in GFE mode"""
     setting_general, setting_input, setting_pmap, traj, top = gen_pmap_test_data
@@ -376,8 +438,9 @@ def test_gen_pmap_gfe(mock_convert_to_gfe, mock_convert_to_pmap, mock_cpptraj,
     mock_cpptraj_instance.last_volume = 1000.0
     mock_cpptraj.return_value = mock_cpptraj_instance
     mock_estimate_volume.return_value = 100.0
-    mock_convert_to_pmap.return_value = "test_data/pmap1.dx"
-    mock_convert_to_gfe.return_value = "test_data/gfe1.dx"
+    mock_convert_count_grid.return_value = {
+        "PMAP": "test_data/pmap1.dx", "GFE": "test_data/gfe1.dx", "InvGFE": "test_data/invgfe1.dx"
+    }
 
     # Test execution
     pmap_paths = gen_pmap(
@@ -390,8 +453,29 @@ def test_gen_pmap_gfe(mock_convert_to_gfe, mock_convert_to_pmap, mock_cpptraj,
     )
 
     # Verify results
-    assert len(pmap_paths) == 1
-    mock_convert_to_gfe.assert_called_once()
+    assert pmap_paths == ["test_data/gfe1.dx"]
+    mock_convert_count_grid.assert_called_once()
     # Verify mean_proba calculation is correct
     expected_mean_proba = 100 / (1000.0 - 100.0)
-    mock_convert_to_gfe.assert_called_with("test_data/pmap1.dx", expected_mean_proba, temperature=300)
+    assert mock_convert_count_grid.call_args.kwargs["mean_proba"] == pytest.approx(expected_mean_proba)
+    assert mock_convert_count_grid.call_args.kwargs["normalize"] == "snapshot"
+
+
+def test_pmap_inputs_include_count_grids(tmp_path):
+    # regenerated count grids (e.g. a new map.interval) are written with the same grids.json
+    grid_info = tmp_path / "TEST_grids.json"
+    grid_info.write_text('{"frames": 10, "last_volume": null, "maps": [{"suffix": "nVH", "grid": "TEST_nVH.dx"}]}')
+    count = tmp_path / "TEST_nVH.dx"
+    gridData.Grid(np.ones((4, 4, 4)), origin=[0, 0, 0], delta=[1.0, 1.0, 1.0]).export(str(count), type="double")
+    assert count_grid_files(grid_info) == [count]
+
+    manifest = StageManifest(tmp_path / "manifest.json")
+    fingerprint = manifest.fingerprint([grid_info, *count_grid_files(grid_info)])
+    manifest.start("pmap", fingerprint)
+    manifest.finish("pmap", fingerprint, [])
+    assert manifest.is_up_to_date("pmap", manifest.fingerprint([grid_info, *count_grid_files(grid_info)]))
+
+    before = grid_info.read_bytes()
+    gridData.Grid(np.ones((8, 8, 8)), origin=[0, 0, 0], delta=[0.5, 0.5, 0.5]).export(str(count), type="double")
+    assert grid_info.read_bytes() == before
+    assert not manifest.is_up_to_date("pmap", manifest.fingerprint([grid_info, *count_grid_files(grid_info)]))
@@ -0,0 +1,75 @@
+import pytest
+
+from script.hmr2top import hmr2top
+
+TOP = """[ moleculetype ]
+; Name            nrexcl
+MOL          3
+
+[ atoms ]
+;   nr       type  resnr residue  atom   cgnr    charge       mass  typeB    chargeB      massB
+     1         c3      1    MOL     C1      1 -0.10000000  12.010000   ; qtot -0.100000
+     2         hc      1    MOL     H1      2  0.05000000   1.008000   ; qtot -0.050000
+     3         hc      1    MOL     H2      3  0.05000000   1.008000   ; qtot 0.000000
+     4         oh      1    MOL     O1      4 -0.50000000  16.000000   ; qtot -0.500000
+     5         ho      1    MOL     H3      5  0.50000000   1.008000   ; qtot 0.000000
+
+[ bonds ]
+;    ai     aj funct         c0         c1         c2         c3
+      1      2     1
+      1      3     1
+      1      4     1
+      4      5     1
+
+[ moleculetype ]
+; Name            nrexcl
+WAT          3
+
+[ atoms ]
+;   nr       type  resnr residue  atom   cgnr    charge       mass  typeB    chargeB      massB
+     1         OW      1    WAT      O      1 -0.83400000  16.000000   ; qtot -0.834000
+     2         HW      1    WAT     H1      2  0.41700000   1.008000   ; qtot -0.417000
+     3         HW      1    WAT     H2      3  0.41700000   1.008000   ; qtot 0.000000
+
+[ settles ]
+; i     funct   doh     dhh
+1     1   0.09572000   0.15139000
+"""
+
+
+def _masses(top_string, molecule):
+    masses = []
+    current = None
+    section = None
+    for line in top_string.split("\n"):
+        content = line.split(";", 1)[0].strip()
+        if content.startswith("["):
+            section = content.strip("[] ")
+        elif content and section == "moleculetype":
+            current = content.split()[0]
+        elif content and section == "atoms" and current == molecule:
+            masses.append(float(content.split()[7]))
+    return masses
+
+
+def test_hmr2top():
+    ret = hmr2top(TOP)
+    masses = _masses(ret, "MOL")
+    assert masses == pytest.approx([12.010 - 2 * 2.016, 3.024, 3.024, 16.000 - 2.016, 3.024])
+    assert sum(masses) == pytest.approx(sum(_masses(TOP, "MOL")))
+    # water is not modified
+    assert _masses(ret, "WAT") == _masses(TOP, "WAT")
+    # the column width is kept
+    assert len(ret.split("\n")[7]) == len(TOP.split("\n")[7])
+
+
+def test_hmr2top_hydrogen_mass():
+    masses = _masses(hmr2top(TOP, hydrogen_mass=4.0), "MOL")
+    assert masses[1] == pytest.approx(4.0)
+    assert masses[3] == pytest.approx(16.000 - 2.992)
+    with pytest.raises(ValueError):
+        hmr2top(TOP, hydrogen_mass=6.0)
+
+
+def test_hmr2top_empty():
+    assert hmr2top("") == ""
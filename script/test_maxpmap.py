@@ -4,7 +4,8 @@ import pytest
 import numpy as np
 from gridData import Grid
 
-from script.maxpmap import grid_max, gen_max_pmap
+from script.maxpmap import gen_aggregated_pmap, gen_max_pmap, grid_max, grid_mean
+from script.utilities.sparse_grid import SparseGrid
 
 # Define test data paths
 TEST_DATA_DIR = Path("script/test_data")
@@ -89,4 +90,42 @@ class TestGenMaxPmap:
     def test_empty_input(self):
         """Test gen_max_pmap with empty input list"""
         with pytest.raises(ValueError, match="No input files provided"):
-            gen_max_pmap([], "output.dx")
\ No newline at end of file
+            gen_max_pmap([], "output.dx")
+
+def _pmap(seed):
+    rng = np.random.default_rng(seed)
+    grid = np.where(rng.random((5, 6, 7)) < 0.5, rng.random((5, 6, 7)), -1.0)
+    return Grid(grid, origin=[0.0, 0.0, 0.0], delta=[1.0, 1.0, 1.0])
+
+
+class TestSparsePmap:
+    """Test class for aggregation of sparse (npz) pmaps"""
+
+    @pytest.mark.parametrize("aggregation,reducer", [("max", np.max), ("mean", np.mean)])
+    def test_gen_aggregated_pmap(self, tmp_path, aggregation, reducer):
+        gs = [_pmap(seed) for seed in range(3)]
+        input_paths = []
+        for i, g in enumerate(gs):
+            SparseGrid.from_grid(g).save(tmp_path / f"pmap{i}.npz")
+            input_paths.append(str(tmp_path / f"pmap{i}.npz"))
+        expected = reducer([g.grid for g in gs], axis=0)
+
+        output_path = gen_aggregated_pmap(input_paths, str(tmp_path / "out.npz"), aggregation=aggregation)
+        assert SparseGrid.load(output_path).to_dense() == pytest.approx(expected)
+
+        output_path = gen_aggregated_pmap(input_paths, str(tmp_path / "out.dx"), aggregation=aggregation)
+        assert Grid(output_path).grid == pytest.approx(expected)
+
+    def test_mixed_inputs(self):
+        gs = [_pmap(0), SparseGrid.from_grid(_pmap(1))]
+        expected = np.max([_pmap(0).grid, _pmap(1).grid], axis=0)
+        assert grid_max(gs).to_dense() == pytest.approx(expected)
+
+    def test_grid_mean_dense(self):
+        expected = np.mean([_pmap(0).grid, _pmap(1).grid], axis=0)
+        assert grid_mean([_pmap(0), _pmap(1)]).grid == pytest.approx(expected)
+
+    def test_invalid_aggregation(self, tmp_path):
+        SparseGrid.from_grid(_pmap(0)).save(tmp_path / "pmap.npz")
+        with pytest.raises(ValueError, match="Invalid aggregation method"):
+            gen_aggregated_pmap([str(tmp_path / "pmap.npz")], str(tmp_path / "out.npz"), aggregation="median")
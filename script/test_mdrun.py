@@ -1,13 +1,24 @@
+import json
+import os
+import subprocess
+import sys
+
 import pytest
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
 from script.mdrun import (
+    check_time_step,
     gen_mdp,
     gen_mdrun_job,
+    gen_mdrun_multidir_job,
+    gen_output_group,
     prepare_sequence,
-    prepare_md_files
+    prepare_md_files,
+    run_md_multidir,
 )
+from script.utilities.const import REQUEUE_EXIT_CODE
+from script.utilities.local_scheduler import LocalScheduler
 
 @pytest.fixture
 def general_settings():
@@ -103,6 +114,61 @@ class TestGenMdp:
         with pytest.raises(ValueError, match=f"Invalid simulation type: {invalid_type}"):
             gen_mdp(protocol, tmp_path)
 
+    def test_gen_mdp_strip_water(self, tmp_path):
+        """Test the output group of the production run"""
+        protocol = {"type": "production", "name": "pr", "strip_water": True}
+        gen_mdp(protocol, tmp_path)
+        assert "compressed-x-grps = woWAT" in (tmp_path / "pr.mdp").read_text()
+
+        protocol = {"type": "production", "name": "pr"}
+        gen_mdp(protocol, tmp_path)
+        assert "compressed-x-grps" not in (tmp_path / "pr.mdp").read_text()
+
+    @pytest.mark.parametrize("dt, hmr, valid", [
+        (0.002, False, True),
+        (0.004, False, False),
+        (0.004, True, True),
+        (0.005, True, False),
+    ])
+    def test_gen_mdp_time_step(self, tmp_path, dt, hmr, valid):
+        """Test validation of the time step against hydrogen mass repartitioning"""
+        protocol = {"type": "production", "name": "pr", "dt": dt, "hmr": hmr}
+        if valid:
+            gen_mdp(protocol, tmp_path)
+            assert f"dt              = {dt}" in (tmp_path / "pr.mdp").read_text()
+        else:
+            with pytest.raises(ValueError):
+                gen_mdp(protocol, tmp_path)
+
+        # minimization steps are not validated
+        gen_mdp({"type": "minimization", "name": "min", "dt": dt, "hmr": hmr}, tmp_path)
+
+    def test_check_time_step_constraints(self):
+        """Test validation of the time step against constraints"""
+        check_time_step("dt = 0.002\nconstraints = none\n", hmr=False)
+        check_time_step("dt = 0.004\nconstraints = h-bonds ; comment\n", hmr=True)
+        with pytest.raises(ValueError, match="constraints"):
+            check_time_step("dt = 0.004\nconstraints = none\n", hmr=True)
+
+
+def test_gen_output_group(tmp_path):
+    gro = tmp_path / "input.gro"
+    gro.write_text(
+        "test\n"
+        "    5\n"
+        "    1ALA      N    1   0.000   0.000   0.000\n"
+        "    2A11     C1    2   0.100   0.000   0.000\n"
+        "    2A11    VIS    3   0.100   0.000   0.000\n"
+        "    3WAT      O    4   0.200   0.000   0.000\n"
+        "    4Na+    Na+    5   0.300   0.000   0.000\n"
+        "   1.00000   1.00000   1.00000\n"
+    )
+    ndx = tmp_path / "index.ndx"
+    ndx.write_text("[ System ]\n   1    2    3    4    5\n")
+    assert gen_output_group(gro, ndx) == 3
+    assert ndx.read_text().splitlines()[2:] == ["[ woWAT ]", "   1    2    3"]
+
+
 # Test gen_mdrun_job
 class TestGenMdrunJob:
     @pytest.fixture
@@ -193,3 +259,279 @@ class TestPrepareMdFiles:
         # Verify number of gen_mdp calls
         mock_env, _ = mock_jinja
         assert mock_env.return_value.get_template.call_count == len(sequence) + 1  # +1 for mdrun.sh template
+
+
+FAKE_GMX = r"""#!/bin/sh
+echo "$@" >> gmx_calls
+case $1 in
+  dump) [ -s $3 ] && awk '{print "   step = " $1; print "   t = " $2}' $3 ;;
+  mdrun) eval log=\${$#} ; echo "Finished mdrun on rank 0" >> $log ; touch ${log%.log}.gro
+         echo "1000 100.000000" > ${log%.log}.cpt ;;
+esac
+exit 0
+"""
+
+
+class TestMdrunJobResume:
+    @pytest.fixture
+    def simdir(self, tmp_path):
+        gmx = tmp_path / "fake_gmx"
+        gmx.write_text(FAKE_GMX)
+        gmx.chmod(0o755)
+        gen_mdrun_job(["min", "pr"], "TEST", tmp_path / "mdrun.sh", Path("input.top"), Path("input.gro"), Path("TEST.xtc"))
+        (tmp_path / "finished_step_list").write_text("min\n")
+        (tmp_path / "pr.mdp").write_text("nsteps = 1000\ndt = 0.1\n")
+        return tmp_path
+
+    def _run(self, simdir, env=""):
+        result = subprocess.run(
+            f"{env} GMX={simdir / 'fake_gmx'} sh mdrun.sh 1", shell=True, cwd=simdir, capture_output=True, text=True
+        )
+        assert result.returncode == 0, result.stderr
+        calls = simdir / "gmx_calls"
+        return result.stdout, calls.read_text().splitlines() if calls.exists() else []
+
+    def test_resume_from_checkpoint(self, simdir):
+        for ext in ["tpr", "xtc"]:
+            (simdir / f"pr.{ext}").touch()
+        (simdir / "pr.cpt").write_text("500 50.000000\n")
+        (simdir / "pr.log").write_text("       Time:      400.000      100.000      400.0\n")
+        stdout, calls = self._run(simdir)
+        assert "50.000000 / 100 ps have already been simulated in 100 s (400 core s)" in stdout
+        assert not any(c.startswith("grompp") for c in calls)
+        assert "-s pr.tpr -cpi pr.cpt -append" in [c for c in calls if c.startswith("mdrun")][0]
+        assert (simdir / "finished_step_list").read_text().split() == ["min", "pr"]
+
+    def test_restart_without_checkpoint(self, simdir):
+        stdout, calls = self._run(simdir)
+        assert [c.split()[0] for c in calls] == ["grompp", "mdrun", "dump"]
+        assert "-cpi" not in calls[1]
+
+    def test_tuned_options(self, simdir):
+        (simdir / "finished_step_list").write_text("")
+        (simdir / "min.mdp").write_text("integrator   = steep\n")
+        _, calls = self._run(simdir, env="MDRUN_OPTIONS='-ntomp 4 -nb gpu -update gpu'")
+        mdrun_calls = [c for c in calls if c.startswith("mdrun")]
+        assert mdrun_calls[0].startswith("mdrun -ntomp 4 -nb gpu -v -s min.tpr")  # no "-update" for minimization
+        assert mdrun_calls[1].startswith("mdrun -ntomp 4 -nb gpu -update gpu -v -s pr.tpr")
+
+    def test_finished_log(self, simdir):
+        (simdir / "pr.log").write_text("Finished mdrun on rank 0\n")
+        (simdir / "pr.gro").touch()
+        _, calls = self._run(simdir)
+        assert calls == []
+        assert (simdir / "finished_step_list").read_text().split() == ["min", "pr"]
+
+    def test_finished_checkpoint(self, simdir):
+        (simdir / "pr.log").write_text("Finished mdrun on rank 0\n")
+        (simdir / "pr.cpt").write_text("1000 100.000000\n")
+        (simdir / "pr.gro").touch()
+        _, calls = self._run(simdir)
+        assert [c.split()[0] for c in calls] == ["dump"]
+        assert (simdir / "finished_step_list").read_text().split() == ["min", "pr"]
+
+    @pytest.mark.parametrize("log", [
+        "Received the TERM signal, stopping within 100 steps\nFinished mdrun on rank 0\n",  # preempted
+        "Step 500: Run time exceeded 0.99 hours, will terminate the run\nFinished mdrun on rank 0\n",  # -maxh
+    ])
+    def test_stopped_run_is_resumed(self, simdir, log):
+        """mdrun stopped before nsteps writes "Finished mdrun" and the structure as well"""
+        (simdir / "pr.log").write_text(log)
+        (simdir / "pr.cpt").write_text("500 50.000000\n")
+        for ext in ["tpr", "xtc", "gro"]:
+            (simdir / f"pr.{ext}").touch()
+        stdout, calls = self._run(simdir)
+        assert "resume pr from pr.cpt" in stdout
+        assert "-s pr.tpr -cpi pr.cpt -append" in [c for c in calls if c.startswith("mdrun")][0]
+        assert (simdir / "finished_step_list").read_text().split() == ["min", "pr"]
+
+    def test_minimization_stopped_by_signal(self, simdir):
+        (simdir / "finished_step_list").write_text("")
+        (simdir / "min.mdp").write_text("integrator   = steep\n")
+        (simdir / "min.log").write_text("Received the TERM signal, stopping within 100 steps\nFinished mdrun\n")
+        (simdir / "min.gro").touch()
+        _, calls = self._run(simdir)
+        assert [c.split()[0] for c in calls][:2] == ["grompp", "mdrun"] and "min.tpr" in calls[1]
+
+
+FAKE_GMX_SLOW = """#!/bin/sh
+echo "$@" >> gmx_calls
+case $1 in
+  grompp) touch pr.tpr ;;
+  dump) [ -s pr.cpt ] && awk '{print "   step = " $1; print "   t = " $2}' pr.cpt ;;
+  mdrun)
+    case "$*" in
+      *-cpi*) echo "Finished mdrun on rank 0" >> pr.log ; echo "1000 100.000000" > pr.cpt ; touch pr.gro ; exit 0 ;;
+    esac
+    trap 'echo "Received the TERM signal" >> pr.log ; echo "Finished mdrun on rank 0" >> pr.log
+          echo "500 50.000000" > pr.cpt ; touch pr.gro ; exit 0' TERM
+    sleep 30 &
+    wait $!
+    ;;
+esac
+exit 0
+"""
+
+PREEMPTIBLE_JOB = """
+import sys
+from pathlib import Path
+
+from script.mdrun import install_preemption_handler, is_preempted, run_md_sequence
+from script.utilities.const import REQUEUE_EXIT_CODE
+
+install_preemption_handler()
+run_md_sequence(0, Path(sys.argv[1]), Path(sys.argv[2]), 1, "TEST")
+sys.exit(REQUEUE_EXIT_CODE if is_preempted() else 0)
+"""
+
+
+def test_preemption_and_requeue(tmp_path):
+    gmx = tmp_path / "fake_gmx"
+    gmx.write_text(FAKE_GMX_SLOW)
+    gmx.chmod(0o755)
+    job = tmp_path / "job.py"
+    job.write_text(PREEMPTIBLE_JOB)
+    gen_mdrun_job(["pr"], "TEST", tmp_path / "mdrun.sh", Path("input.top"), Path("input.gro"), Path("TEST.xtc"))
+    (tmp_path / "pr.mdp").write_text("nsteps = 1000\ndt = 0.1\n")
+
+    scheduler = LocalScheduler(preempt_after=[2.0])
+    env = dict(os.environ, PYTHONPATH=str(Path.cwd()))
+    returncodes = scheduler.submit([sys.executable, str(job), str(tmp_path), str(gmx)], env=env)
+
+    assert returncodes == [REQUEUE_EXIT_CODE, 0]
+    calls = (tmp_path / "gmx_calls").read_text().splitlines()
+    # the step stopped by the signal is not recorded as finished although it has "Finished mdrun" and pr.gro
+    mdrun_calls = [c for c in calls if not c.startswith("dump")]
+    assert [c.split()[0] for c in mdrun_calls] == ["grompp", "mdrun", "mdrun"]
+    assert "-cpi pr.cpt -append" in mdrun_calls[-1]
+    state = json.loads((tmp_path / "run_state.json").read_text())
+    assert state["status"] == "finished" and state["finished_steps"] == ["pr"]
+
+
+def test_preemption_handler_is_restored():
+    import signal
+
+    from script.mdrun import _forward_signal, preemption_handler
+
+    with preemption_handler():
+        assert signal.getsignal(signal.SIGTERM) is _forward_signal
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+
+
+def test_signal_before_registration(tmp_path):
+    """a process started after the signal is stopped as well"""
+    from script import mdrun
+
+    mdrun._preempted.set()
+    try:
+        assert mdrun._run_script(tmp_path, ["sleep", "30"], dict(os.environ)) == -15
+    finally:
+        mdrun._preempted.clear()
+
+
+FAKE_MPIRUN = """#!/bin/sh
+echo "$@" >> mpirun_calls
+shift 2
+exec "$@"
+"""
+
+FAKE_GMX_MPI = """#!/bin/sh
+echo "$(pwd) $@" >> $CALLS
+case $1 in
+  grompp) touch step.tpr ;;
+  mdrun)
+    dirs=""
+    now=""
+    prev_arg=""
+    for arg in "$@" ; do
+      case $prev_arg in
+        -multidir) dirs="$arg" ; multi=1 ;;
+        -g) now=$(basename $arg .log) ;;
+      esac
+      [ "$multi" = 1 ] && case $arg in -*) [ "$arg" != "-multidir" ] && multi=0 ;; *) dirs="$dirs $arg" ;; esac
+      prev_arg=$arg
+    done
+    for dir in $dirs ; do
+      echo "Finished mdrun on rank 0" >> $dir/$now.log
+      touch $dir/$now.gro $dir/$now.xtc
+    done
+    ;;
+esac
+exit 0
+"""
+
+
+def test_run_md_multidir(tmp_path):
+    for name, content in [("fake_gmx", FAKE_GMX_MPI), ("fake_mpirun", FAKE_MPIRUN)]:
+        (tmp_path / name).write_text(content)
+        (tmp_path / name).chmod(0o755)
+    simdirs = [tmp_path / f"system{i}" / "simulation" for i in range(2)]
+    for simdir in simdirs:
+        simdir.mkdir(parents=True)
+    (simdirs[0] / "finished_step_list").write_text("min\n")
+
+    jobpath = gen_mdrun_multidir_job(
+        ["min", "pr"],
+        [d.relative_to(tmp_path) for d in simdirs],
+        tmp_path / "mdrun_multidir0.sh",
+        top="input.top",
+        gro="input.gro",
+        out_traj="TEST.xtc",
+    )
+    with patch.dict(os.environ, {"CALLS": str(tmp_path / "gmx_calls")}):
+        trajs = run_md_multidir(0, jobpath, simdirs, tmp_path / "fake_gmx", tmp_path / "fake_mpirun", 4, "TEST")
+
+    assert trajs == [d / "TEST.xtc" for d in simdirs]
+    mpirun_calls = (tmp_path / "mpirun_calls").read_text().splitlines()
+    assert len(mpirun_calls) == 2
+    assert mpirun_calls[0].startswith("-np 1 ") and "-multidir system1/simulation -ntomp 4" in mpirun_calls[0]
+    assert mpirun_calls[1].startswith("-np 2 ")
+    assert "-multidir system0/simulation system1/simulation -ntomp 2" in mpirun_calls[1]
+    grompp_dirs = [c.split()[0] for c in (tmp_path / "gmx_calls").read_text().splitlines() if " grompp " in c]
+    assert grompp_dirs == [str(simdirs[1]), str(simdirs[0]), str(simdirs[1])]
+    for simdir in simdirs:
+        assert (simdir / "finished_step_list").read_text().split() == ["min", "pr"]
+        assert os.readlink(simdir / "TEST.xtc") == "pr.xtc"
+        assert json.loads((simdir / "run_state.json").read_text())["status"] == "finished"
+
+
+def test_reset_simulation(tmp_path):
+    from script.mdrun import read_run_state, reset_simulation, simulation_inputs, write_run_state
+
+    for name in ["input.top", "input.gro", "index.ndx", "mdrun.sh", "min.mdp", "pr.mdp", "min.gro", "pr.cpt", "pr.log"]:
+        (tmp_path / name).write_text(name)
+    (tmp_path / "finished_step_list").write_text("min\n")
+    (tmp_path / "TEST.xtc").symlink_to("pr.xtc")
+    write_run_state(tmp_path, "preempted")
+    assert read_run_state(tmp_path) == "preempted"
+    assert [p.name for p in simulation_inputs(tmp_path, ["min", "pr"])] == [
+        "input.top", "input.gro", "index.ndx", "mdrun.sh", "min.mdp", "pr.mdp"
+    ]
+
+    reset_simulation(tmp_path, ["min", "pr"], tmp_path / "TEST.xtc")
+    assert read_run_state(tmp_path) is None
+    remaining = sorted(p.name for p in tmp_path.iterdir())
+    assert remaining == ["index.ndx", "input.gro", "input.top", "mdrun.sh", "min.mdp", "pr.mdp"]
+
+
+def test_read_step_times(tmp_path):
+    from datetime import datetime
+
+    from script.mdrun import read_step_times
+
+    (tmp_path / "min.log").write_text(
+        "Started mdrun on rank 0 Mon Oct 19 13:00:00 2026\n"
+        "Finished mdrun on rank 0 Mon Oct 19 13:00:05 2026\n"
+    )
+    # resumed from the checkpoint
+    (tmp_path / "pr.log").write_text(
+        "Started mdrun on rank 0 Mon Oct 19 13:00:06 2026\n"
+        "Received the TERM signal, stopping within 100 steps\n"
+        "Finished mdrun on rank 0 Mon Oct 19 14:00:00 2026\n"
+        "Started mdrun on rank 0 Tue Oct 20 09:00:00 2026\n"
+    )
+    times = read_step_times(tmp_path, ["min", "heat", "pr"])
+    assert times == [
+        ("min", datetime(2026, 10, 19, 13, 0, 0), datetime(2026, 10, 19, 13, 0, 5)),
+        ("pr", datetime(2026, 10, 19, 13, 0, 6), datetime(2026, 10, 19, 14, 0, 0)),
+    ]
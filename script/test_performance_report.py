@@ -0,0 +1,66 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from script.performance_report import build_report, collect_runs, find_slow_runs, write_performance_report
+
+LOG = Path(__file__).parent / "utilities" / "test_data" / "gmx_log" / "pr.log"
+
+
+def _run(system, host, ns_per_day, step="pr", wall=10.0):
+    return {"system": system, "step": step, "run": 0, "host": host, "ns_per_day": ns_per_day, "wall_time_s": wall}
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    for index in [0, 1]:
+        simdir = tmp_path / f"system{index}" / "simulation"
+        simdir.mkdir(parents=True)
+        (simdir / "pr.log").write_text(LOG.read_text())
+    return tmp_path
+
+
+def test_collect_runs(workdir):
+    runs = collect_runs(workdir, [0, 1, 2], ["min1", "pr"])
+    assert [(run["system"], run["step"], run["run"], run["host"]) for run in runs] == [
+        (0, "pr", 0, "node01"),
+        (0, "pr", 1, "node02"),
+        (1, "pr", 0, "node01"),
+        (1, "pr", 1, "node02"),
+    ]
+
+
+def test_build_report(workdir):
+    report = build_report(collect_runs(workdir, [0, 1], ["pr"]), ["pr"])
+    pr = report["steps"]["pr"]
+    assert pr["runs"] == 4
+    # weighted by the wall time
+    assert pr["ns_per_day"] == pytest.approx((474.25 * 18.22 + 300.0 * 15.0) / (18.22 + 15.0))
+    assert (pr["ns_per_day_min"], pr["ns_per_day_max"]) == (300.0, 474.25)
+    assert pr["pme_mesh_force_load"] == pytest.approx(0.877)
+    assert set(report["hosts"]) == {"node01", "node02"}
+    assert report["hosts"]["node02"]["pr"]["ns_per_day"] == pytest.approx(300.0)
+    assert list(report["versions"]) == ["GROMACS 2023.3 / CUDA 12.20"]
+    assert report["cycles"]["pr"]["Total"]["wall_s"] == pytest.approx(2 * (18.22 + 15.0))
+    assert all("cycles" not in run for run in report["runs"])
+
+
+def test_find_slow_runs():
+    runs = [_run(0, "node01", 100.0), _run(1, "node01", 98.0), _run(2, "node02", 60.0), _run(3, "node01", 99.0)]
+    runs.append(_run(0, "node02", 10.0, step="heat"))  # a single run of a step is not compared
+    (slow,) = find_slow_runs(runs)
+    assert (slow["system"], slow["host"]) == (2, "node02")
+    assert slow["median_ns_per_day"] == pytest.approx(98.5)
+
+
+def test_write_performance_report(workdir):
+    setting = {"general": {"workdir": workdir, "name": "job"}}
+    path = write_performance_report(setting, [0, 1], ["pr"])
+    assert path == workdir / "job_performance.json"
+    report = json.loads(path.read_text())
+    assert report["name"] == "job" and len(report["runs"]) == 4
+    assert [slow["host"] for slow in report["slow"]] == ["node02", "node02"]
+    text = path.with_suffix(".txt").read_text()
+    assert "host: node02" in text and "Wait GPU NB local" in text
+    assert write_performance_report({"general": {"workdir": workdir / "empty", "name": "job"}}, [0], ["pr"]) is None
@@ -0,0 +1,103 @@
+import json
+from pathlib import Path
+
+import gridData
+import numpy as np
+import pytest
+
+from script.probe_table import ProbeTable, extract_probe_table, regrid
+from script.utilities.Bio import PDB as uPDB
+from script.utilities.executable.cpptraj import grid_voxel
+from script.utilities.fake_executable.cpptraj import _grid
+
+REF_STRUCT = Path("script/test_data/tripeptide.pdb")
+PROBE_ATOMS = [("C1", 0.0), ("H1", 1.0), ("VIS", 0.5)]
+
+
+def _write_trajectory(path: Path, n_frames: int, n_probes: int, seed: int = 0) -> np.ndarray:
+    """write a cpptraj-like multi-model pdb, returning probe coordinates (n_frames, n_probes, n_atoms, 3)"""
+    rng = np.random.default_rng(seed)
+    center = uPDB.get_attr(uPDB.get_structure(REF_STRUCT), "coord").mean(axis=0)
+    coords = (
+        center + rng.uniform(-4, 4, size=(n_frames, n_probes, 1, 3)) + np.array([[d, 0, 0] for _, d in PROBE_ATOMS])
+    )
+    with open(path, "w") as fout:
+        for frame in range(n_frames):
+            fout.write(f"MODEL {frame + 1:8d}\n")
+            fout.write("CRYST1   40.000   40.000   50.000  90.00  90.00  90.00 P 1           1\n")
+            fout.write("ATOM      1  CA  ALA     1       0.000   0.000   0.000  1.00  0.00\n")
+            serial = 2
+            for probe in range(n_probes):
+                for (name, _), xyz in zip(PROBE_ATOMS, coords[frame, probe]):
+                    fout.write(
+                        f"ATOM  {serial:5d}  {name:<3s} A11  {probe + 2:4d}    {xyz[0]:8.3f}{xyz[1]:8.3f}{xyz[2]:8.3f}  1.00  0.00\n"
+                    )
+                    serial += 1
+            fout.write("ENDMDL\n")
+        fout.write("END\n")
+    return np.round(coords, 3)
+
+
+@pytest.fixture
+def table(tmp_path):
+    coords = _write_trajectory(tmp_path / "TEST_woWAT_10ps.pdb", n_frames=25, n_probes=4)
+    extract_probe_table(tmp_path / "TEST_woWAT_10ps.pdb", "A11", tmp_path / "TEST_probe_table", frames_per_shard=10)
+    return ProbeTable(tmp_path / "TEST_probe_table"), coords
+
+
+def test_extract_probe_table(table):
+    table, coords = table
+    assert table.n_frames == 25
+    assert len(table.meta["shards"]) == 3
+    assert table.last_volume == pytest.approx(40 * 40 * 50)
+    shards = list(table.iter_shards())
+    xyz = np.concatenate([s["xyz"] for s in shards])
+    assert xyz.dtype == np.float32
+    np.testing.assert_allclose(xyz, coords.reshape(-1, 3), atol=1e-3)
+    assert set(np.concatenate([s["frame"] for s in shards])) == set(range(25))
+
+
+def test_count_grid(table):
+    table, coords = table
+    center = coords.reshape(-1, 3).mean(axis=0)
+    grid = table.count_grid("(!@VIS)&(!@H*)", center, box_size=10, interval=0.5)
+    assert grid.grid.shape == (20, 20, 20)
+    heavy = coords[:, :, 0].reshape(-1, 3)
+    inside = np.all(np.abs(heavy - center) < 5, axis=1)
+    assert grid.grid.sum() == inside.sum()
+    np.testing.assert_allclose(grid.origin, center - 5 + 0.25)
+    assert table.num_probe_atoms("(!@VIS)&(!@H*)") == 4
+    assert table.num_probe_atoms("(!@VIS)") == 8
+
+
+@pytest.mark.parametrize("box_size, interval", [(10, 0.5), (9, 1.5), (12, 1.0)])
+def test_count_grid_matches_cpptraj(table, tmp_path, box_size, interval):
+    table, coords = table
+    center = coords.reshape(-1, 3).mean(axis=0)
+    voxel = [str(v) for v in grid_voxel(box_size, interval)]
+    # the grid command of cpptraj_pmap.in run by the fake cpptraj
+    _grid(str(tmp_path / "cpptraj.dx"), voxel + ["gridcenter", *map(str, center)], coords[:, :, 0], np.full(4, True))
+    expected = gridData.Grid(str(tmp_path / "cpptraj.dx"))
+    grid = table.count_grid("(!@VIS)&(!@H*)", center, box_size=box_size, interval=interval)
+    assert grid.grid.shape == expected.grid.shape == (round(box_size / interval),) * 3
+    np.testing.assert_allclose(grid.delta, expected.delta)
+    np.testing.assert_allclose(grid.origin, expected.origin, atol=1e-6)
+    np.testing.assert_allclose(grid.grid, expected.grid)
+
+
+def test_regrid(table, tmp_path):
+    setting_pmap = {
+        "map_size": 12,
+        "interval": 1.0,
+        "valid_dist": 5.0,
+        "normalization": "snapshot",
+        "maps": [{"suffix": "nVH", "selector": "(!@VIS)&(!@H*)"}, {"suffix": "nV", "selector": "(!@VIS)"}],
+    }
+    paths = regrid(
+        tmp_path, {"name": "TEST"}, {"protein": {"pdb": REF_STRUCT}}, setting_pmap, tmp_path / "TEST_probe_table"
+    )
+    assert [Path(p).name for p in paths] == ["PMAP_TEST_nVH.dx", "PMAP_TEST_nV.dx"]
+    count = gridData.Grid(str(tmp_path / "TEST_nV.dx")).grid
+    pmap = gridData.Grid(paths[1]).grid
+    valid = pmap >= 0
+    np.testing.assert_allclose(pmap[valid], count[valid] / 25)
@@ -6,6 +6,7 @@ import numpy as np
 
 from script.resenv import resenv
 from script.utilities.Bio import PDB as uPDB
+from script.utilities.sparse_grid import SparseGrid
 
 
 class TestResenv(TestCase):
@@ -26,6 +27,13 @@ class TestResenv(TestCase):
         for model, expected_model in zip(struct, expected_struct):  # type: ignore
             np.testing.assert_array_almost_equal(uPDB.get_attr(model, "coord"), uPDB.get_attr(expected_model, "coord"))
 
+    def test_sparse_grid(self):
+        struct = resenv(SparseGrid.from_grid(self.grid), self.trajectory, self.resn, [" CB "], threshold=0.001)
+        expected_struct = uPDB.get_structure(self.expected_resenv_pdb)
+        self.assertEqual(len(struct), len(expected_struct))
+        for model, expected_model in zip(struct, expected_struct):  # type: ignore
+            np.testing.assert_array_almost_equal(uPDB.get_attr(model, "coord"), uPDB.get_attr(expected_model, "coord"))
+
     def test_invalid_resn(self):
         with self.assertRaises(ValueError):
             resenv(self.grid, self.trajectory, "INVALID_RESN", [" CB "])
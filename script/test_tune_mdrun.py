@@ -0,0 +1,93 @@
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from script.tune_mdrun import candidate_options, format_options, parse_performance, tune_mdrun
+
+# ns/day depends on the offloading options; "-pme cpu" fails as an unsupported combination
+FAKE_GMX = """#!/bin/sh
+echo "$@" >> gmx_calls
+out=""
+log=""
+prev=""
+for arg in "$@" ; do
+  case $prev in
+    -o) out=$arg ;;
+    -g) log=$arg ;;
+    -deffnm) out=$arg.gro ;;
+  esac
+  prev=$arg
+done
+case $1 in
+  grompp) touch $out ;;
+  mdrun)
+    [ -n "$out" ] && touch $out
+    case "$*" in *"-pme cpu"*) exit 1 ;; esac
+    if [ -n "$log" ] ; then
+      perf=100.0
+      case "$*" in *"-update gpu"*) perf=180.5 ;; esac
+      case "$*" in *"-ntmpi 2"*) perf=120.0 ;; esac
+      printf "Performance:  %s  0.133\\n" $perf > $log
+    fi
+    ;;
+esac
+exit 0
+"""
+
+
+def test_parse_performance(tmp_path):
+    log = tmp_path / "md.log"
+    log.write_text("               (ns/day)    (hour/ns)\nPerformance:      123.456        0.194\n")
+    assert parse_performance(log) == pytest.approx(123.456)
+    log.write_text("Received the TERM signal\n")
+    assert parse_performance(log) is None
+    assert parse_performance(tmp_path / "notfound.log") is None
+
+
+def test_candidate_options():
+    assert candidate_options(8, use_gpu=False) == [
+        {"-ntmpi": "1", "-ntomp": "8", "-pin": "on"},
+        {"-ntmpi": "2", "-ntomp": "4", "-pin": "on"},
+        {"-ntmpi": "4", "-ntomp": "2", "-pin": "on"},
+    ]
+    options = [format_options(o) for o in candidate_options(2, use_gpu=True)]
+    assert options[0] == "-ntmpi 1 -ntomp 2 -pin on -nb gpu -pme gpu -update gpu"
+    assert "-ntmpi 2 -ntomp 1 -pin on -nb gpu -pme gpu -update cpu -npme 1" in options
+    assert all("-ntmpi 2" not in o or "-update gpu" not in o for o in options)
+    # concurrent runs on a node are not pinned to the same cores
+    assert all("-pin" not in o for o in candidate_options(8, use_gpu=True, pin=False))
+
+
+def test_tune_mdrun(tmp_path):
+    gmx = tmp_path / "fake_gmx"
+    gmx.write_text(FAKE_GMX)
+    gmx.chmod(0o755)
+    simdir = tmp_path / "simulation"
+    simdir.mkdir()
+    (simdir / "input.gro").write_text("test\n 1234\n")
+    cache = tmp_path / "cache" / "tuning.json"
+
+    with patch("script.tune_mdrun.get_gpu_name", return_value="FakeGPU"):
+        options = tune_mdrun(simdir, "pr", gmx, 2, 0, cache_path=cache, minimization_steps=["min1", "min2"])
+        assert options == "-ntmpi 1 -ntomp 2 -pin on -nb gpu -pme gpu -update gpu"
+        calls = (simdir / "gmx_calls").read_text().splitlines()
+        # minimized structures are chained to the benchmarked step
+        assert calls[2].startswith("grompp") and f"-c {simdir / 'tune' / 'min1.gro'}" in calls[2]
+        assert calls[4].startswith("grompp -maxwarn 1 -f pr.mdp") and "min2.gro" in calls[4]
+
+        entry = list(json.loads(cache.read_text()).values())[0]
+        assert entry["ns_per_day"] == pytest.approx(180.5)
+        assert sum(r["ns_per_day"] is None for r in entry["results"]) == 2  # "-pme cpu" failed
+        assert list(json.loads(cache.read_text()))[0].endswith("|FakeGPU|1234")
+
+        # the second call reads the cache without benchmarks
+        n_calls = len(calls)
+        assert tune_mdrun(simdir, "pr", gmx, 2, 0, cache_path=cache) == options
+        assert len((simdir / "gmx_calls").read_text().splitlines()) == n_calls
+
+        # concurrent runs are tuned without "-pin on" (and not read from the cache of a single run)
+        options = tune_mdrun(simdir, "pr", gmx, 2, 0, cache_path=cache, concurrent_runs=2)
+        assert options == "-ntmpi 1 -ntomp 2 -nb gpu -pme gpu -update gpu"
+        assert len((simdir / "gmx_calls").read_text().splitlines()) > n_calls
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+
+import json
+import os
+import platform
+import re
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .utilities.GPUtil import get_gpu_name
+from .utilities.logger import logger
+
+VERSION = "1.0.0"
+
+DEFAULT_CACHE = Path("~/.cache/exprorer_msmd/mdrun_tuning.json").expanduser()
+
+# steps of each benchmark run (counters are reset at the half, see "-resethway")
+BENCHMARK_NSTEPS = 5000
+
+
+def get_cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as fin:
+            for line in fin:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def count_atoms(gro: Path) -> int:
+    with open(gro) as fin:
+        fin.readline()
+        return int(fin.readline())
+
+
+def hardware_key(n_atoms: int, gpuid: int) -> str:
+    """key of the tuning cache: (CPU model, GPU model, the number of atoms)"""
+    return f"{get_cpu_model()}|{get_gpu_name(gpuid) or 'CPU'}|{n_atoms}"
+
+
+def candidate_options(ncpus: int, use_gpu: bool, pin: bool = True) -> List[Dict[str, str]]:
+    """
+    a small search space of mdrun options
+    (thread-MPI ranks, OpenMP threads, pinning and offloading of nonbonded, PME and update)
+    pin: "-pin on" (only for a single run on a node: concurrent runs would be pinned to the same cores)
+    """
+    candidates = []
+    for ntmpi in [1, 2, 4]:
+        if ntmpi > ncpus or ncpus % ntmpi != 0:
+            continue
+        base = {"-ntmpi": str(ntmpi), "-ntomp": str(ncpus // ntmpi)}
+        if pin:
+            base["-pin"] = "on"
+        if not use_gpu:
+            candidates.append(dict(base))
+            continue
+        offloads = [
+            {"-nb": "gpu", "-pme": "gpu", "-update": "gpu"},
+            {"-nb": "gpu", "-pme": "gpu", "-update": "cpu"},
+            {"-nb": "gpu", "-pme": "cpu", "-update": "cpu"},
+        ]
+        for offload in offloads:
+            option = dict(base, **offload)
+            if ntmpi > 1 and offload["-pme"] == "gpu":
+                option["-npme"] = "1"  # PME on GPU requires a single PME rank
+            if ntmpi > 1 and offload["-update"] == "gpu":
+                continue  # GPU update with domain decomposition is not supported by old versions
+            candidates.append(option)
+    return candidates
+
+
+def format_options(options: Dict[str, str]) -> str:
+    return " ".join(f"{key} {value}" for key, value in options.items())
+
+
+def parse_performance(log: Path) -> Optional[float]:
+    """
+    parse ns/day from a mdrun log file ("Performance:  <ns/day>  <hour/ns>")
+    output:
+        ns/day, or None if the run did not finish
+    """
+    if not log.exists():
+        return None
+    ret = None
+    with open(log) as fin:
+        for line in fin:
+            m = re.match(r"^Performance:\s+([0-9.]+)", line)
+            if m:
+                ret = float(m.group(1))
+    return ret
+
+
+def load_cache(cache_path: Path) -> dict:
+    if not cache_path.exists():
+        return {}
+    try:
+        return json.loads(cache_path.read_text())
+    except json.JSONDecodeError:
+        logger.warn(f"broken mdrun tuning cache is ignored: {cache_path}")
+        return {}
+
+
+def save_cache(cache_path: Path, cache: dict) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(cache, indent=1))
+    os.replace(tmp_path, cache_path)  # other jobs may read the cache at the same time
+
+
+def benchmark(
+    tpr: Path, options: Dict[str, str], exe_gromacs: Path, gpuid: int, log: Path, nsteps: int = BENCHMARK_NSTEPS
+) -> Optional[float]:
+    """run a short mdrun and return ns/day (None if the combination does not work)"""
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES=str(gpuid) if gpuid >= 0 else "")
+    env.pop("OMP_NUM_THREADS", None)
+    command = [str(exe_gromacs), "mdrun", "-s", str(tpr), "-nsteps", str(nsteps), "-resethway", "-noconfout"]
+    command += ["-g", str(log), "-e", str(log.with_suffix(".edr")), "-cpo", str(log.with_suffix(".cpt"))]
+    command += format_options(options).split()
+    result = subprocess.run(command, cwd=log.parent, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        logger.debug(f"benchmark failed: {' '.join(command)}\n{result.stderr[-1000:]}")
+        return None
+    return parse_performance(log)
+
+
+def _prepare_benchmark(
+    simdirpath: Path, step_name: str, minimization_steps: List[str], exe_gromacs: Path, ncpus: int, tunedir: Path
+) -> Path:
+    """
+    generate a tpr file of the benchmarked step from a minimized structure
+    (the input structure may have clashes between probes)
+    """
+
+    def run(command: List[str]) -> None:
+        subprocess.run([str(exe_gromacs)] + command, cwd=simdirpath, capture_output=True, check=True)
+
+    def grompp(name: str, gro: Path) -> Path:
+        tpr = tunedir / f"{name}.tpr"
+        command = ["grompp", "-maxwarn", "1", "-f", f"{name}.mdp", "-o", str(tpr), "-po", str(tunedir / "mdout.mdp")]
+        run(command + ["-c", str(gro), "-r", str(gro), "-p", "input.top", "-n", "index.ndx"])
+        return tpr
+
+    gro = Path("input.gro")
+    for name in minimization_steps:
+        run(["mdrun", "-nt", str(ncpus), "-s", str(grompp(name, gro)), "-deffnm", str(tunedir / name)])
+        gro = tunedir / f"{name}.gro"
+    tpr = grompp(step_name, gro)
+    return tpr
+
+
+def tune_mdrun(
+    simdirpath: Path,
+    step_name: str,
+    exe_gromacs: Path,
+    ncpus: int,
+    gpuid: int,
+    cache_path: Path = DEFAULT_CACHE,
+    minimization_steps: List[str] = [],
+    nsteps: int = BENCHMARK_NSTEPS,
+    concurrent_runs: int = 1,
+) -> str:
+    """
+    Find the fastest mdrun options for a prepared simulation directory with short benchmark runs of a step,
+    or read them from the cache of the same hardware and system size.
+    input:
+        step_name: the benchmarked step (usually the production run)
+        minimization_steps: steps run before the benchmarks to remove clashes in the input structure
+        concurrent_runs: the number of simulations running at once on the node with the options
+                         ("-pin on" is not used for more than one run)
+    The benchmarks run alone on the node, so that their ns/day is higher than that of concurrent runs
+    (sharing memory bandwidth and the CPU); they are used only to rank the options.
+    output:
+        mdrun options (e.g. "-ntmpi 1 -ntomp 8 -pin on -nb gpu -pme gpu -update gpu"),
+        or "" if no combination works
+    """
+    key = hardware_key(count_atoms(simdirpath / "input.gro"), gpuid)
+    cache = load_cache(cache_path)
+    if key in cache and cache[key]["ncpus"] == ncpus and cache[key].get("concurrent_runs", 1) == concurrent_runs:
+        logger.info(f"mdrun options are read from {cache_path}: {cache[key]['options']}")
+        return cache[key]["options"]
+
+    tunedir = simdirpath / "tune"
+    tunedir.mkdir(exist_ok=True)
+    try:
+        tpr = _prepare_benchmark(simdirpath, step_name, minimization_steps, exe_gromacs, ncpus, tunedir)
+    except subprocess.CalledProcessError as e:
+        logger.warn(f"mdrun tuning failed ({' '.join(e.cmd)}): GROMACS defaults are used")
+        return ""
+
+    results = []
+    for k, options in enumerate(candidate_options(ncpus, use_gpu=gpuid >= 0, pin=concurrent_runs == 1)):
+        ns_per_day = benchmark(tpr, options, exe_gromacs, gpuid, tunedir / f"bench{k}.log", nsteps)
+        logger.info(f"mdrun tuning: {format_options(options)} => {ns_per_day} ns/day")
+        results.append({"options": format_options(options), "ns_per_day": ns_per_day})
+
+    succeeded = [r for r in results if r["ns_per_day"] is not None]
+    if len(succeeded) == 0:
+        logger.warn("mdrun tuning failed: GROMACS defaults are used")
+        return ""
+    best = max(succeeded, key=lambda r: r["ns_per_day"])
+    logger.info(f"mdrun tuning: the best options are {best['options']} ({best['ns_per_day']} ns/day)")
+
+    cache = load_cache(cache_path)  # reload (other jobs may have updated it)
+    cache[key] = {
+        "options": best["options"],
+        "ns_per_day": best["ns_per_day"],
+        "ncpus": ncpus,
+        "concurrent_runs": concurrent_runs,
+        "results": results,
+    }
+    save_cache(cache_path, cache)
+    return best["options"]
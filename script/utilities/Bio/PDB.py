@@ -9,13 +9,15 @@ Authors: Keisuke Yanagisawa
 """
 import collections
 import gzip
+import hashlib
 import io
 import os
 import tempfile
+import threading
 import warnings
 from collections.abc import Iterable
 from pathlib import Path
-from typing import Any, Callable, List, Literal, Optional, Union
+from typing import Any, Callable, Dict, List, Literal, Optional, Union
 
 import numpy as np
 import numpy.typing as npt
@@ -485,11 +487,18 @@ _ATOMIC_RADII.update(
 )
 
 
+_EXCLUDE_VOLUME_CACHE: Dict[str, float] = {}
+_EXCLUDE_VOLUME_LOCK = threading.Lock()
+
+
 def estimate_exclute_volume(prot: Union[Structure, Model]) -> float:
     """
     VdW半径に基づいてタンパク質の排除体積を計算
     タンパク質は原子種類に応じて処理し、
     溶媒は炭素原子1つ分の大きさであるとする
+
+    同一の構造（座標と半径が同一）に対する計算結果はメモ化され、
+    Packmol による系の構築や GFE の正規化で再利用される。
     """
     coords = []
     radii = []
@@ -497,10 +506,18 @@ def estimate_exclute_volume(prot: Union[Structure, Model]) -> float:
         if not atom.get_parent().resname in ["HOH", "WAT"]:
             coords.append(atom.get_coord())
             radii.append(_ATOMIC_RADII[atom.element])
-    coords = np.array(coords)
-    radii = np.array(radii)
+    coords = np.array(coords, dtype=np.float32)
+    radii = np.array(radii, dtype=np.float64)
     radii += _ATOMIC_RADII["C"]  # solvents' VdW radius: estimated by carbon radius.
-    return estimate_volume(coords, radii)
+
+    key = hashlib.sha1(coords.tobytes() + radii.tobytes()).hexdigest()
+    with _EXCLUDE_VOLUME_LOCK:
+        if key in _EXCLUDE_VOLUME_CACHE:
+            return _EXCLUDE_VOLUME_CACHE[key]
+    volume = estimate_volume(coords, radii)
+    with _EXCLUDE_VOLUME_LOCK:
+        _EXCLUDE_VOLUME_CACHE[key] = volume
+    return volume
 
 
 class Selector(PDB.Select):
@@ -3,8 +3,6 @@ import os
 import subprocess
 import sys
 
-import GPUtil
-
 from .logger import logger
 
 
@@ -24,6 +22,8 @@ def get_gpuids(ignore_cuda_visible_devices=False):
             list of int:
                     A list of GPU IDs to be used, or [-1] if no GPUs are available.
     """
+    import GPUtil  # slow to import (distutils)
+
     gpuids = set(GPUtil.getAvailable(maxLoad=math.inf, maxMemory=math.inf, limit=sys.maxsize))
     logger.info(f"{len(gpuids)} GPUs are detected")
     
@@ -63,3 +63,17 @@ def is_mps_control_running() -> bool:
             return True
     except subprocess.CalledProcessError:
         return False
+
+
+def get_gpu_name(gpuid: int) -> str:
+    """
+    Return the model name of a GPU ("" for CPU-only mode or an unknown GPU ID)
+    """
+    if gpuid < 0:
+        return ""
+    import GPUtil
+
+    for gpu in GPUtil.getGPUs():
+        if gpu.id == gpuid:
+            return gpu.name
+    return ""
@@ -0,0 +1,126 @@
+"""
+Geometry of periodic boxes (cubic, rhombic dodecahedron and truncated octahedron)
+
+The box size is the distance between a molecule and its nearest periodic images,
+which is the edge length of the cubic box.
+A rhombic dodecahedron (truncated octahedron) has the same image distance
+with 71% (77%) of the volume of the cube.
+Box vectors follow the AMBER/GROMACS convention (a along x, b in the xy-plane),
+and the atoms are placed in the Wigner-Seitz cell around the origin.
+"""
+
+import itertools
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+# box angles (alpha, beta, gamma) in degree
+BOX_ANGLES = {
+    "cubic": (90.0, 90.0, 90.0),
+    "dodecahedron": (60.0, 60.0, 90.0),  # "xy-square" of gmx editconf
+    "octahedron": (109.4712206, 109.4712206, 109.4712206),
+}
+
+# lattice vectors i*a + j*b + k*c (i, j, k = -1, 0, 1) including all faces of the cells above
+_LATTICE_INDICES = np.array([v for v in itertools.product((-1, 0, 1), repeat=3) if any(v)], dtype=np.float64)
+
+
+def box_angles(shape: str) -> Tuple[float, float, float]:
+    if shape not in BOX_ANGLES:
+        raise ValueError(f"Invalid box shape: {shape} (choose from {', '.join(BOX_ANGLES)})")
+    return BOX_ANGLES[shape]
+
+
+def box_vectors(shape: str, size: float) -> npt.NDArray[np.float_]:
+    """
+    output:
+        (3, 3) array of box vectors a, b, c (lower triangular)
+    """
+    alpha, beta, gamma = np.radians(box_angles(shape))
+    a = [size, 0.0, 0.0]
+    b = [size * np.cos(gamma), size * np.sin(gamma), 0.0]
+    cx = size * np.cos(beta)
+    cy = size * (np.cos(alpha) - np.cos(beta) * np.cos(gamma)) / np.sin(gamma)
+    c = [cx, cy, np.sqrt(size**2 - cx**2 - cy**2)]
+    vectors = np.array([a, b, c])
+    vectors[np.abs(vectors) < 1e-10 * size] = 0.0
+    return vectors
+
+
+def box_volume(shape: str, size: float) -> float:
+    return float(abs(np.linalg.det(box_vectors(shape, size))))
+
+
+def cell_faces(shape: str, size: float) -> npt.NDArray[np.float_]:
+    """
+    lattice vectors v defining the faces (v . r <= |v|^2 / 2) of the Wigner-Seitz cell
+    output:
+        (n_faces, 3) array (6 for cubic, 12 for dodecahedron and 14 for octahedron)
+    """
+    lattice = _LATTICE_INDICES @ box_vectors(shape, size)
+    half_sq = np.sum(lattice**2, axis=1) / 2
+    # v is a face if v/2 is strictly inside the half spaces of all other lattice vectors
+    proj = lattice @ (lattice / 2).T  # [u, v] = u . v/2
+    inside = proj < half_sq[:, None] - 1e-6 * size**2
+    np.fill_diagonal(inside, True)
+    return lattice[np.all(inside, axis=0)]
+
+
+def inside_cell(coords: npt.ArrayLike, shape: str, size: float, margin: float = 0.0) -> npt.NDArray[np.bool_]:
+    """
+    whether points are inside the Wigner-Seitz cell shrunk by margin
+    """
+    faces = cell_faces(shape, size)
+    norms = np.linalg.norm(faces, axis=1)
+    dist = np.asarray(coords, dtype=np.float64) @ (faces / norms[:, None]).T  # distance along the face normals
+    return np.all(dist <= norms / 2 - margin, axis=-1)
+
+
+def cell_extent(shape: str, size: float) -> npt.NDArray[np.float_]:
+    """
+    half widths of the bounding box of the Wigner-Seitz cell
+    """
+    faces = cell_faces(shape, size)
+    rhs = np.sum(faces**2, axis=1) / 2
+    extent = np.zeros(3)
+    for ids in itertools.combinations(range(len(faces)), 3):
+        mat = faces[list(ids)]
+        if abs(np.linalg.det(mat)) < 1e-8 * size**3:
+            continue
+        vertex = np.linalg.solve(mat, rhs[list(ids)])
+        if np.all(faces @ vertex <= rhs + 1e-6 * size**2):
+            extent = np.maximum(extent, np.abs(vertex))
+    return extent
+
+
+def wrap_to_cell(coords: npt.ArrayLike, shape: str, size: float) -> npt.NDArray[np.float_]:
+    """
+    translate points into the Wigner-Seitz cell by lattice vectors
+    output:
+        translation vectors of the points
+    """
+    coords = np.array(coords, dtype=np.float64).reshape(-1, 3)
+    faces = cell_faces(shape, size)
+    rhs = np.sum(faces**2, axis=1) / 2
+    shifts = np.zeros_like(coords)
+    for _ in range(100):
+        excess = (coords + shifts) @ faces.T / rhs  # > 1 outside the face
+        worst = np.argmax(excess, axis=1)
+        outside = excess[np.arange(len(coords)), worst] > 1 + 1e-9
+        if not np.any(outside):
+            break
+        shifts[outside] -= faces[worst[outside]]
+    return shifts
+
+
+def required_size(coords: npt.ArrayLike, shape: str, buffer: float) -> float:
+    """
+    the smallest box size at which the distance between the molecule and its periodic images
+    is at least 2 * buffer along every lattice vector (same as the cubic box of "solvateBox ... buffer")
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    lattice = _LATTICE_INDICES @ box_vectors(shape, 1.0)
+    lengths = np.linalg.norm(lattice, axis=1)
+    extents = np.ptp(coords @ (lattice / lengths[:, None]).T, axis=0)
+    return float(np.max((extents + 2 * buffer) / lengths))
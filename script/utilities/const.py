@@ -3,6 +3,15 @@ EXT_FRCMOD = ".frcmod"
 EXT_PDB = ".pdb"
 EXT_INP = ".in"
 EXT_PARM7 = ".parm7"
+EXT_DX = ".dx"
+EXT_NPZ = ".npz"
 VERSION = "1.1.3"
 
+# exit status of a job stopped by a preemption signal (the job script requeues it)
+REQUEUE_EXIT_CODE = 99
+
+WATERS = ["WAT", "HOH", "SOL"]
+# gromacs index group of non-water atoms (protein, probes and virtual atoms) written to production trajectories
+OUTPUT_GROUP = "woWAT"
+
 IONS = ["Na*", "NA*", "Cl*", "CL*", "Ca*", "CA*", "Mg*", "MG*", "Zn*", "ZN*", "Cu*", "CU*"]
@@ -0,0 +1,131 @@
+import fnmatch
+import re
+from typing import List, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+_TOKEN = re.compile(r"\s*(?:(?P<op>[!&|()])|(?P<sel>[:@][^!&|()\s]+))")
+
+
+def _tokenize(mask: str) -> List[str]:
+    tokens = []
+    pos = 0
+    mask = mask.strip()
+    while pos < len(mask):
+        m = _TOKEN.match(mask, pos)
+        if m is None:
+            raise ValueError(f"Invalid cpptraj mask: {mask}")
+        tokens.append(m.group("op") or m.group("sel"))
+        pos = m.end()
+    return tokens
+
+
+def _match_names(names: npt.NDArray, patterns: Sequence[str]) -> npt.NDArray[np.bool_]:
+    ret = np.zeros(len(names), dtype=bool)
+    for name in np.unique(names):
+        if any(fnmatch.fnmatchcase(name, p) for p in patterns):
+            ret |= names == name
+    return ret
+
+
+def _match_numbers(numbers: npt.NDArray, patterns: Sequence[str]) -> npt.NDArray[np.bool_]:
+    ret = np.zeros(len(numbers), dtype=bool)
+    for p in patterns:
+        first, _, last = p.partition("-")
+        ret |= (numbers >= int(first)) & (numbers <= int(last or first))
+    return ret
+
+
+class _Parser(object):
+    """
+    recursive descent parser of cpptraj atom masks
+    precedence: ! > & > |
+    """
+
+    def __init__(self, tokens: List[str], resnames: npt.NDArray, atomnames: npt.NDArray, resids: npt.NDArray):
+        self.tokens = tokens
+        self.pos = 0
+        self.resnames = resnames
+        self.atomnames = atomnames
+        self.resids = resids
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of cpptraj mask")
+        self.pos += 1
+        return token
+
+    def parse(self) -> npt.NDArray[np.bool_]:
+        ret = self.expr()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected token in cpptraj mask: {self.peek()}")
+        return ret
+
+    def expr(self) -> npt.NDArray[np.bool_]:
+        ret = self.term()
+        while self.peek() == "|":
+            self.next()
+            ret = ret | self.term()
+        return ret
+
+    def term(self) -> npt.NDArray[np.bool_]:
+        ret = self.factor()
+        while self.peek() == "&":
+            self.next()
+            ret = ret & self.factor()
+        return ret
+
+    def factor(self) -> npt.NDArray[np.bool_]:
+        token = self.next()
+        if token == "!":
+            return ~self.factor()
+        if token == "(":
+            ret = self.expr()
+            if self.next() != ")":
+                raise ValueError("Unbalanced parentheses in cpptraj mask")
+            return ret
+        if token[0] in ":@":
+            return self.selector(token)
+        raise ValueError(f"Unexpected token in cpptraj mask: {token}")
+
+    def selector(self, token: str) -> npt.NDArray[np.bool_]:
+        # ":RES@ATOM" selects atoms satisfying both
+        ret = np.ones(len(self.atomnames), dtype=bool)
+        for kind, body in re.findall(r"([:@])([^:@]+)", token):
+            patterns = body.split(",")
+            if kind == ":":
+                if all(re.fullmatch(r"\d+(-\d+)?", p) for p in patterns):
+                    ret &= _match_numbers(self.resids, patterns)
+                else:
+                    ret &= _match_names(self.resnames, patterns)
+            else:
+                if any(re.fullmatch(r"\d+(-\d+)?", p) for p in patterns):
+                    raise ValueError(f"Atom numbers are not supported: {token}")
+                ret &= _match_names(self.atomnames, patterns)
+        return ret
+
+
+def evaluate_mask(
+    mask: str, resnames: Sequence[str], atomnames: Sequence[str], resids: Sequence[int]
+) -> npt.NDArray[np.bool_]:
+    """
+    Evaluate a subset of the cpptraj atom mask syntax
+    (``:`` residue names/numbers, ``@`` atom names, wildcards ``*``/``?``, ``!``, ``&``, ``|`` and parentheses).
+    input:
+        mask: e.g. ":A11&(!@VIS)&(!@H*)"
+        resnames, atomnames, resids: per-atom attributes
+    output:
+        boolean array of selected atoms
+    """
+    parser = _Parser(
+        _tokenize(mask),
+        np.asarray(resnames, dtype=str),
+        np.asarray(atomnames, dtype=str),
+        np.asarray(resids, dtype=np.int64),
+    )
+    return parser.parse()
@@ -1,9 +1,12 @@
 import copy
 import os
+import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Union
+from typing import List, Optional, Tuple, Union
 
+import gridData
 import jinja2
 import numpy as np
 import numpy.typing as npt
@@ -11,8 +14,101 @@ import numpy.typing as npt
 from .. import const
 from ..logger import logger
 from ..pmd import convert as pmd_convert
+from ..pmd import count_parm7_atoms, strip_solvent
+from ..time_resolved_grid import write_time_resolved_grid
+from ..xtc import XTCReader, read_n_atoms
 from .execute import Command
 
+# chunks are aligned to the largest "trajout offset" of the template,
+# so that concatenated outputs are identical to those of a single run
+CHUNK_ALIGNMENT = 100
+
+# pdb trajectories written by each chunk, concatenated in order
+_CONCATENATED_PDBS = ["position_check2", "woWAT_500ps", "woWAT_10ps"]
+
+
+def split_frame_range(
+    start: int,
+    stop: int,
+    offset: int,
+    n_chunks: int,
+    align: int = CHUNK_ALIGNMENT,
+    chunk_frames: Optional[int] = None,
+) -> List[Tuple[int, int, int]]:
+    """
+    Split a cpptraj frame range (1-origin, inclusive) into contiguous chunks.
+    The number of frames of each chunk except the last one is a multiple of ``align``.
+    If ``chunk_frames`` is given, the range is split into chunks of ``chunk_frames`` frames
+    (``n_chunks`` and ``align`` are ignored).
+    output:
+        list of (start, stop, offset)
+    """
+    n_frames = (stop - start) // offset + 1
+    if n_frames <= 0:
+        return []
+    if chunk_frames is not None:
+        per_chunk = max(int(chunk_frames), 1)
+    else:
+        per_chunk = -(-n_frames // max(n_chunks, 1))  # ceil
+        per_chunk = -(-per_chunk // align) * align
+    chunks = []
+    for first in range(0, n_frames, per_chunk):
+        last = min(first + per_chunk, n_frames) - 1
+        chunks.append((start + first * offset, start + last * offset, offset))
+    return chunks
+
+
+def merge_count_grids(inpaths: List[Path], outpath: Path) -> Path:
+    """sum up partial count grids"""
+    merged = gridData.Grid(str(inpaths[0]))
+    merged.grid = merged.grid.astype(np.float64)
+    for path in inpaths[1:]:
+        merged.grid += gridData.Grid(str(path)).grid
+    merged.export(str(outpath), type="double")
+    return outpath
+
+
+def concat_pdb_trajectories(inpaths: List[Path], outpath: Path) -> Path:
+    """concatenate multi-model pdb files with renumbering MODEL records"""
+    model = 0
+    with open(outpath, "w") as fout:
+        for i, path in enumerate(inpaths):
+            with open(path) as fin:
+                for line in fin:
+                    if line.startswith("MODEL"):
+                        model += 1
+                        line = f"MODEL {model:8d}\n"
+                    elif line.rstrip() == "END" and i != len(inpaths) - 1:
+                        continue
+                    fout.write(line)
+    return outpath
+
+
+def merge_rmsd(inpaths: List[Path], outpath: Path) -> int:
+    """
+    concatenate cpptraj data files with renumbering frames
+    output:
+        the number of frames
+    """
+    frames = 0
+    with open(outpath, "w") as fout:
+        for i, path in enumerate(inpaths):
+            lines = open(path).readlines()
+            if i == 0:
+                fout.write(lines[0])  # header line
+            for line in lines[1:]:
+                frames += 1
+                values = line.split()[1:]
+                fout.write(f"{frames:8d} " + " ".join(values) + "\n")
+    return frames
+
+
+def grid_voxel(box_size: float, interval: float) -> List[Union[int, float]]:
+    """
+    "nx dx ny dy nz dz" of the grid command of cpptraj for a cubic box of box_size [A] with voxels of interval [A]
+    """
+    return [int(round(box_size / interval)), interval] * 3
+
 
 class Cpptraj(object):
     def __init__(self, debug: bool = False):
@@ -22,8 +118,19 @@ class Cpptraj(object):
     def _gen_parm7(self) -> None:
         self.parm7 = Path(tempfile.mkstemp(prefix=const.TMP_PREFIX, suffix=const.EXT_PARM7)[1])
         self.parm7, _ = pmd_convert(self.topology, self.parm7)
+        if os.path.splitext(str(self.trajectory))[1] == ".xtc":
+            # the production trajectory may be written without water ("strip_water")
+            n_atoms = read_n_atoms(self.trajectory)
+            if n_atoms != count_parm7_atoms(self.parm7):
+                strip_solvent(self.parm7, n_atoms)
 
-    def set(self, topology: Path, trajectory: Path, ref_struct: Path, probe_id: str) -> "Cpptraj":
+    def set(
+        self, topology: Path, trajectory: Path, ref_struct: Path, probe_id: str, box_shape: str = "cubic"
+    ) -> "Cpptraj":
+        """
+        box_shape: probes are imaged into the compact cell around the protein for non-cubic boxes
+        """
+        self.box_shape = box_shape
         self.topology = topology
         self.trajectory = trajectory
         self.ref_struct = ref_struct
@@ -42,28 +149,143 @@ class Cpptraj(object):
         traj_stop: Union[str, int] = "last",
         traj_offset: Union[str, int] = 1,
         maps: list = [{"suffix": "nVH", "selector": "(!@VIS)&(!@H*)"}],
+        n_workers: int = 1,
+        window_ns: Optional[float] = None,
     ):
+        """
+        n_workers: the number of cpptraj processes.
+                   If it is larger than 1, the frame range is split into chunks,
+                   and partial count grids (and other outputs) are merged.
+        window_ns: if given, count grids of every ``window_ns`` ns are also stored
+                   as a time-resolved grid ({prefix}_{suffix}_4d, see TimeResolvedGrid).
+        """
         # TODO: input "maps" variable should be a read-only list (shared between threads)
         maps = copy.deepcopy(maps)
         self.basedir = basedir
         self.prefix = prefix
-        self.voxel: list[Union[int, float]] = [box_size, interval] * 3  # x, y, z
+        self.voxel: list[Union[int, float]] = grid_voxel(box_size, interval)
         self.frame_info: tuple[Union[str, int], Union[str, int], Union[str, int]] = (traj_start, traj_stop, traj_offset)
-        for i in range(len(maps)):
-            maps[i]["atominfofile"] = Path(tempfile.mkstemp(suffix=".dat")[1])
+        self.box_center = box_center
 
         self._gen_parm7()
 
-        self.inp = Path(tempfile.mkstemp(prefix=const.TMP_PREFIX, suffix=const.EXT_INP)[1])
+        windows = self._windows(window_ns) if window_ns else []
+        chunks = windows if windows else self._chunks(n_workers)
+        if windows:
+            self._run_chunks(chunks, maps, n_workers, store=True)
+            maps = self.maps
+        elif len(chunks) <= 1:
+            self.inp, self.frames, self.last_volume, maps = self._run(self.basedir, self.frame_info, maps)
+        else:
+            self._run_chunks(chunks, maps, n_workers)
+            maps = self.maps
+
+        for i in range(len(maps)):
+            maps[i]["grid"] = self.basedir / f"{self.prefix}_{maps[i]['suffix']}.dx"
+        logger.debug(f"{self.trajectory}")
+
+        self.maps = maps
+
+        return self
+
+    def _chunks(self, n_workers: int) -> List[Tuple[int, int, int]]:
+        if n_workers <= 1:
+            return []
+        if os.path.splitext(str(self.trajectory))[1] != ".xtc":
+            logger.warn(f"frame-parallel gridding is available only for xtc files: {self.trajectory}")
+            return []
+        return split_frame_range(*self._frame_range(), n_workers)
+
+    def _frame_range(self) -> Tuple[int, int, int]:
+        start, stop, offset = self.frame_info
+        n_frames = XTCReader(self.trajectory).n_frames  # the frame index is reused by the other stages
+        stop = n_frames if stop == "last" else min(int(stop), n_frames)
+        return int(start), int(stop), int(offset)
+
+    def _windows(self, window_ns: float) -> List[Tuple[int, int, int]]:
+        """split the frame range into windows of ``window_ns`` ns"""
+        if os.path.splitext(str(self.trajectory))[1] != ".xtc":
+            logger.warn(f"time-resolved gridding is available only for xtc files: {self.trajectory}")
+            return []
+        start, stop, offset = self._frame_range()
+        times = XTCReader(self.trajectory).times
+        if len(times) < 2:
+            return split_frame_range(start, stop, offset, 1)
+        dt = float(times[1] - times[0]) * offset  # ps per analyzed frame
+        window_frames = max(int(round(window_ns * 1000 / dt)), 1)
+        return split_frame_range(start, stop, offset, 1, chunk_frames=window_frames)
+
+    def _run_chunks(self, chunks: List[Tuple[int, int, int]], maps: list, n_workers: int, store: bool = False) -> None:
+        """
+        store: chunks are time windows, and their count grids are stored as time-resolved grids
+        """
+        chunkdirs = [
+            Path(tempfile.mkdtemp(prefix=f"{const.TMP_PREFIX}_{self.prefix}_chunk{k}_", dir=self.basedir))
+            for k in range(len(chunks))
+        ]
+        logger.info(f"cpptraj: {len(chunks)} chunks {chunks} with {n_workers} workers")
+        with ThreadPoolExecutor(max_workers=max(n_workers, 1)) as executor:
+            results = list(executor.map(lambda args: self._run(*args), zip(chunkdirs, chunks, [maps] * len(chunks))))
+
+        if store:
+            times = XTCReader(self.trajectory).times
+            for map in maps:
+                write_time_resolved_grid(
+                    self.basedir / f"{self.prefix}_{map['suffix']}_4d",
+                    [gridData.Grid(str(d / f"{self.prefix}_{map['suffix']}.dx")) for d in chunkdirs],
+                    frames=[result[1] for result in results],
+                    frame_ranges=chunks,
+                    times=[(times[start - 1], times[stop - 1]) for start, stop, _ in chunks],
+                )
+
+        # occupancy counts are additive
+        for map in maps:
+            merge_count_grids(
+                [d / f"{self.prefix}_{map['suffix']}.dx" for d in chunkdirs],
+                self.basedir / f"{self.prefix}_{map['suffix']}.dx",
+            )
+        shutil.copy(chunkdirs[0] / f"{self.prefix}_position_check.pdb", self.basedir)
+        for name in _CONCATENATED_PDBS:
+            concat_pdb_trajectories(
+                [d / f"{self.prefix}_{name}.pdb" for d in chunkdirs], self.basedir / f"{self.prefix}_{name}.pdb"
+            )
+        self.frames = merge_rmsd([d / "rmsd.dat" for d in chunkdirs], self.basedir / "rmsd.dat")
+        self.last_volume = results[-1][2]  # the volume of the last frame
+        self.maps = results[0][3]  # the numbers of probe atoms do not depend on frames
+        if store:
+            for map in self.maps:
+                map["grid4d"] = self.basedir / f"{self.prefix}_{map['suffix']}_4d"
+        self.inp = results[0][0]
+        for inp, _, _, _ in results[1:]:
+            if not self.debug:
+                os.remove(inp)
+        if not self.debug:
+            for d in chunkdirs:
+                shutil.rmtree(d)
+
+    def _run(
+        self, basedir: Path, frame_info: Tuple[Union[str, int], Union[str, int], Union[str, int]], maps: list
+    ) -> Tuple[Path, int, float, list]:
+        """
+        run a cpptraj process
+        output:
+            input file, the number of frames, the volume of the last frame, maps
+        """
+        maps = copy.deepcopy(maps)  # maps are shared between chunks
+        for i in range(len(maps)):
+            maps[i]["atominfofile"] = Path(tempfile.mkstemp(suffix=".dat")[1])
+
+        inp = Path(tempfile.mkstemp(prefix=const.TMP_PREFIX, suffix=const.EXT_INP)[1])
         rmsdfile = Path("rmsd.dat")
         tmp_volumefile = Path(tempfile.mkstemp(suffix=".dat")[1])
+        box_center = self.box_center
 
         data = {
-            "basedir": str(self.basedir),
+            "basedir": str(basedir),
             "top": self.parm7,
             "traj": self.trajectory,
             "cid": self.probe_id,
-            "frame_info": " ".join([str(n) for n in self.frame_info]),
+            "frame_info": " ".join([str(n) for n in frame_info]),
             "ref": self.ref_struct,
             "map_voxel": " ".join([str(n) for n in self.voxel])
             + " gridcenter "
@@ -72,37 +294,32 @@ class Cpptraj(object):
             "maps": maps,
             "rmsdfile": str(rmsdfile),
             "tmp_volumefile": str(tmp_volumefile),
+            "familiar": self.box_shape != "cubic",
         }
 
         env = jinja2.Environment(loader=jinja2.FileSystemLoader(f"{os.path.dirname(__file__)}/template"))
         template = env.get_template("cpptraj_pmap.in")
-        with open(self.inp, "w") as fout:
+        with open(inp, "w") as fout:
             fout.write(template.render(data))
             logger.info(template.render(data))
-        command = Command(f"{self.exe} < {self.inp}")
+        command = Command(f"{self.exe} < {inp}")
         logger.debug(command)
         try:
             logger.info(command.run())
         except Exception as e:
-            Command(f"cat {self.inp}")
+            Command(f"cat {inp}")
             raise e
 
-        for i in range(len(maps)):
-            maps[i]["grid"] = self.basedir / f"{self.prefix}_{maps[i]['suffix']}.dx"
-
-        self.frames = len(open(f"{self.basedir}/{rmsdfile}").readlines()) - 1  # -1 for header line
-        self.last_volume = float(open(tmp_volumefile).readlines()[-1].split()[1])
+        frames = len(open(f"{basedir}/{rmsdfile}").readlines()) - 1  # -1 for header line
+        last_volume = float(open(tmp_volumefile).readlines()[-1].split()[1])
         os.system(f"rm {tmp_volumefile}")
         for i in range(len(maps)):
             maps[i]["num_probe_atoms"] = len(open(maps[i]["atominfofile"]).readlines()) - 1  # -1 for header line
             # os.system(f"rm {maps[i]['atominfofile']}")
             # del self.maps[i]["atominfofile"] # it makes errors with multiprocessing
             logger.debug(f"num_probe_atoms {i} {maps[i]['num_probe_atoms']} {maps[i]['atominfofile']}")
-        logger.debug(f"{self.trajectory}")
 
-        self.maps = maps
-
-        return self
+        return inp, frames, last_volume, maps
 
     def __del__(self):
 
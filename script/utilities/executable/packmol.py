@@ -1,4 +1,3 @@
-import collections
 import os
 import shutil
 import tempfile
@@ -11,39 +10,11 @@ import numpy as np
 from scipy import constants
 
 from .. import const
-from ..Bio.PDB import get_structure
+from ..Bio.PDB import estimate_exclute_volume, get_structure
+from ..box import box_angles, box_volume, cell_extent, cell_faces
 from ..logger import logger
-from ..scipy.spatial_func import estimate_volume
 from .execute import Command
 
-# obtained from biopython/Bio/PDB/SASA.py
-_ATOMIC_RADII = collections.defaultdict(lambda: 2.0)
-_ATOMIC_RADII.update(
-    {
-        "H": 1.200,
-        "HE": 1.400,
-        "C": 1.700,
-        "N": 1.550,
-        "O": 1.520,
-        "F": 1.470,
-        "NA": 2.270,
-        "MG": 1.730,
-        "P": 1.800,
-        "S": 1.800,
-        "CL": 1.750,
-        "K": 2.750,
-        "CA": 2.310,
-        "NI": 1.630,
-        "CU": 1.400,
-        "ZN": 1.390,
-        "SE": 1.900,
-        "BR": 1.850,
-        "CD": 1.580,
-        "I": 1.980,
-        "HG": 1.550,
-    }
-)
-
 
 class Packmol(object):
     def __init__(self, exe="packmol", debug=False):
@@ -69,11 +40,14 @@ class Packmol(object):
         residues = [residue for residue in struct.get_residues()]
         return len(residues) > 1
 
-    def set(self, protein_pdb: Path, cosolv_pdb: Path, box_size: float, molar: float):
+    def set(self, protein_pdb: Path, cosolv_pdb: Path, box_size: float, molar: float, box_shape: str = "cubic"):
         """
         protein_pdb: protein pdb file
         cosolv_pdb: cosolv pdb file
+        box_size: distance between periodic images (edge length of the cubic box)
+        box_shape: cubic, dodecahedron or octahedron (see utilities.box)
         """
+        box_angles(box_shape)  # validate the shape
         if molar < 0:
             raise ValueError("molar must be zero or positive value")
         elif molar == 0:
@@ -100,25 +74,20 @@ class Packmol(object):
         self.protein_pdb = protein_pdb
         self.cosolv_pdb = cosolv_pdb
         self.box_size = box_size
+        self.box_shape = box_shape
         self.molar = molar
         return self
 
-    def __estimate_protein_exclute_volume(self) -> float:
+    def _num_probes(self) -> int:
         """
-        VdW半径に基づいてタンパク質の排除体積を計算
-        タンパク質は原子種類に応じて処理し、
-        溶媒は炭素原子1つ分の大きさであるとする
+        determine the number of probe molecules
+        note: the generated system will shrink because of NPT-ensemble,
+              so the number of probe molecules is decreased by the factor of 0.8.
         """
-        coords = []
-        radii = []
-        for atom in get_structure(self.protein_pdb).get_atoms():
-            if not atom.get_parent().resname in ["HOH", "WAT"]:
-                coords.append(atom.get_coord())
-                radii.append(_ATOMIC_RADII[atom.element])
-        coords = np.array(coords)
-        radii = np.array(radii)
-        radii += _ATOMIC_RADII["C"]  # solvents' VdW radius: estimated by carbon radius.
-        return estimate_volume(coords, radii)
+        factor = 0.8
+        protein_volume = estimate_exclute_volume(get_structure(self.protein_pdb))
+        volume = box_volume(self.box_shape, self.box_size)
+        return int(constants.N_A * self.molar * (volume - protein_volume) * (10**-27) * factor)
 
     def run(self, box_pdb: Optional[Path] = None, seed=-1):
         self.box_pdb = (
@@ -135,17 +104,25 @@ class Packmol(object):
         tmp_pdb = Path(tempfile.mkstemp(prefix=const.TMP_PREFIX, suffix=const.EXT_PDB)[1])
         shutil.copy2(self.cosolv_pdb, tmp_pdb)
 
-        # determine the number of probe molecules
-        # note: the generated system will shrink because of NPT-ensemble,
-        #       so the number of probe molecules is decreased by the factor of 0.8.
-        factor = 0.8
-        protein_volume = self.__estimate_protein_exclute_volume()
-        num = int(constants.N_A * self.molar * (self.box_size**3 - protein_volume) * (10**-27) * factor)
+        num = self._num_probes()
 
         _, inputfile = tempfile.mkstemp(prefix=const.TMP_PREFIX, suffix=const.EXT_INP)
 
         _, inp = tempfile.mkstemp(prefix=const.TMP_PREFIX, suffix=const.EXT_INP)
-        probes = [{"pdb": tmp_pdb, "num": num, "size": self.box_size / 2}]
+        # the Wigner-Seitz cell: the bounding box and planes between the periodic images
+        planes = []
+        if self.box_shape != "cubic":
+            for v in cell_faces(self.box_shape, self.box_size):
+                norm = np.linalg.norm(v)
+                planes.append([*(v / norm).round(6), round(norm / 2, 4)])
+        probes = [
+            {
+                "pdb": tmp_pdb,
+                "num": num,
+                "size": cell_extent(self.box_shape, self.box_size).round(4).tolist(),
+                "planes": planes,
+            }
+        ]
 
         data = {
             "output": self.box_pdb,
@@ -1,8 +1,14 @@
+import shutil
 from pathlib import Path
 from unittest import TestCase
+from unittest.mock import patch
+
+import gridData
+import numpy as np
 
 from script.utilities.Bio import PDB as uPDB
-from script.utilities.executable.cpptraj import Cpptraj
+from script.utilities.executable.cpptraj import Cpptraj, split_frame_range
+from script.utilities.time_resolved_grid import TimeResolvedGrid
 
 # TODO: Add tests for cpptraj
 
@@ -38,3 +44,93 @@ class TestCpptraj(TestCase):
 
     def test_is_cpptraj_output_indentical(self):
         pass
+
+
+def test_split_frame_range():
+    assert split_frame_range(1, 1000, 1, 4) == [(1, 300, 1), (301, 600, 1), (601, 900, 1), (901, 1000, 1)]
+    assert split_frame_range(2001, 4001, 2, 3) == [(2001, 2799, 2), (2801, 3599, 2), (3601, 4001, 2)]
+    assert split_frame_range(1, 50, 1, 8) == [(1, 50, 1)]
+    assert split_frame_range(10, 5, 1, 2) == []
+
+
+def _write_chunk_outputs(basedir: Path, prefix: str, k: int, n_frames: int):
+    grid = gridData.Grid(np.full((2, 2, 2), k + 1.0), origin=[0, 0, 0], delta=[1, 1, 1])
+    grid.export(str(basedir / f"{prefix}_nVH.dx"), type="double")
+    for name in ["position_check", "position_check2", "woWAT_500ps", "woWAT_10ps"]:
+        with open(basedir / f"{prefix}_{name}.pdb", "w") as fout:
+            for model in range(n_frames):
+                fout.write(f"MODEL {model + 1:8d}\nATOM      1  C1  A11     1    {k:8.3f}   0.000   0.000\nENDMDL\n")
+            fout.write("END\n")
+    with open(basedir / "rmsd.dat", "w") as fout:
+        fout.write("#Frame ToREF\n")
+        for frame in range(n_frames):
+            fout.write(f"{frame + 1:8d} {0.1 * k:8.4f}\n")
+
+
+def test_run_chunks(tmp_path):
+    def fake_run(self, basedir, frame_info, maps):
+        k = int(frame_info[0]) // 100
+        n_frames = int(frame_info[1]) - int(frame_info[0]) + 1
+        _write_chunk_outputs(basedir, self.prefix, k, n_frames)
+        inp = tmp_path / f"chunk{k}.in"
+        inp.touch()
+        return inp, n_frames, 100.0 + k, [dict(m, num_probe_atoms=10) for m in maps]
+
+    cpptraj_obj = Cpptraj()
+    cpptraj_obj.basedir = tmp_path
+    cpptraj_obj.prefix = "TEST"
+    with patch.object(Cpptraj, "_run", fake_run):
+        cpptraj_obj._run_chunks([(0, 99, 1), (100, 199, 1), (200, 249, 1)], [{"suffix": "nVH"}], n_workers=2)
+
+    assert cpptraj_obj.frames == 250
+    assert cpptraj_obj.last_volume == 102.0
+    assert cpptraj_obj.maps[0]["num_probe_atoms"] == 10
+    np.testing.assert_array_equal(gridData.Grid(str(tmp_path / "TEST_nVH.dx")).grid, np.full((2, 2, 2), 6.0))
+
+    lines = open(tmp_path / "TEST_woWAT_10ps.pdb").read().splitlines()
+    assert lines.count("END") == 1
+    models = [line for line in lines if line.startswith("MODEL")]
+    assert len(models) == 250 and models[-1].split()[1] == "250"
+    rmsd = open(tmp_path / "rmsd.dat").read().splitlines()
+    assert len(rmsd) == 251 and rmsd[-1].split()[0] == "250"
+    assert len(open(tmp_path / "TEST_position_check.pdb").read().splitlines()) == 100 * 3 + 1
+    assert not list(tmp_path.glob(".tmp_TEST_chunk*"))  # removed
+
+
+def test_split_frame_range_windows():
+    assert split_frame_range(1, 250, 1, 1, chunk_frames=100) == [(1, 100, 1), (101, 200, 1), (201, 250, 1)]
+    assert split_frame_range(1, 9, 2, 1, chunk_frames=2) == [(1, 3, 2), (5, 7, 2), (9, 9, 2)]
+
+
+def test_run_windows(tmp_path):
+    def fake_run(self, basedir, frame_info, maps):
+        k = (int(frame_info[0]) - 1) // 2
+        n_frames = int(frame_info[1]) - int(frame_info[0]) + 1
+        _write_chunk_outputs(basedir, self.prefix, k, n_frames)
+        inp = tmp_path / f"chunk{k}.in"
+        inp.touch()
+        return inp, n_frames, 100.0 + k, [dict(m, num_probe_atoms=10) for m in maps]
+
+    trajectory = tmp_path / "trajectory.xtc"  # 6 frames, 0.4 ps per frame
+    shutil.copy("script/utilities/executable/test_data/cpptraj/trajectory.xtc", trajectory)
+    cpptraj_obj = Cpptraj()
+    cpptraj_obj.trajectory = trajectory
+    cpptraj_obj.basedir = tmp_path
+    cpptraj_obj.prefix = "TEST"
+    cpptraj_obj.frame_info = (1, "last", 1)
+    windows = cpptraj_obj._windows(0.0008)
+    assert windows == [(1, 2, 1), (3, 4, 1), (5, 6, 1)]
+    with patch.object(Cpptraj, "_run", fake_run):
+        cpptraj_obj._run_chunks(windows, [{"suffix": "nVH"}], n_workers=1, store=True)
+
+    assert cpptraj_obj.frames == 6
+    assert cpptraj_obj.maps[0]["grid4d"] == tmp_path / "TEST_nVH_4d"
+    grid4d = TimeResolvedGrid(tmp_path / "TEST_nVH_4d")
+    assert grid4d.shape == (3, 2, 2, 2)
+    np.testing.assert_array_equal(grid4d.frames, [2, 2, 2])
+    np.testing.assert_allclose(grid4d.times, [[0.0, 0.4], [0.8, 1.2], [1.6, 2.0]], atol=1e-6)
+    np.testing.assert_array_equal(grid4d[1], np.full((2, 2, 2), 2.0))
+    g, frames = grid4d.sum(1, 3)
+    np.testing.assert_array_equal(g.grid, np.full((2, 2, 2), 5.0))
+    assert frames == 4
+    np.testing.assert_array_equal(grid4d.sum()[0].grid, gridData.Grid(str(tmp_path / "TEST_nVH.dx")).grid)
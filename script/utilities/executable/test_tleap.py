@@ -2,6 +2,8 @@ import os
 import pytest
 from pathlib import Path
 from typing import Optional, List
+import numpy as np
+from script.utilities.box import cell_extent
 from script.utilities.executable.tleap import TLeap
 import subprocess
 
@@ -195,3 +197,28 @@ def test_tleap_run_with_ssbonds(tleap: TLeap, test_files: dict, tmp_path: Path):
         assert result is not None, "Execution result is None"
     except Exception as e:
         pytest.fail(f"tleap execution with SS bonds failed: {str(e)}")
+
+def test_tleap_buffer_of_box_shape(tleap: TLeap, test_files: dict):
+    """非立方体セルを覆う溶媒和バッファのテスト"""
+    tleap_instance = tleap.set(
+        cid="A11",
+        probe_path=test_files["probe_path"],
+        frcmod=test_files["frcmod_path"],
+        box_path=test_files["box_path"],
+        size=40.0,
+        ssbonds=[],
+        at="gaff",
+        box_shape="dodecahedron",
+    )
+    buffer = np.array([float(b) for b in tleap_instance._buffer(margin=0.0).split()])
+    coords = np.array([[float(line[30:38]), float(line[38:46]), float(line[46:54])]
+                       for line in TRIPEPTIDE_PDB_CONTENT.splitlines() if line.startswith("ATOM")])
+    lower, upper = coords.min(axis=0), coords.max(axis=0)
+    center = (lower + upper) / 2
+    # the solvated box covers the dodecahedron around the origin
+    assert np.all(center - (upper - lower) / 2 - buffer <= -cell_extent("dodecahedron", 40.0) + 1e-3)
+    assert np.all(center + (upper - lower) / 2 + buffer >= cell_extent("dodecahedron", 40.0) - 1e-3)
+
+    with pytest.raises(ValueError):
+        tleap.set("A11", test_files["probe_path"], test_files["frcmod_path"], test_files["box_path"], 40.0, [], "gaff",
+                  box_shape="sphere")
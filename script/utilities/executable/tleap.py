@@ -3,8 +3,10 @@ import tempfile
 from pathlib import Path
 
 import jinja2
+import numpy as np
 
 from .. import const
+from ..box import box_angles, cell_extent
 from ..logger import logger
 from .execute import Command
 
@@ -14,7 +16,13 @@ class TLeap(object):
         self.exe = os.getenv("TLEAP", "tleap")
         self.debug = debug
 
-    def set(self, cid, probe_path: Path, frcmod: Path, box_path: Path, size, ssbonds, at):
+    def set(self, cid, probe_path: Path, frcmod: Path, box_path: Path, size, ssbonds, at, box_shape: str = "cubic"):
+        """
+        box_shape: for dodecahedron / octahedron boxes, a rectangular box enclosing the cell is solvated
+                   (cut into the cell by utilities.pmd.cut_box)
+        """
+        box_angles(box_shape)  # validate the shape
+        self.box_shape = box_shape
         self.cid = cid
         self.probe_path = probe_path
         self.frcmod = frcmod
@@ -24,6 +32,23 @@ class TLeap(object):
         self.at = at
         return self
 
+    def _buffer(self, margin: float = 2.0) -> str:
+        """
+        solvation buffer from the bounding box of the solute (x, y, z) to cover the Wigner-Seitz cell around the origin
+        """
+        coords = np.array(
+            [
+                [float(line[30:38]), float(line[38:46]), float(line[46:54])]
+                for line in open(self.box_path)
+                if line.startswith(("ATOM", "HETATM"))
+            ]
+        )
+        lower, upper = coords.min(axis=0), coords.max(axis=0)
+        extent = cell_extent(self.box_shape, self.size)
+        # solvateBox places the solvent box around the center of the solute
+        buffer = np.abs((lower + upper) / 2) + extent - (upper - lower) / 2 + margin
+        return " ".join(f"{b:.3f}" for b in np.maximum(buffer, 0.0))
+
     def run(self, oprefix: str):
         self.oprefix = oprefix
         self.parm7 = Path(self.oprefix + ".parm7")
@@ -39,6 +64,7 @@ class TLeap(object):
             "SYSTEM_PATH": str(self.box_path),
             "PROBE_FRCMOD": str(self.frcmod),
             "SIZE": self.size,
+            "BUFFER": self._buffer() if self.box_shape != "cubic" else None,
         }
 
         env = jinja2.Environment(loader=jinja2.FileSystemLoader(f"{os.path.dirname(__file__)}/template"))
@@ -0,0 +1,70 @@
+"""
+Fake executables of GROMACS, tleap, packmol, cpptraj, parmchk2, mpirun and nvidia-smi
+
+They write outputs in the formats read by the pipeline without simulations, so that the whole pipeline
+(exprorer_msmd with many systems, multidir, preemption and resume, postprocess) runs on a laptop,
+for throughput and scaling tests of the orchestration and failure tests.
+
+    export PATH=$(python -c "from script.utilities.fake_executable import BIN_DIR; print(BIN_DIR)"):$PATH
+    export GMX=gmx TLEAP=tleap PACKMOL=packmol CPPTRAJ=cpptraj PARMCHK=parmchk2 MPIRUN=mpirun
+    (and general.executables.gromacs: gmx in the yaml file)
+
+or env = fake_env() for subprocesses.
+
+Options (environment variables, see common.option for the per-tool and per-subcommand variables):
+    FAKE_LATENCY: seconds of each call ("2", or "1-3" for uniform random numbers),
+                  e.g. FAKE_GMX_MDRUN_LATENCY=5 for the runs of mdrun
+    FAKE_FAILURE_RATE: probability of failures (exit code 1), e.g. FAKE_TLEAP_FAILURE_RATE=0.1
+    FAKE_FAIL_MATCH: regular expression of "{cwd} {tool} {arguments}" of the calls to fail,
+                     e.g. "system3/simulation GMX mdrun"
+    FAKE_SEED: seed of the latency and failures (reproducible per call and directory)
+    FAKE_CALL_LOG: file to append the calls to (json lines of time, pid, cwd, tool, args, latency and failure)
+    FAKE_GPUS: number of GPUs reported by nvidia-smi (default 1)
+    FAKE_GMX_MDRUN_MAX_FRAMES: maximum number of frames of a trajectory (the output interval is increased)
+"""
+
+import importlib
+import os
+from pathlib import Path
+from typing import List, Optional
+
+BIN_DIR = Path(__file__).parent / "bin"
+
+# tool: module implementing it
+TOOLS = {
+    "gmx": "gmx",
+    "tleap": "tleap",
+    "packmol": "packmol",
+    "cpptraj": "cpptraj",
+    "parmchk2": "misc",
+    "mpirun": "misc",
+    "nvidia-smi": "misc",
+}
+# environment variables selecting the executables of the wrappers and job scripts
+ENV_VARS = {
+    "GMX": "gmx",
+    "TLEAP": "tleap",
+    "PACKMOL": "packmol",
+    "CPPTRAJ": "cpptraj",
+    "PARMCHK": "parmchk2",
+    "MPIRUN": "mpirun",
+}
+
+
+def main(tool: str, argv: List[str]) -> int:
+    module = importlib.import_module(f".{TOOLS[tool]}", __name__)
+    return module.main(tool, argv) if TOOLS[tool] == "misc" else module.main(argv)
+
+
+def fake_env(env: Optional[dict] = None, **options) -> dict:
+    """
+    environment variables to run the pipeline with the fake executables
+    input:
+        env: base environment (default: os.environ)
+        options: FAKE_* options without the prefix, e.g. fake_env(gmx_mdrun_latency=2, seed=0)
+    """
+    ret = dict(os.environ if env is None else env)
+    ret["PATH"] = f"{BIN_DIR}{os.pathsep}{ret.get('PATH', '')}"
+    ret.update({key: str(BIN_DIR / tool) for key, tool in ENV_VARS.items()})
+    ret.update({f"FAKE_{key.upper()}": str(value) for key, value in options.items()})
+    return ret
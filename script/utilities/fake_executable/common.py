@@ -0,0 +1,114 @@
+"""
+Options shared by the fake executables (latency, failure injection and the call log)
+
+Options are read from environment variables, the most specific one first:
+    FAKE_{TOOL}_{SUBCOMMAND}_{OPTION}, FAKE_{TOOL}_{OPTION}, FAKE_{OPTION}
+e.g. FAKE_GMX_MDRUN_LATENCY, FAKE_GMX_LATENCY and FAKE_LATENCY for "gmx mdrun".
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# exit code of injected failures
+FAILURE_EXIT_CODE = 1
+
+
+def option(name: str, tool: str, subcommand: str = "", default: Optional[str] = None) -> Optional[str]:
+    keys = ([f"FAKE_{tool}_{subcommand}_{name}"] if subcommand else []) + [f"FAKE_{tool}_{name}", f"FAKE_{name}"]
+    for key in keys:
+        value = os.getenv(key.upper().replace("-", "_"))
+        if value is not None and value != "":
+            return value
+    return default
+
+
+def _rng(tool: str, subcommand: str, args: List[str]) -> random.Random:
+    """random numbers reproducible for FAKE_SEED and the same call in the same directory"""
+    seed = option("SEED", tool, subcommand)
+    if seed is None:
+        return random.Random()
+    return random.Random(f"{seed} {os.getcwd()} {tool} {' '.join(args)}")
+
+
+def latency(tool: str, subcommand: str, rng: random.Random) -> float:
+    """
+    seconds to wait: FAKE_..._LATENCY is a number ("2") or a range of uniform random numbers ("1-3")
+    """
+    value = option("LATENCY", tool, subcommand, "0")
+    low, _, high = value.partition("-")
+    if not high:
+        return float(low)
+    return rng.uniform(float(low), float(high))
+
+
+def should_fail(tool: str, subcommand: str, args: List[str], rng: random.Random) -> bool:
+    """
+    FAKE_..._FAILURE_RATE: probability of a failure
+    FAKE_FAIL_MATCH: regular expression of "{cwd} {tool} {args}" of calls to fail
+    """
+    pattern = option("FAIL_MATCH", tool, subcommand)
+    if pattern is not None and re.search(pattern, f"{os.getcwd()} {tool} {' '.join(args)}"):
+        return True
+    return rng.random() < float(option("FAILURE_RATE", tool, subcommand, "0"))
+
+
+def log_call(tool: str, args: List[str], **info) -> None:
+    """append a call as a json line to FAKE_CALL_LOG"""
+    path = os.getenv("FAKE_CALL_LOG")
+    if not path:
+        return
+    record = {"time": time.time(), "pid": os.getpid(), "cwd": os.getcwd(), "tool": tool, "args": args, **info}
+    with open(path, "a") as fout:  # a line is written at once (O_APPEND)
+        fout.write(json.dumps(record) + "\n")
+
+
+def run(tool: str, args: List[str], commands: Dict[str, Callable], default: Optional[Callable] = None) -> int:
+    """
+    run a subcommand (args[0] for gmx, "" for the other tools) with the latency and failures of the options
+    commands: {subcommand: function(args, latency) -> exit code}, where the function is responsible for waiting
+    """
+    subcommand = args[0] if "" not in commands and args else ""
+    func = commands.get(subcommand, default)
+    rng = _rng(tool, subcommand, args)
+    wait = latency(tool, subcommand, rng)
+    fail = should_fail(tool, subcommand, args, rng)
+    log_call(tool, args, latency=wait, failure=fail)
+    if fail:
+        time.sleep(wait * rng.random())
+        print(f"Fatal error: failure injected into {tool} {' '.join(args)}", file=sys.stderr)
+        return FAILURE_EXIT_CODE
+    if func is None:
+        time.sleep(wait)
+        return 0
+    return func(args[1:] if subcommand else args, wait)
+
+
+def flags(args: List[str]) -> Dict[str, List[str]]:
+    """
+    GROMACS-style options: {"-s": ["pr.tpr"], "-multidir": ["a", "b"], "-append": []}
+    """
+    ret: Dict[str, List[str]] = {}
+    key = None
+    for arg in args:
+        if re.match(r"^-[A-Za-z]", arg):
+            key = arg
+            ret[key] = []
+        elif key is not None:
+            ret[key].append(arg)
+    return ret
+
+
+def fatal(message: str) -> int:
+    print(f"Fatal error:\n{message}", file=sys.stderr)
+    return FAILURE_EXIT_CODE
+
+
+def require(*paths: Optional[str]) -> Optional[str]:
+    """the first missing input file (None if all of them exist)"""
+    return next((path for path in paths if path is not None and not Path(path).exists()), None)
@@ -0,0 +1,185 @@
+"""
+Fake cpptraj: the commands of the cpptraj inputs of the pipeline (template/cpptraj_pmap.in)
+
+Frames of "trajin" (xtc) are read with utilities.xtc, atoms are selected with utilities.cpptraj_mask,
+and "grid" counts the selected atoms in the voxels, "volume" and "rms" write a value per frame
+("rms" fits the frames to the reference by translations), "atoms" lists the selected atoms,
+"strip" removes atoms from the later "trajout", and "trajout" writes multi-model PDB files.
+The imaging commands (unwrap, center, autoimage, ...) are ignored.
+"""
+
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from . import common
+
+
+def read_parm7_atoms(path: Path) -> Tuple[List[str], List[str], List[int]]:
+    """
+    atom names, residue names and residue numbers (1-origin) of the atoms in an amber topology file
+    """
+    sections: Dict[str, List[str]] = {}
+    flag = None
+    for line in open(path):
+        if line.startswith("%FLAG"):
+            flag = line.split()[1]
+            sections[flag] = []
+        elif line.startswith("%") or flag is None:
+            continue
+        else:
+            sections[flag].append(line.rstrip("\n"))
+
+    def strings(flag: str) -> List[str]:
+        return [line[i : i + 4].strip() for line in sections[flag] for i in range(0, len(line), 4)]
+
+    names = strings("ATOM_NAME")
+    labels = strings("RESIDUE_LABEL")
+    pointers = [int(v) for line in sections["RESIDUE_POINTER"] for v in line.split()] + [len(names) + 1]
+    resids = np.repeat(np.arange(1, len(labels) + 1), np.diff(pointers))
+    resnames = [labels[i - 1] for i in resids]
+    return names, resnames, [int(i) for i in resids]
+
+
+def _keywords(words: List[str]) -> Dict[str, str]:
+    """values of "key value" pairs (e.g. "start 1 stop 1 offset 1")"""
+    return {key: value for key, value in zip(words[:-1], words[1:]) if key in ["start", "stop", "offset", "out"]}
+
+
+def _write_data(path: str, name: str, values: List[float]) -> None:
+    with open(path, "w") as fout:
+        fout.write(f"#Frame {name:>12s}\n")
+        for frame, value in enumerate(values, 1):
+            fout.write(f"{frame:8d} {value:12.4f}\n")
+
+
+def _grid(path: str, words: List[str], coords: npt.NDArray, selected: npt.NDArray) -> None:
+    """grid {path} nx dx ny dy nz dz gridcenter x y z {mask}"""
+    import gridData
+
+    shape = np.array([int(words[0]), int(words[2]), int(words[4])])
+    delta = np.array([float(words[1]), float(words[3]), float(words[5])])
+    center = np.array([float(v) for v in words[7:10]]) if words[6:7] == ["gridcenter"] else np.zeros(3)
+    lower = center - shape * delta / 2
+    counts = np.zeros(shape, dtype=np.float64)
+    indices = np.floor((coords[:, selected].reshape(-1, 3) - lower) / delta).astype(int)
+    inside = np.all((indices >= 0) & (indices < shape), axis=1)
+    np.add.at(counts, tuple(indices[inside].T), 1)
+    gridData.Grid(counts, origin=lower + delta / 2, delta=delta).export(path, type="double")
+
+
+def _shifts(coords: npt.NDArray, selected: npt.NDArray, target: npt.NDArray) -> npt.NDArray:
+    """
+    translations of frames superimposing the centroids of the selected atoms on the target (without rotations)
+    """
+    if len(target) != selected.sum():
+        return np.zeros((len(coords), 3))
+    return target.mean(axis=0) - coords[:, selected].mean(axis=1)
+
+
+def _bulk_atoms(commands: List[List[str]], topology: tuple) -> int:
+    """
+    the number of leading atoms containing those selected by "rms", "grid" and "atoms"
+    and those remaining after "strip" (water is usually placed at the end and decoded only for a few frames)
+    """
+    from ..cpptraj_mask import evaluate_mask
+
+    names, resnames, resids = topology
+    bulk = np.zeros(len(names), dtype=bool)
+    stripped = np.zeros(len(names), dtype=bool)
+    for words in commands:
+        if words[0] in ["rms", "grid", "atoms", "strip"]:
+            masks = [word for word in words[2:] if word[:1] in ":@"] if words[0] == "rms" else [words[-1]]
+            masks = [words[1]] if words[0] == "atoms" else masks
+            for mask in masks:
+                selected = evaluate_mask(mask, resnames, names, resids)
+                if words[0] == "strip":
+                    stripped |= selected
+                else:
+                    bulk |= selected
+    bulk |= ~stripped
+    return int(np.nonzero(bulk)[0].max()) + 1 if bulk.any() else 0
+
+
+def _run(args: List[str], wait: float) -> int:
+    from ..cpptraj_mask import evaluate_mask
+    from ..xtc import XTCReader
+    from .structure import write_pdb_model
+    from .tleap import read_pdb
+
+    commands = [words for words in (line.split("#")[0].split() for line in sys.stdin.read().splitlines()) if words]
+    commands = [[words[0].lower()] + words[1:] for words in commands]
+    print("CPPTRAJ: Trajectory Analysis. (fake)")
+    time.sleep(wait)
+    parms = [words[1] for words in commands if words[0] == "parm"]
+    trajins = [words for words in commands if words[0] == "trajin"]
+    missing = common.require(*parms, *[words[1] for words in trajins])
+    if missing is not None:
+        return common.fatal(f"File '{missing}' does not exist.")
+    if not parms or not trajins:
+        return common.fatal("No topology or trajectory is given.")
+    names, resnames, resids = (np.array(v) for v in read_parm7_atoms(Path(parms[0])))
+    reference = read_pdb(Path(parms[-1])) if len(parms) > 1 else None
+
+    words = trajins[0]
+    reader = XTCReader(words[1])
+    start = int(words[2]) if len(words) > 2 else 1
+    stop = reader.n_frames if len(words) <= 3 or words[3] == "last" else int(words[3])
+    frames = range(start - 1, stop, int(words[4]) if len(words) > 4 else 1)
+    n_bulk = _bulk_atoms(commands, (names, resnames, resids))
+    coords = reader.read(frames.start, frames.stop, frames.step, atom_indices=range(n_bulk)) * 10
+    boxes = np.array([np.diag(reader.read_box(k)) * 10 for k in frames]).reshape(-1, 3)
+    shifts = np.zeros((len(frames), 3))
+    kept = np.ones(len(names), dtype=bool)
+    print(f"  [trajin {words[1]}] {len(frames)} frames")
+
+    for words in commands:
+        command = words[0]
+        if command == "volume":
+            _write_data(_keywords(words)["out"], "Vol", list(np.prod(boxes, axis=1)))
+        elif command == "rms" and reference is not None:
+            masks = [word for word in words[2:] if word[:1] in ":@"]
+            fitted = evaluate_mask(masks[0], resnames, names, resids)[:n_bulk]
+            ref_names, ref_resnames, ref_resids, _, ref_coords = (np.array(v) for v in zip(*reference))
+            target = ref_coords[evaluate_mask(masks[-1], ref_resnames, ref_names, ref_resids)]
+            shift = _shifts(coords, fitted, target)
+            coords += shift[:, None, :].astype(coords.dtype)
+            shifts += shift
+            rmsd = np.zeros(len(frames))
+            if 0 < len(target) == fitted.sum():
+                rmsd = np.sqrt(((coords[:, fitted] - target) ** 2).sum(axis=2).mean(axis=1))
+            _write_data(_keywords(words)["out"], words[1], list(rmsd))
+        elif command in ["grid", "atoms", "strip"]:
+            mask = words[1] if command == "atoms" else words[-1]
+            selected = evaluate_mask(mask, resnames, names, resids)
+            if command == "grid":
+                _grid(words[1], words[2:], coords, selected[:n_bulk])
+            elif command == "atoms":
+                with open(_keywords(words)["out"], "w") as fout:
+                    fout.write(f"#Mask [{mask}] corresponds to {int(selected.sum())} atoms.\n")
+                    for i in np.where(selected)[0]:
+                        fout.write(f"{i + 1:8d} {names[i]:4s} {resids[i]:8d} {resnames[i]:4s}\n")
+            else:
+                kept &= ~selected
+        elif command == "trajout":
+            options = _keywords(words[2:])
+            first, offset = int(options.get("start", 1)), int(options.get("offset", 1))
+            last = int(options.get("stop", len(frames)))
+            atoms = [(int(r), n, a) for r, n, a in zip(resids[kept], resnames[kept], names[kept])]
+            with open(words[1], "w") as fout:
+                for model, k in enumerate(range(first - 1, min(last, len(frames)), offset), 1):
+                    if kept[n_bulk:].any():  # atoms after the bulk (e.g. water) are decoded for the frame
+                        frame = reader.read_frame(frames[k]) * 10 + shifts[k].astype(np.float32)
+                    else:
+                        frame = coords[k]
+                    write_pdb_model(fout, atoms, frame[kept[: len(frame)]], boxes[k], model=model)
+                fout.write("END\n")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    return common.run("CPPTRAJ", argv, {"": _run})
@@ -0,0 +1,295 @@
+"""
+Fake GROMACS: grompp, mdrun, trjconv, make_ndx and dump -cp
+
+The tpr and checkpoint files are json files, and mdrun writes the coordinates of the tpr to every frame
+of an xtc trajectory readable by utilities.xtc (and real tools), a log file with the performance counters
+parsed by utilities.gmx_log, and the final coordinates.
+mdrun waits for the latency of the run (FAKE_GMX_MDRUN_LATENCY, scaled by the remaining steps when resumed),
+and stops with a checkpoint on SIGTERM, SIGINT or SIGUSR1 as GROMACS does (writing "Finished mdrun"
+and the final coordinates as well).
+"""
+
+import json
+import math
+import os
+import platform
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from . import common
+from .structure import read_gro, write_gro, write_pdb_model
+
+VERSION_STRING = "2023-fake"
+MINIMIZERS = ["steep", "cg", "l-bfgs"]
+
+_stop = threading.Event()
+_received: List[str] = []
+
+
+def _now() -> str:
+    return time.strftime("%a %b %d %H:%M:%S %Y")
+
+
+def read_mdp(path: Path) -> Dict[str, str]:
+    """{option: value} with options normalized to lower case and "-" ("nstxtcout", "compressed-x-grps", ...)"""
+    ret = {}
+    for line in Path(path).read_text().splitlines():
+        key, sep, value = line.split(";")[0].partition("=")
+        if sep:
+            ret[key.strip().lower().replace("_", "-")] = value.strip()
+    return ret
+
+
+def read_ndx(path: Path) -> Dict[str, List[int]]:
+    """{group: 0-origin atom indices}"""
+    groups: Dict[str, List[int]] = {}
+    name = None
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if line.startswith("["):
+            name = line.strip("[] ")
+            groups[name] = []
+        elif line and name is not None:
+            groups[name] += [int(v) - 1 for v in line.split()]
+    return groups
+
+
+def grompp(args: List[str], wait: float) -> int:
+    opts = common.flags(args)
+    mdp = opts.get("-f", ["grompp.mdp"])[0]
+    gro = opts.get("-c", ["conf.gro"])[0]
+    top = opts.get("-p", ["topol.top"])[0]
+    ndx = opts.get("-n", [None])[0]
+    missing = common.require(mdp, gro, top, ndx)
+    if missing is not None:
+        return common.fatal(f"File '{missing}' does not exist or is not accessible.")
+    params = read_mdp(Path(mdp))
+    output_atoms = None
+    group = params.get("compressed-x-grps")
+    if group:
+        groups = read_ndx(Path(ndx or "index.ndx"))
+        if group not in groups:
+            return common.fatal(f"Group {group} referenced in the .mdp file was not found in the index file.")
+        output_atoms = groups[group]
+    time.sleep(wait)
+    tpr = {"fake": "tpr", "mdp": params, "gro": Path(gro).read_text(), "output_atoms": output_atoms}
+    Path(opts.get("-o", ["topol.tpr"])[0]).write_text(json.dumps(tpr))
+    if "-po" in opts:
+        Path(opts["-po"][0]).write_text("".join(f"{key} = {value}\n" for key, value in params.items()))
+    return 0
+
+
+def _header(opts: Dict[str, List[str]], workdir: Path) -> str:
+    gpus = [int(v) for v in os.getenv("CUDA_VISIBLE_DEVICES", "").split(",") if v.strip().lstrip("-").isdigit()]
+    gpus = [v for v in gpus if v >= 0]
+    lines = [
+        "                      :-) GROMACS - gmx mdrun, fake (-:",
+        "",
+        f"Working dir:  {workdir.resolve()}",
+        "Command line:",
+        "  gmx mdrun " + " ".join(f"{key} {' '.join(values)}".strip() for key, values in opts.items()),
+        "",
+        f"GROMACS version:    {VERSION_STRING}",
+        "",
+        f"Log file opened on {_now()}",
+        f"Host: {platform.node()}  pid: {os.getpid()}  rank ID: 0  number of ranks:  1",
+        f"Hardware detected on host {platform.node()}:",
+        "  CPU info:",
+        f"    Brand:  {platform.processor() or platform.machine()}",
+    ]
+    if gpus:
+        lines += ["  GPU info:", f"    Number of GPUs detected: {len(gpus)}"]
+        lines += [f"    #{i}: NVIDIA Fake GPU, compute cap.: 8.0, ECC: yes, stat: compatible" for i in range(len(gpus))]
+    lines += ["", f"Started mdrun on rank 0 {_now()}", ""]
+    return "\n".join(lines) + "\n"
+
+
+def _footer(wall: float, n_steps: int, dt: float, dynamics: bool) -> str:
+    lines = [
+        "",
+        "     R E A L   C Y C L E   A N D   T I M E   A C C O U N T I N G",
+        "",
+        "On 1 MPI rank, each using 1 OpenMP threads",
+        "",
+        " Computing:          Num   Num      Call    Wall time         Giga-Cycles",
+        "                     Ranks Threads  Count      (s)         total sum    %",
+        "-" * 77,
+        f" {'Force':18s} {1:5d} {1:4d} {max(n_steps, 1):10d} {wall:11.3f} {wall * 2.0:14.3f} {100.0:5.1f}",
+        "-" * 77,
+        f" {'Total':45s} {wall:11.3f} {wall * 2.0:14.3f} {100.0:5.1f}",
+        "-" * 77,
+        "",
+        "               Core t (s)   Wall t (s)        (%)",
+        f"       Time:  {wall:11.3f}  {wall:11.3f}      100.0",
+    ]
+    if dynamics and wall > 0 and n_steps > 0:
+        ns_per_day = n_steps * dt / 1000 / (wall / 86400)
+        lines += [
+            "                 (ns/day)    (hour/ns)",
+            f"Performance:  {ns_per_day:11.3f}  {24 / ns_per_day:11.3f}",
+        ]
+    lines.append(f"Finished mdrun on rank 0 {_now()}")
+    return "\n".join(lines) + "\n"
+
+
+def _output_paths(opts: Dict[str, List[str]], workdir: Path) -> Dict[str, Optional[Path]]:
+    deffnm = opts.get("-deffnm", [None])[0]
+    defaults = {
+        "-s": "topol.tpr",
+        "-g": "md.log",
+        "-c": "confout.gro",
+        "-x": "traj_comp.xtc",
+        "-cpo": "state.cpt",
+        "-e": "ener.edr",
+    }
+    ret: Dict[str, Optional[Path]] = {}
+    for key, default in defaults.items():
+        if key in opts:
+            ret[key] = workdir / opts[key][0]
+        elif deffnm is not None:
+            ret[key] = workdir / f"{deffnm}{Path(default).suffix}"
+        else:
+            ret[key] = workdir / default
+    ret["-cpi"] = workdir / opts["-cpi"][0] if opts.get("-cpi") else None
+    return ret
+
+
+def _mdrun(opts: Dict[str, List[str]], workdir: Path, wait: float) -> int:
+    from ..xtc import write_xtc
+
+    paths = _output_paths(opts, workdir)
+    if not paths["-s"].exists():
+        return common.fatal(f"File '{paths['-s']}' does not exist or is not accessible.")
+    tpr = json.loads(paths["-s"].read_text())
+    mdp = tpr["mdp"]
+    nsteps = int(opts["-nsteps"][0]) if "-nsteps" in opts else int(float(mdp.get("nsteps", "0")))
+    nsteps = max(nsteps, 0)
+    dt = float(mdp.get("dt", "0.001"))
+    dynamics = mdp.get("integrator", "md") not in MINIMIZERS
+
+    start_step = 0
+    if paths["-cpi"] is not None and paths["-cpi"].exists():
+        start_step = json.loads(paths["-cpi"].read_text())["step"]
+    append = start_step > 0 and "-append" in opts and "-noappend" not in opts
+    duration = wait * (nsteps - start_step) / nsteps if nsteps else wait
+
+    with open(paths["-g"], "a" if append else "w") as log:
+        log.write(_header(opts, workdir))
+    started = time.time()
+    interrupted = _stop.wait(duration)
+    wall = time.time() - started
+    end_step = nsteps
+    if interrupted and duration > 0:
+        end_step = start_step + int((nsteps - start_step) * min(wall / duration, 1.0))
+
+    title, atoms, coords, box = read_gro(tpr["gro"])
+    interval = int(float(mdp.get("nstxout-compressed", mdp.get("nstxtcout", "0"))))
+    if dynamics and interval > 0:
+        max_frames = common.option("MAX_FRAMES", "GMX", "MDRUN")
+        if max_frames is not None and nsteps > 0:
+            interval = max(interval, math.ceil(nsteps / int(max_frames)))
+        first = start_step + 1 if append else 0
+        steps = [step for step in range(0, end_step + 1, interval) if step >= first]
+        output = coords if tpr["output_atoms"] is None else coords[tpr["output_atoms"]]
+        if steps:
+            write_xtc(paths["-x"], output, np.diag(box), steps, [step * dt for step in steps], append=append)
+    paths["-cpo"].write_text(json.dumps({"fake": "cpt", "step": end_step, "time": end_step * dt}))
+    paths["-e"].touch()
+
+    with open(paths["-g"], "a") as log:
+        if interrupted:
+            log.write(f"\nReceived the {_received[0]} signal, stopping within 100 steps\n")
+        log.write(_footer(wall, end_step - start_step, dt, dynamics))
+    if "-noconfout" not in opts:  # also written by mdrun stopped by a signal (the last step)
+        write_gro(paths["-c"], title, atoms, coords, box)
+    return 0
+
+
+def _handle_signal(signum, frame) -> None:
+    _received.append({signal.SIGTERM: "TERM", signal.SIGINT: "INT", signal.SIGUSR1: "USR1"}[signum])
+    _stop.set()
+
+
+def mdrun(args: List[str], wait: float) -> int:
+    for signum in [signal.SIGTERM, signal.SIGINT, signal.SIGUSR1]:
+        signal.signal(signum, _handle_signal)
+    opts = common.flags(args)
+    dirs = opts.pop("-multidir", None)
+    if not dirs:
+        return _mdrun(opts, Path("."), wait)
+    # replicas run in parallel as the ranks of a MPI job
+    with ThreadPoolExecutor(max_workers=len(dirs)) as executor:
+        returncodes = list(executor.map(lambda d: _mdrun(opts, Path(d), wait), dirs))
+    return max(returncodes)
+
+
+def trjconv(args: List[str], wait: float) -> int:
+    opts = common.flags(args)
+    inp = opts.get("-f", ["traj.xtc"])[0]
+    missing = common.require(inp)
+    if missing is not None:
+        return common.fatal(f"File '{missing}' does not exist or is not accessible.")
+    sys.stdin.read()  # group selection
+    time.sleep(wait)
+    _, atoms, coords, box = read_gro(Path(inp).read_text())
+    with open(opts.get("-o", ["trajout.xtc"])[0], "w") as fout:
+        write_pdb_model(fout, atoms, coords * 10, box * 10)
+    return 0
+
+
+def make_ndx(args: List[str], wait: float) -> int:
+    opts = common.flags(args)
+    gro = opts.get("-f", ["conf.gro"])[0]
+    missing = common.require(gro)
+    if missing is not None:
+        return common.fatal(f"File '{missing}' does not exist or is not accessible.")
+    sys.stdin.read()  # commands
+    time.sleep(wait)
+    _, atoms, _, _ = read_gro(Path(gro).read_text())
+    water = [i for i, (_, resn, _) in enumerate(atoms) if resn in ("SOL", "WAT", "HOH")]
+    groups = {"System": list(range(len(atoms))), "Water": water}
+    groups["Non-Water"] = sorted(set(groups["System"]) - set(water))
+    with open(opts.get("-o", ["index.ndx"])[0], "w") as fout:
+        for name, indices in groups.items():
+            fout.write(f"[ {name} ]\n")
+            for i in range(0, len(indices), 15):
+                fout.write(" ".join(f"{n + 1:>4d}" for n in indices[i : i + 15]) + "\n")
+    return 0
+
+
+def dump(args: List[str], wait: float) -> int:
+    opts = common.flags(args)
+    cpt = opts.get("-cp", [None])[0]
+    if cpt is None or not Path(cpt).exists():
+        return common.fatal(f"File '{cpt}' does not exist or is not accessible.")
+    time.sleep(wait)
+    state = json.loads(Path(cpt).read_text())
+    print(f"{cpt} frame 0:\n   step = {state['step']}\n   t = {state['time']:.6f}")
+    return 0
+
+
+def version(args: List[str], wait: float) -> int:
+    print(f"                      :-) GROMACS - gmx, fake (-:\n\nGROMACS version:    {VERSION_STRING}")
+    return 0
+
+
+COMMANDS = {
+    "grompp": grompp,
+    "mdrun": mdrun,
+    "trjconv": trjconv,
+    "make_ndx": make_ndx,
+    "dump": dump,
+    "--version": version,
+    "-version": version,
+}
+
+
+def main(argv: List[str]) -> int:
+    return common.run("GMX", argv, COMMANDS)
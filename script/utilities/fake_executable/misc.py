@@ -0,0 +1,56 @@
+"""
+Fake parmchk2, mpirun and nvidia-smi
+"""
+
+import subprocess
+import time
+from pathlib import Path
+from typing import List
+
+from . import common
+
+
+def parmchk2(args: List[str], wait: float) -> int:
+    """writes an empty frcmod file (parameters are not used by the fake tleap)"""
+    opts = common.flags(args)
+    mol2 = opts.get("-i", [None])[0]
+    missing = common.require(mol2)
+    if mol2 is None or missing is not None:
+        return common.fatal(f"Cannot open input file {mol2}")
+    time.sleep(wait)
+    sections = "".join(f"{section}\n\n" for section in ["MASS", "BOND", "ANGLE", "DIHE", "IMPROPER", "NONBON"])
+    Path(opts["-o"][0]).write_text(f"Remark line goes here (fake parmchk2 of {Path(mol2).name})\n{sections}")
+    return 0
+
+
+def mpirun(args: List[str], wait: float) -> int:
+    """runs the command once (the fake gmx runs the replicas of -multidir in a process)"""
+    command = list(args)
+    while command and command[0].startswith("-"):
+        option = command.pop(0)
+        if option in ["-np", "-n", "-c", "--host", "-H", "--hostfile", "-x"] and command:
+            command.pop(0)
+    time.sleep(wait)
+    if not command:
+        return common.fatal("mpirun: no executable is given")
+    return subprocess.run(command).returncode
+
+
+def nvidia_smi(args: List[str], wait: float) -> int:
+    """
+    FAKE_GPUS GPUs (default 1) in the format of the queries of GPUtil
+    (index, uuid, utilization.gpu, memory.total, memory.used, memory.free, driver_version, name, ...)
+    """
+    time.sleep(wait)
+    n = int(common.option("GPUS", "NVIDIA_SMI", default="1"))
+    for i in range(n):
+        print(f"{i}, GPU-fake-{i:04d}, 0, 40960, 0, 40960, 535.00, Fake GPU, {i}, Disabled, Disabled, 30")
+    return 0
+
+
+TOOLS = {"parmchk2": ("PARMCHK", parmchk2), "mpirun": ("MPIRUN", mpirun), "nvidia-smi": ("NVIDIA_SMI", nvidia_smi)}
+
+
+def main(tool: str, argv: List[str]) -> int:
+    name, func = TOOLS[tool]
+    return common.run(name, argv, {"": func})
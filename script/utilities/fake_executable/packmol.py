@@ -0,0 +1,112 @@
+"""
+Fake packmol: places copies of the structures of the input at random positions (without optimization)
+
+Fixed structures are moved to the given position (by the center of mass with "centerofmass"),
+and the other structures are rotated at random and placed "inside box" and "below plane"
+apart from the fixed atoms by "tolerance" (as far as found in a limited number of trials).
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from . import common
+from .tleap import read_pdb
+
+MAX_TRIALS = 100
+
+
+def _parse(script: str) -> dict:
+    ret: dict = {"tolerance": 2.0, "seed": -1, "output": None, "structures": []}
+    structure = None
+    for line in script.splitlines():
+        words = line.split("#")[0].split()
+        if not words:
+            continue
+        key = words[0].lower()
+        if key == "structure":
+            structure = {"pdb": words[1], "number": 1, "fixed": None, "centerofmass": False, "box": None, "planes": []}
+        elif key == "end" and structure is not None:
+            ret["structures"].append(structure)
+            structure = None
+        elif structure is not None:
+            values = [float(v) for v in words[1:] if re.match(r"^-?[\d.]+(e-?\d+)?$", v)]
+            if key == "number":
+                structure["number"] = int(values[0])
+            elif key == "fixed":
+                structure["fixed"] = values[:3]
+            elif key == "centerofmass":
+                structure["centerofmass"] = True
+            elif key == "inside" and words[1] == "box":
+                structure["box"] = values[:6]
+            elif key == "below" and words[1] == "plane":
+                structure["planes"].append(values[:4])
+        elif key in ["tolerance", "seed"]:
+            ret[key] = float(words[1]) if key == "tolerance" else int(words[1])
+        elif key == "output":
+            ret["output"] = words[1]
+    return ret
+
+
+def _place(structure: dict, coords: np.ndarray, occupied: list, tolerance: float, rng) -> np.ndarray:
+    from scipy.spatial import cKDTree
+    from scipy.spatial.transform import Rotation
+
+    lower, upper = np.array(structure["box"][:3]), np.array(structure["box"][3:])
+    centered = coords - coords.mean(axis=0)
+    tree = cKDTree(np.concatenate(occupied)) if occupied else None
+    for _ in range(MAX_TRIALS):
+        moved = Rotation.random(random_state=rng.integers(2**31)).apply(centered) + rng.uniform(lower, upper)
+        inside = all(np.all(moved @ np.array(p[:3]) <= p[3]) for p in structure["planes"])
+        if inside and (tree is None or np.isinf(tree.query(moved, distance_upper_bound=tolerance)[0]).all()):
+            break
+    return moved
+
+
+def _run(args: List[str], wait: float) -> int:
+    inp = _parse(sys.stdin.read())
+    print("      PACKMOL - Packing optimization for the automated generation of")
+    print("      starting configurations for molecular dynamics simulations. (fake)")
+    time.sleep(wait)
+    missing = common.require(*[s["pdb"] for s in inp["structures"]])
+    if missing is not None:
+        print(f" ERROR: Could not open file {missing}")
+        return 171
+    rng = np.random.default_rng(None if inp["seed"] < 0 else inp["seed"])
+    occupied = []
+    resnum = serial = 0
+    with open(inp["output"], "w") as fout:
+        for structure in inp["structures"]:
+            atoms = read_pdb(Path(structure["pdb"]))
+            coords = np.array([xyz for *_, xyz in atoms])
+            if structure["fixed"] is not None and structure["centerofmass"]:
+                coords = coords - coords.mean(axis=0) + np.array(structure["fixed"])
+            for _ in range(structure["number"]):
+                moved = coords
+                if structure["fixed"] is None:
+                    moved = _place(structure, coords, occupied, inp["tolerance"], rng)
+                occupied.append(moved)
+                first = None
+                for (name, resname, resi, element, _), (x, y, z) in zip(atoms, moved):
+                    first = resi if first is None else first
+                    serial += 1
+                    number = (resnum + resi - first + 1) % 10000
+                    name = f" {name:<3s}" if len(name) < 4 else name
+                    fout.write(
+                        f"ATOM  {serial % 100000:5d} {name:4s} {resname:<4s}{number:5d}    {x:8.3f}{y:8.3f}{z:8.3f}"
+                        f"{1.0:6.2f}{0.0:6.2f}          {element:>2s}\n"
+                    )
+                resnum += max(resi for _, _, resi, _, _ in atoms) - first + 1
+                fout.write("TER\n")
+        fout.write("END\n")
+    print(f"  Solution written to file: {inp['output']}")
+    print("                                 Success!")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    return common.run("PACKMOL", argv, {"": _run})
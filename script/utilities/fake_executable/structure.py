@@ -0,0 +1,53 @@
+"""
+Minimal readers and writers of GRO and PDB files for the fake executables
+"""
+
+from pathlib import Path
+from typing import List, Optional, TextIO, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+# (residue number, residue name, atom name)
+Atoms = List[Tuple[int, str, str]]
+
+
+def read_gro(text: str) -> Tuple[str, Atoms, npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    output:
+        title, atoms, coordinates [nm], box lengths [nm]
+    """
+    lines = text.splitlines()
+    n_atoms = int(lines[1])
+    body = lines[2 : 2 + n_atoms]
+    atoms = [(int(line[0:5]), line[5:10].strip(), line[10:15].strip()) for line in body]
+    coords = np.array([[float(line[20:28]), float(line[28:36]), float(line[36:44])] for line in body]).reshape(-1, 3)
+    box = np.array([float(v) for v in lines[2 + n_atoms].split()[:3]])
+    return lines[0], atoms, coords, box
+
+
+def write_gro(path: Path, title: str, atoms: Atoms, coords: npt.NDArray, box: npt.NDArray) -> Path:
+    with open(path, "w") as fout:
+        fout.write(f"{title}\n{len(atoms):5d}\n")
+        for i, ((resi, resn, name), (x, y, z)) in enumerate(zip(atoms, coords), 1):
+            fout.write(f"{resi % 100000:5d}{resn:<5s}{name:>5s}{i % 100000:5d}{x:8.3f}{y:8.3f}{z:8.3f}\n")
+        fout.write(f"{box[0]:10.5f}{box[1]:10.5f}{box[2]:10.5f}\n")
+    return Path(path)
+
+
+def write_pdb_model(
+    fout: TextIO, atoms: Atoms, coords: npt.NDArray, box: npt.NDArray, model: Optional[int] = None
+) -> None:
+    """
+    a model of a PDB file (coordinates and box lengths in angstrom)
+    """
+    if model is not None:
+        fout.write(f"MODEL {model:8d}\n")
+    fout.write(f"CRYST1{box[0]:9.3f}{box[1]:9.3f}{box[2]:9.3f}{90.0:7.2f}{90.0:7.2f}{90.0:7.2f} P 1           1\n")
+    for i, ((resi, resn, name), (x, y, z)) in enumerate(zip(atoms, coords), 1):
+        name = f" {name:<3s}" if len(name) < 4 else name[:4]
+        fout.write(
+            f"ATOM  {i % 100000:5d} {name:4s} {resn[:4]:<4s}{resi % 10000:5d}    {x:8.3f}{y:8.3f}{z:8.3f}"
+            f"{1.0:6.2f}{0.0:6.2f}\n"
+        )
+    fout.write("ENDMDL\n" if model is not None else "END\n")
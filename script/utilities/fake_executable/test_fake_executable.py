@@ -0,0 +1,88 @@
+import json
+import signal
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from script.utilities.fake_executable import fake_env
+from script.utilities.fake_executable.structure import write_gro
+from script.utilities.xtc import XTCReader
+
+MDP = "integrator = md\ndt = 0.002\nnsteps = 1000\nnstxout-compressed = 100\ncompressed-x-grps = Non-Water\n"
+
+
+def _prepare(tmp_path: Path) -> None:
+    atoms = [(1, "ALA", "CA"), (1, "ALA", "CB"), (2, "SOL", "OW"), (2, "SOL", "HW1")]
+    coords = np.array([[1.0, 1.0, 1.0], [1.1, 1.0, 1.0], [2.0, 2.0, 2.0], [2.1, 2.0, 2.0]])
+    write_gro(tmp_path / "conf.gro", "fake", atoms, coords, np.array([3.0, 3.0, 3.0]))
+    (tmp_path / "topol.top").write_text("; fake\n")
+    (tmp_path / "pr.mdp").write_text(MDP)
+
+
+def _gmx(tmp_path: Path, *args: str, **options) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["gmx", *args], cwd=tmp_path, env=fake_env(**options), capture_output=True, text=True, input=""
+    )
+
+
+def test_grompp_mdrun_dump(tmp_path):
+    _prepare(tmp_path)
+    assert _gmx(tmp_path, "make_ndx", "-f", "conf.gro", "-o", "index.ndx").returncode == 0
+    grompp = ["grompp", "-f", "pr.mdp", "-c", "conf.gro", "-p", "topol.top", "-n", "index.ndx", "-o", "pr.tpr"]
+    assert _gmx(tmp_path, *grompp).returncode == 0
+    mdrun = ["mdrun", "-s", "pr.tpr", "-cpo", "pr.cpt", "-x", "pr.xtc", "-c", "pr.gro", "-e", "pr.edr", "-g", "pr.log"]
+    assert _gmx(tmp_path, *mdrun, gmx_mdrun_latency=0.2).returncode == 0
+
+    reader = XTCReader(tmp_path / "pr.xtc")
+    assert reader.n_frames == 11 and reader.n_atoms == 2
+    assert np.allclose(reader.read_frame(0), [[1.0, 1.0, 1.0], [1.1, 1.0, 1.0]], atol=1e-3)
+    log = (tmp_path / "pr.log").read_text()
+    assert "Performance:" in log and "Finished mdrun" in log
+    assert (tmp_path / "pr.gro").exists()
+    assert "t = 2.000000" in _gmx(tmp_path, "dump", "-cp", "pr.cpt").stdout
+
+
+def test_mdrun_signal_and_resume(tmp_path):
+    _prepare(tmp_path)
+    _gmx(tmp_path, "make_ndx", "-f", "conf.gro", "-o", "index.ndx")
+    _gmx(tmp_path, "grompp", "-f", "pr.mdp", "-c", "conf.gro", "-p", "topol.top", "-n", "index.ndx", "-o", "pr.tpr")
+    mdrun = ["gmx", "mdrun", "-deffnm", "pr"]
+    process = subprocess.Popen(mdrun, cwd=tmp_path, env=fake_env(gmx_mdrun_latency=30))
+    time.sleep(1.0)
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=10) == 0
+    assert "Received the TERM signal" in (tmp_path / "pr.log").read_text()
+    assert (tmp_path / "pr.gro").exists()  # real mdrun writes -c at the last step
+    step = json.loads((tmp_path / "pr.cpt").read_text())["step"]
+    assert 0 < step < 1000
+
+    assert _gmx(tmp_path, "mdrun", "-deffnm", "pr", "-cpi", "pr.cpt", "-append").returncode == 0
+    assert (tmp_path / "pr.gro").exists()
+    assert XTCReader(tmp_path / "pr.xtc").n_frames == 11
+    assert json.loads((tmp_path / "pr.cpt").read_text())["step"] == 1000
+
+
+def test_failure_injection_and_call_log(tmp_path):
+    _prepare(tmp_path)
+    log = tmp_path / "calls.jsonl"
+    result = _gmx(tmp_path, "make_ndx", "-f", "conf.gro", fail_match="GMX make_ndx", call_log=log)
+    assert result.returncode == 1 and "Fatal error" in result.stderr
+    assert not (tmp_path / "index.ndx").exists()
+    assert _gmx(tmp_path, "--version", call_log=log).returncode == 0
+    calls = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [(c["tool"], c["args"][0], c["failure"]) for c in calls] == [
+        ("GMX", "make_ndx", True),
+        ("GMX", "--version", False),
+    ]
+
+
+def test_nvidia_smi(monkeypatch):
+    GPUtil = pytest.importorskip("GPUtil")
+    for key, value in fake_env(gpus=2).items():
+        monkeypatch.setenv(key, value)
+    gpus = GPUtil.getGPUs()
+    assert [gpu.id for gpu in gpus] == [0, 1]
+    assert all(gpu.memoryFree == 40960 for gpu in gpus)
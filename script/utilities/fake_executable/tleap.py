@@ -0,0 +1,169 @@
+"""
+Fake tleap: loadPDB, set box, solvateBox, charge and saveAmberParm of the leap inputs of the pipeline
+
+The system has the atoms of the PDB file and water on a lattice filling the box,
+bonds between close atoms, a Lennard-Jones type per element and no charges.
+It has the topology and coordinates expected by the later stages (parmed conversion to GROMACS,
+virtual sites of probes, position restraints), not a force field.
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from . import common
+
+MASSES = {"H": 1.008, "C": 12.01, "N": 14.01, "O": 16.0, "S": 32.06, "P": 30.97}
+# TIP3P-like water (relative positions [A] from the oxygen)
+WATER = [("O", "O", (0.0, 0.0, 0.0)), ("H1", "H", (0.957, 0.0, 0.0)), ("H2", "H", (-0.24, 0.927, 0.0))]
+WATER_SPACING = 3.1  # [A] ~ the density of water
+WATER_CLEARANCE = 2.8  # [A] minimum distance between water oxygens and the solute
+BOND_CUTOFF = 1.9  # [A]
+HYDROGEN_BOND_CUTOFF = 1.25  # [A] covalent bonds of hydrogens
+
+
+def _element(name: str, element: str = "") -> str:
+    element = element.strip().capitalize()
+    if element in MASSES:
+        return element
+    letters = re.sub(r"[^A-Za-z]", "", name)
+    return letters[:1].upper() if letters[:1].upper() in MASSES else "C"
+
+
+def read_pdb(path: Path) -> List[tuple]:
+    """[(atom name, residue name, residue number, element, (x, y, z))] of ATOM/HETATM records"""
+    ret = []
+    for line in open(path):
+        if line.startswith(("ATOM", "HETATM")):
+            name = line[12:16].strip()
+            xyz = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+            ret.append((name, line[17:21].strip(), int(line[22:26]), _element(name, line[76:78]), xyz))
+    return ret
+
+
+def water_lattice(box: npt.NDArray, solute: npt.NDArray) -> npt.NDArray:
+    """oxygen positions on a lattice in [0, box) apart from the solute"""
+    from scipy.spatial import cKDTree
+
+    axes = [np.arange(WATER_SPACING / 2, length - 1.0, WATER_SPACING) for length in box]
+    oxygens = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+    if len(solute) == 0 or len(oxygens) == 0:
+        return oxygens
+    distances, _ = cKDTree(solute).query(oxygens, distance_upper_bound=WATER_CLEARANCE)
+    return oxygens[np.isinf(distances)]
+
+
+def build_structure(atoms: List[tuple], box: Optional[npt.NDArray], buffer: Optional[npt.NDArray]):
+    """
+    parmed structure of the atoms and water in the box (the solute is placed at the center of the box)
+    box: box lengths of "set box", buffer: distance from the solute to the box edges of solvateBox
+    """
+    import parmed as pmd
+    from scipy.spatial import cKDTree
+
+    coords = np.array([xyz for *_, xyz in atoms], dtype=float).reshape(-1, 3)
+    lower, upper = (coords.min(axis=0), coords.max(axis=0)) if len(coords) else (np.zeros(3), np.zeros(3))
+    if buffer is not None and (box is None or np.any(buffer > 0)):
+        box = upper - lower + 2 * buffer
+    if box is None:
+        box = upper - lower + 2 * WATER_SPACING
+    coords = coords - (lower + upper) / 2 + box / 2
+    waters = water_lattice(box, coords) if buffer is not None else np.zeros((0, 3))
+
+    struct = pmd.Structure()
+    types = {}
+
+    def add(name: str, resname: str, resnum: int, element: str) -> None:
+        if element not in types:
+            atom_type = pmd.AtomType(element, len(types) + 1, MASSES[element], pmd.periodic_table.AtomicNum[element])
+            atom_type.set_lj_params(0.1, 1.2 if element == "H" else 1.7)
+            types[element] = atom_type
+        atom = pmd.Atom(
+            name=name,
+            type=element,
+            charge=0.0,
+            mass=MASSES[element],
+            atomic_number=pmd.periodic_table.AtomicNum[element],
+        )
+        atom.atom_type = types[element]
+        struct.add_atom(atom, resname, resnum)
+
+    for name, resname, resnum, element, _ in atoms:
+        add(name, resname, resnum, element)
+    last = atoms[-1][2] if atoms else 0
+    offsets = np.array([xyz for *_, xyz in WATER])
+    for k in range(len(waters)):
+        for name, element, _ in WATER:
+            add(name, "WAT", last + k + 1, element)
+    xyz = np.concatenate([coords, (waters[:, None, :] + offsets[None, :, :]).reshape(-1, 3)])
+    struct.coordinates = xyz
+
+    # bonds of the solute by distances, and of water by the template
+    hydrogen = np.array([atom.atomic_number == 1 for atom in struct.atoms[: len(coords)]], dtype=bool)
+    bond_type = pmd.BondType(300.0, 1.0, list=struct.bond_types)
+    struct.bond_types.append(bond_type)
+    pairs = cKDTree(coords).query_pairs(BOND_CUTOFF, output_type="ndarray") if len(coords) else np.zeros((0, 2))
+    for i, j in pairs:
+        if hydrogen[i] and hydrogen[j]:
+            continue
+        if (hydrogen[i] or hydrogen[j]) and np.linalg.norm(coords[i] - coords[j]) > HYDROGEN_BOND_CUTOFF:
+            continue
+        struct.bonds.append(pmd.Bond(struct.atoms[int(i)], struct.atoms[int(j)], type=bond_type))
+    for k in range(len(waters)):
+        oxygen = len(coords) + 3 * k
+        for h in [oxygen + 1, oxygen + 2]:
+            struct.bonds.append(pmd.Bond(struct.atoms[oxygen], struct.atoms[h], type=bond_type))
+    struct.box = [*box, 90.0, 90.0, 90.0]
+    return struct
+
+
+def _vector(text: str) -> npt.NDArray:
+    """ "10" or "{ 10, 12, 14 }" -> (x, y, z)"""
+    values = [float(v) for v in re.split(r"[\s,{}]+", text) if v]
+    return np.array(values * 3 if len(values) == 1 else values[:3])
+
+
+def _run(args: List[str], wait: float) -> int:
+    opts = common.flags(args)
+    inp = opts.get("-f", [None])[0]
+    script = Path(inp).read_text() if inp is not None else sys.stdin.read()
+    print("-I: Adding /fake/amber/dat/leap/prep to search path.")
+    time.sleep(wait)
+    atoms: List[tuple] = []
+    box = buffer = None
+    for line in script.splitlines():
+        line = line.split("#")[0].strip()
+        words = line.split()
+        if len(words) >= 4 and words[1] == "=" and words[2].lower() == "loadpdb":
+            missing = common.require(words[3])
+            if missing is not None:
+                print(f"Could not open file {missing}: not found")
+                return 0  # tleap does not fail
+            atoms = read_pdb(Path(words[3]))
+        elif len(words) >= 4 and words[0].lower() == "set" and words[2] == "box":
+            box = _vector(line.split("box", 1)[1])
+        elif words[:1] and words[0].lower() == "solvatebox":
+            buffer = _vector(line.split(None, 3)[3])
+        elif words[:1] and words[0].lower() == "charge":
+            print(f"Total unperturbed charge:   {0.0:.6f}")
+            print(f"Total perturbed charge:     {0.0:.6f}")
+        elif words[:1] and words[0].lower() == "saveamberparm":
+            import parmed as pmd
+
+            struct = build_structure(atoms, box, buffer)
+            parm = pmd.amber.AmberParm.from_structure(struct)
+            parm.save(words[2], overwrite=True)
+            parm.save(words[3], format="rst7", overwrite=True)
+            print(f"Writing parameter file {words[2]} ({len(struct.atoms)} atoms)")
+        elif words[:1] and words[0].lower() == "quit":
+            break
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    return common.run("TLEAP", argv, {"": _run})
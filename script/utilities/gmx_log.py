@@ -0,0 +1,120 @@
+"""
+Parser of the performance counters in GROMACS (gmx mdrun) log files
+
+A log file has a run per "Log file opened" (runs resumed with -append are written to the same file).
+Each run gives the host, versions, hardware, PME load balance, the cycle accounting table,
+"Time:" (core and wall time) and "Performance:" (ns/day), which are missing if the run did not finish
+(or are partially missing, e.g. no performance for energy minimization).
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, List
+
+VERSION = "1.0.0"
+
+# (key, pattern, type) of values in a line
+_VALUES = [
+    ("host", re.compile(r"^Host:\s+(\S+)"), str),
+    ("host", re.compile(r"^Hardware detected on host (\S+?):?\s"), str),
+    ("gromacs_version", re.compile(r"^GROMACS version:\s+(\S+)"), str),
+    ("cuda_driver", re.compile(r"^CUDA driver:\s+(\S+)"), str),
+    ("cuda_runtime", re.compile(r"^CUDA runtime:\s+(\S+)"), str),
+    ("cpu", re.compile(r"^\s+Brand:\s+(.+?)\s*$"), str),
+    ("gpu", re.compile(r"^\s+#\d+: (?:NVIDIA |AMD )?(.+?), compute cap"), str),
+    ("pme_mesh_force_load", re.compile(r"Average PME mesh/force load:\s+([\d.]+)"), float),
+    ("pme_imbalance_percent", re.compile(r"waiting due to PP/PME imbalance:\s+([\d.]+) %"), float),
+    ("load_imbalance_percent", re.compile(r"Average load imbalance:\s+([\d.]+) %"), float),
+    ("gpu_cpu_force_ratio", re.compile(r"force GPU/CPU evaluation time ratio:.*=\s+([\d.]+)"), float),
+]
+_RUN_START = re.compile(r"^Log file opened on (.+?)\s*$")
+_TIME = re.compile(r"^\s+Time:\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)")
+_PERFORMANCE = re.compile(r"^Performance:\s+([\d.]+)\s+([\d.]+)")
+_CYCLE_HEADER = re.compile(r"R E A L\s+C Y C L E\s+A N D\s+T I M E\s+A C C O U N T I N G")
+# name, (ranks, threads, count,) wall time [s], giga-cycles, %
+_CYCLE_ROW = re.compile(r"^ (\S.*?)\s{2,}(?:(\d+)\s+(\d+)\s+(\d+)\s+)?([\d.]+)\s+([\d.]+)\s+([\d.]+)\s*$")
+
+# rows of the cycle accounting table where the CPU waits for GPUs
+GPU_WAIT_ROWS = ["Wait GPU NB local", "Wait GPU NB nonloc.", "Wait GPU state copy", "Wait + Comm. F", "Wait GPU PME"]
+
+
+def _parse_cycle_table(lines: List[str], start: int) -> Dict[str, dict]:
+    """
+    rows of the first table after the header line at start (the breakdown tables are not read)
+    """
+    table = {}
+    separators = 0
+    for line in lines[start + 1 :]:
+        if line.startswith("----"):
+            separators += 1
+            if separators == 3:  # header / rows / total
+                break
+            continue
+        if separators == 0:
+            continue
+        m = _CYCLE_ROW.match(line)
+        if m:
+            name, ranks, threads, count, wall, gcycles, percent = m.groups()
+            table[name] = {
+                "ranks": int(ranks) if ranks else None,
+                "threads": int(threads) if threads else None,
+                "count": int(count) if count else None,
+                "wall_s": float(wall),
+                "giga_cycles": float(gcycles),
+                "percent": float(percent),
+            }
+    return table
+
+
+def _parse_run(lines: List[str], inherited: dict) -> dict:
+    # the header is not repeated in some logs of resumed runs: the versions and hardware of the previous run are used
+    run: dict = {key: inherited.get(key) for key in ["gromacs_version", "cuda_driver", "cuda_runtime", "cpu", "gpu"]}
+    found = set()
+    for i, line in enumerate(lines):
+        for key, pattern, type_ in _VALUES:
+            m = pattern.search(line)
+            if m and key not in found:  # the first value in the run (e.g. the first GPU)
+                run[key] = type_(m.group(1))
+                found.add(key)
+        if _CYCLE_HEADER.search(line) and "cycles" not in run:
+            run["cycles"] = _parse_cycle_table(lines, i)
+        m = _TIME.match(line)
+        if m:
+            run["core_time_s"], run["wall_time_s"] = float(m.group(1)), float(m.group(2))
+        m = _PERFORMANCE.match(line)
+        if m:
+            run["ns_per_day"] = float(m.group(1))
+    run.setdefault("host", None)
+    run["finished"] = any(line.startswith("Finished mdrun") for line in lines)
+    cycles = run.get("cycles")
+    if cycles and "Total" in cycles and cycles["Total"]["wall_s"] > 0:
+        wait = sum(cycles[name]["wall_s"] for name in GPU_WAIT_ROWS if name in cycles)
+        run["gpu_wait_percent"] = 100 * wait / cycles["Total"]["wall_s"]
+    return run
+
+
+def parse_log(path: Path) -> List[dict]:
+    """
+    performance counters of the runs in a mdrun log file
+    output:
+        [{"opened", "host", "gromacs_version", "cuda_driver", "cuda_runtime", "cpu", "gpu",
+          "pme_mesh_force_load", "pme_imbalance_percent", "load_imbalance_percent", "gpu_cpu_force_ratio",
+          "cycles": {row: {"ranks", "threads", "count", "wall_s", "giga_cycles", "percent"}},
+          "gpu_wait_percent", "core_time_s", "wall_time_s", "ns_per_day", "finished"}]
+        (keys without values in the log are missing or None)
+    """
+    lines = Path(path).read_text(errors="replace").splitlines()
+    starts = [i for i, line in enumerate(lines) if _RUN_START.match(line)]
+    if not starts:
+        starts = [0]
+    runs = []
+    inherited: dict = {}
+    # the header before the first "Log file opened" (versions) belongs to the first run
+    bounds = [0] + starts[1:] + [len(lines)]
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        run = _parse_run(lines[begin:end], inherited)
+        opened = next((_RUN_START.match(line) for line in lines[begin:end] if _RUN_START.match(line)), None)
+        run["opened"] = opened.group(1) if opened else None
+        runs.append(run)
+        inherited = run
+    return runs
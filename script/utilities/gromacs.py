@@ -157,11 +157,12 @@ class Gro:
         ret_str += "{:>6}\n".format(self.natoms)
         for a in self.atoms:
             ret_str += "{}\n".format(a)
-        ret_str += "{: 10.5f}  {: 10.5f}  {: 10.5f}\n".format(*self.box_size)
+        # triclinic boxes have 9 values: v1(x) v2(y) v3(z) v1(y) v1(z) v2(x) v2(z) v3(x) v3(y)
+        ret_str += "  ".join("{: 10.5f}".format(v) for v in self.box_size) + "\n"
         return ret_str
 
     def molar(self, resn):
         focused_atoms = self.get_atoms(resn=resn)
         resis = {a.resi for a in focused_atoms}
-        volume = self.box_size[0] * self.box_size[1] * self.box_size[2]  # in nanometer
+        volume = self.box_size[0] * self.box_size[1] * self.box_size[2]  # in nanometer (also for triclinic boxes)
         return (len(resis) / constants.N_A) / (volume * 1e-24)  # nm^3 -> cm^3
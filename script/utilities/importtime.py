@@ -0,0 +1,69 @@
+"""
+Import time of the entry points (python -X importtime)
+
+python -m script.utilities.importtime exprorer_msmd --version
+python -m script.utilities.importtime --budget 300 probe_profile --version  # exit with 1 if exceeded
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+VERSION = "1.0.0"
+
+# dependencies which must be imported only in the stages using them
+HEAVY_MODULES = ["parmed", "Bio", "gridData", "scipy", "sklearn", "joblib", "GPUtil", "numpy", "pandas"]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def measure_imports(argv: List[str], cwd: Optional[Path] = None) -> Dict[str, Tuple[int, int, int]]:
+    """
+    run "python -X importtime {argv}"
+    output:
+        {module: (self [us], cumulative [us], nesting level)}
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv], cwd=cwd, capture_output=True, text=True, check=False
+    )
+    ret = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            ret[m.group(4)] = (int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2)
+    if not ret:
+        raise RuntimeError(f"no import time is reported by {' '.join(argv)}:\n{proc.stderr}")
+    return ret
+
+
+def total_time(imports: Dict[str, Tuple[int, int, int]]) -> int:
+    """total import time [us] (sum of the top-level imports)"""
+    return sum(cumulative for _, cumulative, level in imports.values() if level == 0)
+
+
+def heavy_imports(imports: Dict[str, Tuple[int, int, int]], heavy: List[str] = HEAVY_MODULES) -> List[str]:
+    """heavy packages imported (directly or indirectly)"""
+    packages = {name.split(".")[0] for name in imports}
+    return [name for name in heavy if name in packages]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import time of a python script (python -X importtime)")
+    parser.add_argument("--budget", type=float, help="exit with 1 if the total import time exceeds BUDGET [ms]")
+    parser.add_argument("--top", type=int, default=15, help="number of the slowest imports to be shown")
+    parser.add_argument("argv", nargs=argparse.REMAINDER, help="script and its arguments")
+    args = parser.parse_args()
+
+    imports = measure_imports(args.argv)
+    total = total_time(imports) / 1000
+    print(f"total: {total:.1f} ms ({len(imports)} modules)")
+    print(f"heavy modules: {', '.join(heavy_imports(imports)) or '-'}")
+    top_level = [(cumulative, name) for name, (_, cumulative, level) in imports.items() if level == 0]
+    for cumulative, name in sorted(top_level, reverse=True)[: args.top]:
+        print(f"{cumulative / 1000:10.1f} ms  {name}")
+    if args.budget is not None and total > args.budget:
+        print(f"import time exceeds the budget ({args.budget} ms)")
+        sys.exit(1)
@@ -0,0 +1,43 @@
+import signal
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from .const import REQUEUE_EXIT_CODE
+from .logger import logger
+
+
+class LocalScheduler(object):
+    """
+    A minimal local stand-in for a batch scheduler to test preemption and requeueing.
+
+    The n-th run of a job receives ``sig`` after ``preempt_after[n]`` seconds
+    (like "#SBATCH --signal"), and the job is requeued while it exits with REQUEUE_EXIT_CODE.
+    """
+
+    def __init__(self, preempt_after: Sequence[Optional[float]] = (), sig: int = signal.SIGUSR1, max_requeue: int = 10):
+        self.preempt_after = list(preempt_after)
+        self.sig = sig
+        self.max_requeue = max_requeue
+
+    def submit(self, command: List[str], cwd: Optional[Path] = None, env: Optional[dict] = None) -> List[int]:
+        """
+        run a job until it is not requeued
+        output:
+            exit status of each run
+        """
+        returncodes: List[int] = []
+        for attempt in range(self.max_requeue + 1):
+            proc = subprocess.Popen(command, cwd=cwd, env=env)
+            delay = self.preempt_after[attempt] if attempt < len(self.preempt_after) else None
+            try:
+                returncode = proc.wait(timeout=delay)
+            except subprocess.TimeoutExpired:
+                logger.info(f"send {signal.Signals(self.sig).name} to {command} (run {attempt})")
+                proc.send_signal(self.sig)
+                returncode = proc.wait()
+            returncodes.append(returncode)
+            if returncode != REQUEUE_EXIT_CODE:
+                break
+            logger.info(f"requeue {command}")
+        return returncodes
@@ -0,0 +1,170 @@
+"""
+Content-addressed manifest of the stages of a system
+
+Each stage (preprocess, simulation, gridding, pmap, ...) is identified by a key,
+the hash of its input files, the relevant setting subtree and the versions of scripts and tools.
+A stage is skipped if the key and the hashes of its outputs are unchanged since it finished,
+so that changes of inputs and settings invalidate exactly the stages depending on them
+(downstream stages see the changed outputs of upstream stages as their inputs).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from .logger import logger
+
+VERSION = "1.0.0"
+
+MANIFEST_FILE = "manifest.json"
+
+_CHUNK_BYTES = 2**20
+
+# manifests shared between threads of the same process
+_lock = threading.Lock()
+
+
+def _to_json(obj) -> str:
+    return json.dumps(obj, sort_keys=True, default=str)
+
+
+def file_hash(path: Path) -> str:
+    """
+    sha256 of a file (or of the file names and hashes in a directory)
+    """
+    sha = hashlib.sha256()
+    if path.is_dir():
+        for child in sorted(path.rglob("*")):
+            if child.is_file():
+                sha.update(f"{child.relative_to(path)}\0{file_hash(child)}\0".encode())
+        return sha.hexdigest()
+    with open(path, "rb") as fin:
+        for chunk in iter(lambda: fin.read(_CHUNK_BYTES), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _stat(path: Path) -> List[int]:
+    if path.is_dir():
+        stats = [os.stat(p) for p in path.rglob("*")] + [os.stat(path)]
+        return [sum(s.st_size for s in stats), max(s.st_mtime_ns for s in stats)]
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class StageManifest(object):
+    """
+    {sysdir}/manifest.json
+    stages:
+        {stage: {"key", "status" ("running" or "finished"), "inputs", "settings", "versions", "outputs", "updated"}}
+    files:
+        {path: [size, mtime_ns, sha256]} (files are hashed again only if the size or mtime is changed)
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.stages: Dict[str, dict] = {}
+        self.files: Dict[str, list] = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            self.stages = data.get("stages", {})
+            self.files = data.get("files", {})
+
+    def hash(self, path: Path) -> str:
+        path = Path(path)
+        stat = _stat(path)
+        cached = self.files.get(str(path))
+        if cached is not None and cached[:2] == stat:
+            return cached[2]
+        digest = file_hash(path)
+        self.files[str(path)] = stat + [digest]
+        return digest
+
+    def fingerprint(self, inputs: List[Path], settings: Optional[dict] = None, versions: Optional[dict] = None) -> dict:
+        """
+        input:
+            inputs: input files (or directories) of a stage
+            settings: setting subtree used by the stage
+            versions: versions of scripts and external tools
+        output:
+            {"key", "inputs", "settings", "versions"}
+        """
+        missing = [str(p) for p in inputs if not Path(p).exists()]
+        if missing:
+            raise FileNotFoundError(f"input files of the stage are not found: {', '.join(missing)}")
+        ret = {
+            "inputs": {str(p): self.hash(p) for p in inputs},
+            "settings": json.loads(_to_json(settings or {})),
+            "versions": json.loads(_to_json(versions or {})),
+        }
+        ret["key"] = hashlib.sha256(_to_json(ret).encode()).hexdigest()
+        return ret
+
+    def is_up_to_date(self, stage: str, fingerprint: dict) -> bool:
+        """
+        whether the stage finished with the same key and its outputs are unchanged
+        """
+        entry = self.stages.get(stage)
+        if entry is None or entry["status"] != "finished" or entry["key"] != fingerprint["key"]:
+            return False
+        for path, digest in entry["outputs"].items():
+            if not Path(path).exists() or self.hash(Path(path)) != digest:
+                logger.info(f"{stage}: {path} is changed or removed")
+                return False
+        return True
+
+    def is_stale(self, stage: str, fingerprint: dict) -> bool:
+        """
+        whether the stage was started (or finished) with another key (its partial outputs must be discarded)
+        """
+        entry = self.stages.get(stage)
+        return entry is not None and entry["key"] != fingerprint["key"]
+
+    def changes(self, stage: str, fingerprint: dict) -> List[str]:
+        """
+        names of the changed inputs, settings and versions since the last run of the stage
+        """
+        entry = self.stages.get(stage)
+        if entry is None:
+            return ["(not recorded)"]
+        ret = [p for p, h in fingerprint["inputs"].items() if entry["inputs"].get(p) != h]
+        ret += [f"settings.{k}" for k in _diff_keys(entry["settings"], fingerprint["settings"])]
+        ret += [f"versions.{k}" for k in _diff_keys(entry["versions"], fingerprint["versions"])]
+        return ret
+
+    def start(self, stage: str, fingerprint: dict) -> None:
+        self._update(stage, dict(fingerprint, status="running", outputs={}))
+
+    def finish(self, stage: str, fingerprint: dict, outputs: List[Union[Path, str]]) -> None:
+        self._update(stage, dict(fingerprint, status="finished", outputs={str(p): self.hash(Path(p)) for p in outputs}))
+
+    def invalidate(self, stage: str) -> None:
+        with _lock:
+            self.stages.pop(stage, None)
+            self._write()
+
+    def _update(self, stage: str, entry: dict) -> None:
+        entry["updated"] = datetime.now().isoformat(timespec="seconds")
+        with _lock:
+            self.stages[stage] = entry
+            self._write()
+
+    def _write(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"stages": self.stages, "files": self.files}, indent=1))
+        os.replace(tmp, self.path)
+
+
+def _diff_keys(old: dict, new: dict, prefix: str = "") -> List[str]:
+    ret = []
+    for key in sorted(set(old) | set(new)):
+        if isinstance(old.get(key), dict) and isinstance(new.get(key), dict):
+            ret += _diff_keys(old[key], new[key], f"{prefix}{key}.")
+        elif old.get(key) != new.get(key):
+            ret.append(f"{prefix}{key}")
+    return ret
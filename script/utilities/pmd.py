@@ -1,7 +1,13 @@
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
+import numpy.typing as npt
 import parmed as pmd
+from scipy.spatial import cKDTree
+
+from .box import box_angles, box_vectors, inside_cell, wrap_to_cell
+from .const import IONS, WATERS
 
 
 def _convert_top_only(intop: Path, outtop: Path) -> Path:
@@ -38,3 +44,83 @@ def convert(intop: Path, outtop: Path, inxyz: Optional[Path] = None, outxyz: Opt
     else:
         ret = _convert_top_only(intop, outtop)
         return ret, None
+
+
+def count_parm7_atoms(top: Path) -> int:
+    """the number of atoms (NATOM of POINTERS) of an amber topology file without loading it"""
+    with open(top) as fin:
+        for line in fin:
+            if line.startswith("%FLAG POINTERS"):
+                fin.readline()  # %FORMAT
+                return int(fin.readline().split()[0])
+    raise ValueError(f"POINTERS are not found: {top}")
+
+
+def strip_solvent(top: Path, n_atoms: int) -> Path:
+    """
+    Strip water and ions from a topology file in place if it has more atoms than ``n_atoms``
+    (trajectories written with "compressed-x-grps" contain only the non-water group).
+    """
+    system = pmd.load_file(str(top))
+    if len(system.atoms) == n_atoms:
+        return top
+    system.strip(":" + ",".join(WATERS + IONS))
+    if len(system.atoms) != n_atoms:
+        raise ValueError(
+            f"The number of atoms in the trajectory ({n_atoms}) does not match the topology "
+            f"with ({len(system.atoms)}) or without water and ions: {top}"
+        )
+    system.save(str(top), overwrite=True)
+    return top
+
+
+def cut_box(
+    top: Path, xyz: Path, shape: str, size: float, origin: npt.ArrayLike = (0.0, 0.0, 0.0), clash: float = 2.0
+) -> tuple[Path, Path]:
+    """
+    Cut a solvated rectangular system into the Wigner-Seitz cell around ``origin`` in place
+    (dodecahedron / octahedron boxes, see utilities.box).
+    Single-residue molecules (probes and ions) are wrapped into the cell,
+    and water molecules outside the cell or within ``clash`` A of periodic images are removed.
+    """
+    system = pmd.load_file(str(top), xyz=str(xyz))
+    coords = system.coordinates - np.asarray(origin)
+    res_ids = np.array([a.residue.idx for a in system.atoms])
+    is_water = np.array([r.name in WATERS for r in system.residues])
+
+    # wrap molecules of one residue by their centers
+    bonded = np.zeros(len(system.residues), dtype=bool)
+    for bond in system.bonds:
+        if bond.atom1.residue is not bond.atom2.residue:
+            bonded[[bond.atom1.residue.idx, bond.atom2.residue.idx]] = True
+    centers = np.zeros((len(system.residues), 3))
+    np.add.at(centers, res_ids, coords)
+    centers /= np.bincount(res_ids, minlength=len(system.residues))[:, None]
+    shifts = wrap_to_cell(centers, shape, size)
+    shifts[is_water | bonded] = 0.0
+    coords += shifts[res_ids]
+
+    # water molecules are kept if their first atoms (oxygen) are in the cell
+    first_atoms = np.array([r.atoms[0].idx for r in system.residues])
+    removed = is_water & ~inside_cell(coords[first_atoms], shape, size)
+
+    # remove water molecules overlapping with periodic images (near the faces of the cell)
+    kept = ~removed[res_ids]
+    shell = np.where(kept & ~inside_cell(coords, shape, size, margin=clash))[0]
+    tree = cKDTree(coords[shell])
+    lattice = np.array([[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1) if i or j or k])
+    for vector in lattice @ box_vectors(shape, size):
+        for i, neighbors in enumerate(tree.query_ball_point(coords[shell] + vector, clash)):
+            for j in neighbors:
+                res_i, res_j = res_ids[shell[i]], res_ids[shell[j]]
+                if is_water[res_i] and (not is_water[res_j] or res_i > res_j):
+                    removed[res_i] = True
+                elif is_water[res_j] and not is_water[res_i]:
+                    removed[res_j] = True
+
+    system.coordinates = coords
+    system.strip(removed[res_ids])
+    system.box = [size, size, size, *box_angles(shape)]
+    system.save(str(top), overwrite=True)
+    system.save(str(xyz), overwrite=True)
+    return top, xyz
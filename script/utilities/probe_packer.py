@@ -0,0 +1,259 @@
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from . import const
+from .box import cell_extent, inside_cell
+from .executable.packmol import Packmol
+from .logger import logger
+
+# 27 neighbouring cells (including the cell itself)
+_NEIGHBOR_OFFSETS = np.array(
+    [[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)],
+    dtype=np.int64,
+)
+
+
+class CellList(object):
+    """
+    Cell-list occupancy grid for clash detection.
+    The edge length of each cell equals the tolerance,
+    so that a clash check of an atom only needs the 27 neighbouring cells.
+    The grid has one padding cell on each side of the given region.
+    """
+
+    def __init__(
+        self,
+        lower: npt.NDArray[np.float_],
+        upper: npt.NDArray[np.float_],
+        tolerance: float,
+        capacity: int = 8,
+    ):
+        self.tolerance = float(tolerance)
+        self.lower = np.asarray(lower, dtype=np.float64) - self.tolerance
+        self.shape = tuple(np.ceil((np.asarray(upper) - np.asarray(lower)) / self.tolerance).astype(int) + 2)
+        self.count = np.zeros(self.shape, dtype=np.int32)
+        self.coords = np.full((*self.shape, capacity, 3), np.inf, dtype=np.float32)
+
+    @property
+    def capacity(self) -> int:
+        return self.coords.shape[3]
+
+    def _grow(self, capacity: int) -> None:
+        coords = np.full((*self.shape, capacity, 3), np.inf, dtype=np.float32)
+        coords[:, :, :, : self.capacity] = self.coords
+        self.coords = coords
+
+    def _cell_index(self, coords: npt.NDArray) -> npt.NDArray[np.int64]:
+        return np.floor((coords - self.lower) / self.tolerance).astype(np.int64)
+
+    def add(self, coords: npt.NDArray) -> None:
+        """
+        register atoms to the grid
+        atoms outside the grid (including padding cells) are ignored
+        """
+        coords = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+        idx = self._cell_index(coords)
+        inside = np.all((idx >= 0) & (idx < np.array(self.shape)), axis=1)
+        if not np.any(inside):
+            return
+        coords, idx = coords[inside], idx[inside]
+
+        flat = np.ravel_multi_index(idx.T, self.shape)
+        order = np.argsort(flat, kind="stable")
+        flat = flat[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(flat)) + 1]
+        rank = np.arange(len(flat)) - np.repeat(starts, np.diff(np.r_[starts, len(flat)]))
+        slot = self.count.reshape(-1)[flat] + rank
+        if slot.max() >= self.capacity:
+            self._grow(max(int(slot.max()) + 1, self.capacity * 2))
+
+        self.coords.reshape(-1, self.capacity, 3)[flat, slot] = coords[order]
+        np.add.at(self.count.reshape(-1), flat, 1)
+
+    def clashes(self, coords: npt.NDArray) -> npt.NDArray[np.bool_]:
+        """
+        check clashes of molecules against registered atoms
+        input:
+            coords: (n_molecules, n_atoms, 3) array
+        output:
+            (n_molecules,) boolean array, True if any atom is closer than the tolerance
+        """
+        idx = self._cell_index(coords)
+        neighbors = idx[:, :, None, :] + _NEIGHBOR_OFFSETS  # (n_mol, n_atoms, 27, 3)
+        neighbors = np.clip(neighbors, 0, np.array(self.shape) - 1)
+        flat = np.ravel_multi_index(np.moveaxis(neighbors, -1, 0), self.shape)
+        occupied = self.count.reshape(-1)[flat] > 0
+        ret = np.zeros(len(coords), dtype=bool)
+        candidates = np.flatnonzero(np.any(occupied, axis=(1, 2)))  # empty neighbourhood => no clash
+        if len(candidates) == 0:
+            return ret
+        cell_coords = self.coords.reshape(-1, self.capacity, 3)[flat[candidates]]
+        d2 = np.sum((cell_coords - coords[candidates, :, None, None, :]) ** 2, axis=-1)
+        ret[candidates] = np.any(d2 < self.tolerance**2, axis=(1, 2, 3))
+        return ret
+
+
+def random_rotations(n: int, rng: np.random.Generator) -> npt.NDArray[np.float_]:
+    """
+    generate uniformly distributed random rotation matrices
+    using random unit quaternions
+    """
+    q = rng.normal(size=(n, 4))
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    w, x, y, z = q.T
+    return np.stack(
+        [
+            np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+            np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+            np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1),
+        ],
+        axis=1,
+    )
+
+
+def _read_pdb_atoms(pdb: Path, keep_ter: bool = False) -> Tuple[List[str], npt.NDArray[np.float_]]:
+    """
+    read ATOM/HETATM (and TER) records from a pdb file
+    coordinates of TER records are not returned
+    """
+    lines = []
+    coords = []
+    with open(pdb) as fin:
+        for line in fin:
+            line = line.rstrip("\n")
+            if line.startswith(("ATOM", "HETATM")):
+                lines.append(line.ljust(54))
+                coords.append([float(line[30:38]), float(line[38:46]), float(line[46:54])])
+            elif keep_ter and line.startswith("TER"):
+                lines.append("TER")
+    return lines, np.array(coords, dtype=np.float64).reshape(-1, 3)
+
+
+class ProbePacker(Packmol):
+    """
+    Built-in probe placement engine which can be used instead of packmol.
+    Probe molecules are randomly rotated and inserted into the box,
+    and rejected if they clash with the protein or already-placed probes.
+    The output pdb has the same layout as the packmol output (add_amber_ter).
+    """
+
+    def __init__(self, debug=False, tolerance: float = 2.0, batch_size: int = 64, max_trials_per_probe: int = 1000):
+        super(ProbePacker, self).__init__(debug=debug)
+        self.tolerance = tolerance
+        self.batch_size = batch_size
+        self.max_trials_per_probe = max_trials_per_probe
+
+    def _place(self, probe_coords: npt.NDArray, num: int, rng: np.random.Generator) -> npt.NDArray[np.float_]:
+        """
+        place `num` copies of a probe molecule into the box
+        output:
+            (num, n_atoms, 3) array of probe coordinates
+        """
+        half = self.box_size / 2  # the inscribed radius of the box
+        extent = cell_extent(self.box_shape, self.box_size)
+        template = probe_coords - probe_coords.mean(axis=0)
+        radius = np.max(np.linalg.norm(template, axis=1))
+        if radius >= half:
+            raise RuntimeError(f"probe molecule (radius {radius:.1f} A) does not fit in the box")
+
+        cells = CellList(-extent, extent, self.tolerance)
+        cells.add(self.protein_coords)
+
+        placed: List[npt.NDArray] = []
+        self.trials = 0
+        failures = 0  # consecutive trials without any accepted probe
+        while len(placed) < num:
+            if failures >= self.max_trials_per_probe:
+                raise RuntimeError(
+                    f"probe placement failed: only {len(placed)} of {num} probes were placed in {self.trials} trials"
+                )
+            rot = random_rotations(self.batch_size, rng)
+            centers = rng.uniform(-extent + radius, extent - radius, size=(self.batch_size, 3))
+            candidates = np.einsum("ij,bkj->bik", template, rot) + centers[:, None, :]
+            if self.box_shape != "cubic":
+                candidates = candidates[inside_cell(centers, self.box_shape, self.box_size, margin=radius)]
+            self.trials += self.batch_size
+
+            accepted: List[npt.NDArray] = []
+            for cand in candidates[~cells.clashes(candidates)]:
+                # probes accepted in this batch are not registered to the grid yet
+                if any(np.min(np.sum((a[:, None] - cand[None]) ** 2, axis=-1)) < self.tolerance**2 for a in accepted):
+                    continue
+                accepted.append(cand)
+                if len(placed) + len(accepted) == num:
+                    break
+            if len(accepted) > 0:
+                cells.add(np.concatenate(accepted))
+                placed.extend(accepted)
+                failures = 0
+            else:
+                failures += self.batch_size
+
+        return np.array(placed).reshape(num, len(template), 3)
+
+    def run(self, box_pdb: Optional[Path] = None, seed=-1):
+        self.box_pdb = (
+            box_pdb if box_pdb is not None else Path(tempfile.mkstemp(prefix=const.TMP_PREFIX, suffix=const.EXT_PDB)[1])
+        )
+        self.seed = seed
+        rng = np.random.default_rng(None if seed < 0 else seed)
+
+        protein_lines, protein_coords = _read_pdb_atoms(self.protein_pdb, keep_ter=True)
+        self.protein_coords = protein_coords - protein_coords.mean(axis=0)  # "centerofmass" of packmol
+        probe_lines, probe_coords = _read_pdb_atoms(self.cosolv_pdb)
+
+        num = self._num_probes()
+        if num <= 0:
+            warnings.warn("There is only a protein molecule.", RuntimeWarning)
+
+        start = time.perf_counter()
+        self.trials = 0
+        probes = self._place(probe_coords, num, rng) if num > 0 else np.zeros((0, len(probe_lines), 3))
+        elapsed = time.perf_counter() - start
+        self.throughput = num / elapsed if elapsed > 0 else float("inf")
+        logger.info(
+            f"ProbePacker: {num} probes were placed in {elapsed:.2f} s "
+            f"({self.throughput:.1f} probes/s, {self.trials} trials)"
+        )
+
+        self._write(protein_lines, probe_lines, probes)
+        return self
+
+    def _write(self, protein_lines: List[str], probe_lines: List[str], probes: npt.NDArray) -> None:
+        serial = 0
+
+        def atom_line(line: str, xyz: npt.NDArray, resi: Optional[int] = None) -> str:
+            nonlocal serial
+            serial += 1
+            resi_str = line[22:26] if resi is None else f"{resi % 10000:4d}"
+            return (
+                f"{line[:6]}{serial % 100000:5d}{line[11:22]}{resi_str}{line[26:30]}"
+                f"{xyz[0]:8.3f}{xyz[1]:8.3f}{xyz[2]:8.3f}{line[54:]}".rstrip()
+            )
+
+        out = []
+        coords = iter(self.protein_coords)
+        for line in protein_lines:
+            if line == "TER":
+                if out and out[-1] != "TER":
+                    out.append("TER")
+            else:
+                out.append(atom_line(line, next(coords)))
+        if out and out[-1] != "TER":
+            out.append("TER")
+
+        last_resi = max([int(line[22:26]) for line in protein_lines if line != "TER"] + [0])
+        for i, probe in enumerate(probes):
+            for line, xyz in zip(probe_lines, probe):
+                out.append(atom_line(line, xyz, resi=last_resi + i + 1))
+            out.append("TER")
+        out.append("END")
+
+        with open(self.box_pdb, "w") as fout:
+            fout.write("\n".join(out) + "\n")
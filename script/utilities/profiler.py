@@ -0,0 +1,195 @@
+"""
+Per-stage profiles with cProfile
+
+profiler.start(profile_dir(workdir, "exprorer_msmd"))
+with profiler.stage("postprocess"):
+    ...
+
+The outermost span (utilities.trace.span) of each thread is profiled as a stage,
+and the profiles of a stage run in joblib worker threads are merged (e.g. preprocess of all systems).
+Functions run in worker processes are profiled with profiled(func, stage) and merged in the parent.
+At exit, {stage}.prof (pstats, e.g. snakeviz) and {stage}.collapsed (collapsed stacks for flamegraph.pl
+and speedscope) are written to the directory.
+cProfile records only callers and callees, so the collapsed stacks distribute the time of a function
+to its callers in proportion to their calls (recursive calls are not expanded).
+"""
+
+import atexit
+import cProfile
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .logger import logger
+
+VERSION = "1.0.0"
+
+MAX_DEPTH = 64
+MIN_FRACTION = 1e-4  # stacks shorter than this fraction of the stage are omitted from the collapsed stacks
+PART_SUFFIX = ".part.prof"  # profiles written by worker processes
+
+Func = Tuple[str, int, str]  # (file, line, function) of pstats
+
+
+def _label(func: Func) -> str:
+    filename, line, name = func
+    if filename == "~":  # built-in functions
+        return name.replace(";", ",")
+    return f"{name} ({Path(filename).name}:{line})".replace(";", ",")
+
+
+def collapse(stats: pstats.Stats, root: str) -> Dict[str, int]:
+    """
+    collapsed stacks ("root;caller;callee" -> microseconds of the own time) of a profile
+    """
+    callees: Dict[Func, Dict[Func, float]] = defaultdict(dict)
+    for func, (_, _, _, _, callers) in stats.stats.items():  # type: ignore
+        for caller, values in callers.items():
+            callees[caller][func] = values[3]
+    roots = [func for func, (_, _, _, _, callers) in stats.stats.items() if not callers]  # type: ignore
+    min_time = max(sum(stats.stats[func][3] for func in roots) * MIN_FRACTION, 1e-6)  # type: ignore
+    ret: Dict[str, int] = defaultdict(int)
+
+    def visit(func: Func, stack: List[str], path: set, weight: float) -> None:
+        _, _, tt, ct, _ = stats.stats[func]  # type: ignore
+        scale = weight / ct if ct > 0 else 0.0
+        stack = stack + [_label(func)]
+        own = int(round(tt * scale * 1e6))
+        if own > 0:
+            ret[";".join(stack)] += own
+        if len(stack) >= MAX_DEPTH:
+            return
+        for callee, time_from_caller in callees.get(func, {}).items():
+            if callee not in path and time_from_caller * scale >= min_time:
+                visit(callee, stack, path | {callee}, time_from_caller * scale)
+
+    for func in roots:
+        visit(func, [root], {func}, stats.stats[func][3])  # type: ignore
+    return dict(ret)
+
+
+def write_collapsed(path: Path, stacks: Dict[str, int]) -> None:
+    with open(path, "w") as fout:
+        for stack, value in sorted(stacks.items()):
+            fout.write(f"{stack} {value}\n")
+
+
+def _file_name(stage: str) -> str:
+    return re.sub(r"[^\w-]", "_", stage)
+
+
+class Profiler(object):
+    """
+    cProfile profiles merged by stage
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory: Optional[Path] = None
+        self.stats: Dict[str, pstats.Stats] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self, directory: Path) -> None:
+        """
+        start profiling stages and write the profiles to directory at exit
+        """
+        self.enabled = True
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.stats = {}
+        atexit.register(self.save)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        # a thread has a profiler at a time: stages nested in a stage are included in the outer one
+        if not self.enabled or getattr(self._local, "active", False):
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Python >= 3.12 allows a profiler per process: concurrent stages are not profiled
+            logger.debug(f"stage {name} is not profiled: another stage is being profiled")
+            yield
+            return
+        self._local.active = True
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            self.add(name, profile)
+
+    def add(self, name: str, profile) -> None:
+        """merge a profile (cProfile.Profile or a .prof file) into the stage"""
+        with self._lock:
+            if name in self.stats:
+                self.stats[name].add(profile)
+            else:
+                self.stats[name] = pstats.Stats(profile)
+
+    def save(self) -> None:
+        """
+        write {stage}.prof and {stage}.collapsed, merging the profiles of worker processes
+        """
+        if self.directory is None:
+            return
+        names = {_file_name(name): name for name in self.stats}
+        for part in sorted(self.directory.glob(f"*{PART_SUFFIX}")):
+            file_name = part.name[: -len(PART_SUFFIX)].rsplit(".", 2)[0]
+            self.add(names.get(file_name, file_name), str(part))
+            part.unlink()
+        with self._lock:
+            stats = dict(self.stats)
+        for name, stage_stats in stats.items():
+            prefix = self.directory / _file_name(name)
+            stage_stats.dump_stats(f"{prefix}.prof")
+            write_collapsed(Path(f"{prefix}.collapsed"), collapse(stage_stats, name))
+        if stats:
+            logger.info(f"profiles of {', '.join(stats)}: {self.directory}")
+
+
+profiler = Profiler()
+
+
+class _ProfiledCall(object):
+    """picklable function profiled in a worker process"""
+
+    def __init__(self, func: Callable, stage: str, directory: Path):
+        self.func = func
+        self.stage = stage
+        self.directory = directory
+
+    def __call__(self, *args, **kwargs):
+        profile = cProfile.Profile()
+        profiler._local.active = True  # stages of the function (e.g. forked with the profiler enabled)
+        profile.enable()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            profile.disable()
+            profiler._local.active = False
+            name = f"{_file_name(self.stage)}.{os.getpid()}.{uuid.uuid4().hex}{PART_SUFFIX}"
+            profile.dump_stats(str(Path(self.directory) / name))
+
+
+def profiled(func: Callable, stage: str) -> Callable:
+    """
+    func profiled as a part of the stage in worker processes (e.g. Parallel(...)(delayed(profiled(f, "resenv"))(x)))
+    """
+    if not profiler.enabled or profiler.directory is None:
+        return func
+    return _ProfiledCall(func, stage, profiler.directory)
+
+
+def profile_dir(workdir: Path, prog: str) -> Path:
+    """{workdir}/profile/{prog}_{YYYYmmdd-HHMMSS}_{pid}"""
+    return Path(workdir) / "profile" / f"{prog}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}"
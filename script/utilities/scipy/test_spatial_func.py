@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from script.utilities.scipy.spatial_func import estimate_volume, rasterize_spheres, sphere_stencil
+
+
+def test_sphere_stencil():
+    stencil = sphere_stencil(1.0, (1.0, 1.0, 1.0))
+    assert len(stencil) == 7  # center and 6 faces
+    assert sphere_stencil(1.0, (1.0, 1.0, 1.0)) is stencil  # cached
+
+
+def test_single_sphere():
+    points = np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 10.0], [0.0, 10.0, 0.0], [10.0, 0.0, 0.0]])
+    radii = np.full(4, 3.0)
+    expected = 4 * (4 / 3) * np.pi * 3.0**3
+    assert estimate_volume(points, radii) == pytest.approx(expected, rel=0.1)
+
+
+def test_overlapping_spheres():
+    points = np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0], [2.0, 0.0, 1.0]])
+    separated = estimate_volume(points * 10, np.full(3, 3.0))
+    overlapped = estimate_volume(points, np.full(3, 3.0))
+    assert overlapped < separated
+
+
+def test_multiple_radii():
+    points = np.array([[0.0, 0.0, 0.0], [20.0, 20.0, 20.0]])
+    radii = np.array([2.0, 4.0])
+    expected = (4 / 3) * np.pi * (2.0**3 + 4.0**3)
+    assert estimate_volume(points, radii) == pytest.approx(expected, rel=0.1)
+
+
+def test_rasterize_spheres_is_bit_packed():
+    points = np.array([[0.0, 0.0, 0.0], [10.0, 10.0, 10.0]])
+    packed, lower, shape = rasterize_spheres(points, np.full(2, 2.0), (0.5, 0.5, 0.5))
+    assert packed.dtype == np.uint8
+    assert packed.shape == (shape[0], shape[1], (shape[2] + 7) // 8)
+    occupied = np.unpackbits(packed, axis=2)[:, :, : shape[2]].astype(bool)
+    center = np.rint((points[0] - lower) / 0.5).astype(int)
+    assert occupied[tuple(center)]
+    assert not occupied[tuple(center + [5, 0, 0])]  # 2.5 A away
+
+
+def test_rasterize_spheres_in_chunks(monkeypatch):
+    from script.utilities.scipy import spatial_func
+
+    monkeypatch.setattr(spatial_func, "_CHUNK_VOXELS", 1000)  # several chunks and slabs of each radius
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0.0, 10.0, (200, 3))
+    radii = rng.choice([1.0, 1.5], 200)
+    packed, lower, shape = rasterize_spheres(points, radii, (0.4, 0.5, 0.3))
+    occupied = np.unpackbits(packed, axis=2)[:, :, : shape[2]].astype(bool)
+    expected = np.zeros(shape, dtype=bool)
+    centers = np.rint((points - lower) / [0.4, 0.5, 0.3]).astype(int)
+    for center, radius in zip(centers, radii):
+        voxels = center + sphere_stencil(float(radius), (0.4, 0.5, 0.3))
+        expected[voxels[:, 0], voxels[:, 1], voxels[:, 2]] = True
+    assert np.array_equal(occupied, expected)
+    assert not np.unpackbits(packed, axis=2)[:, :, shape[2] :].any()
+
+
+def test_collinear_points():
+    # the grid must not collapse along the axes without extent
+    points = np.array([[0.0, 0.0, 0.0], [0.1, 0.0, 0.0]])
+    assert estimate_volume(points, np.full(2, 3.4)) == pytest.approx((4 / 3) * np.pi * 3.4**3, rel=0.1)
+
+
+def test_adaptive_refinement():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 20, size=(200, 3))
+    radii = rng.choice([2.9, 3.2, 3.4], size=200)
+    coarse = estimate_volume(points, radii, tolerance=None)
+    refined = estimate_volume(points, radii, tolerance=0.01)
+    finest = estimate_volume(points, radii, tolerance=0.0, max_refinement=2)
+    assert abs(refined - finest) < abs(coarse - finest) + 1e-6
+    assert refined == pytest.approx(finest, rel=0.05)
@@ -0,0 +1,195 @@
+"""
+Staging of work directories on node-local scratch (local disk or tmpfs)
+
+Inputs are copied to the scratch directory, the work (mdrun, cpptraj) runs there,
+and new or modified files are copied back to the work directory in the background
+and after the work. Every copy is verified with sha256 and replaced atomically,
+so the work directory never contains partially copied files.
+"""
+
+import fnmatch
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .logger import logger
+from .util import expandpath
+
+VERSION = "1.0.0"
+
+_CHUNK_BYTES = 2**20
+
+
+def _copy_with_hash(src: Path, dst: Path) -> str:
+    """copy a file and return sha256 of the copied bytes"""
+    sha = hashlib.sha256()
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for chunk in iter(lambda: fin.read(_CHUNK_BYTES), b""):
+            sha.update(chunk)
+            fout.write(chunk)
+    shutil.copystat(src, dst)
+    return sha.hexdigest()
+
+
+def _hash(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as fin:
+        for chunk in iter(lambda: fin.read(_CHUNK_BYTES), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def verified_copy(src: Path, dst: Path, retry: int = 1) -> str:
+    """
+    copy a file through a temporary file in the destination directory and verify it with sha256
+    output:
+        sha256 of the copied file
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.parent / f".{dst.name}.sync"
+    for _ in range(retry + 1):
+        digest = _copy_with_hash(src, tmp)
+        if _hash(tmp) == digest:
+            os.replace(tmp, dst)
+            return digest
+        logger.warn(f"checksum mismatch in copying {src} to {dst}")
+    tmp.unlink()
+    raise RuntimeError(f"failed to copy {src} to {dst}: checksum mismatch")
+
+
+def _stat(path: Path) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ScratchStage(object):
+    """
+    Run a work directory on scratch
+
+    with ScratchStage(workdir, "/local/scratch") as scratchdir:
+        ...  # run in scratchdir
+
+    input:
+        workdir: directory where outputs are synced back
+        scratch_root: node-local directory (environment variables are expanded)
+        inputs: files staged in (the relative paths from workdir are kept). The whole workdir if None.
+        discard: glob patterns of large intermediates which are not synced back (e.g. "equil*.xtc", "*.trr")
+        interval: interval of the background sync [s] (no background sync if 0)
+    """
+
+    def __init__(
+        self,
+        workdir: Path,
+        scratch_root: Path,
+        inputs: Optional[List[Path]] = None,
+        discard: Sequence[str] = (),
+        interval: float = 300,
+    ):
+        self.workdir = Path(workdir)
+        self.scratch_root = expandpath(Path(scratch_root))
+        self.inputs = inputs
+        self.discard = list(discard)
+        self.interval = interval
+        self.scratchdir: Optional[Path] = None
+        self._synced: Dict[Path, Tuple[int, int]] = {}  # relative path -> stat of the synced (or staged) file
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> Path:
+        self.scratch_root.mkdir(parents=True, exist_ok=True)
+        self.scratchdir = Path(tempfile.mkdtemp(prefix=f"{self.workdir.name}_", dir=self.scratch_root))
+        self.stage_in()
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._background_sync, daemon=True)
+            self._thread.start()
+        return self.scratchdir
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        # outputs of failed or interrupted work (e.g. checkpoints) are also synced back
+        try:
+            self.sync()
+        except Exception:
+            logger.error(f"outputs are left in {self.scratchdir}")
+            raise
+        shutil.rmtree(self.scratchdir, ignore_errors=True)
+        return False
+
+    def stage_in(self) -> None:
+        assert self.scratchdir is not None
+        if self.inputs is None:
+            paths = [p for p in self.workdir.rglob("*") if p.is_file() or p.is_symlink()]
+        else:
+            paths = [Path(p) if Path(p).is_absolute() else self.workdir / p for p in self.inputs]
+        for path in paths:
+            rel = path.relative_to(self.workdir)
+            dst = self.scratchdir / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if path.is_symlink() and not os.path.isabs(os.readlink(path)) and self.inputs is None:
+                os.symlink(os.readlink(path), dst)
+                continue
+            verified_copy(path, dst)  # symbolic links given as inputs are resolved
+            self._synced[rel] = _stat(dst)
+        logger.info(f"{len(paths)} files are staged in {self.scratchdir}")
+
+    def _discarded(self, rel: Path) -> bool:
+        return any(fnmatch.fnmatch(str(rel), p) or fnmatch.fnmatch(rel.name, p) for p in self.discard)
+
+    def sync(self) -> List[Path]:
+        """
+        copy new or modified files back to workdir
+        output:
+            synced files (relative paths)
+        """
+        assert self.scratchdir is not None
+        synced = []
+        with self._lock:
+            for path in sorted(self.scratchdir.rglob("*")):
+                rel = path.relative_to(self.scratchdir)
+                if path.is_dir() or self._discarded(rel) or rel.name.endswith(".sync"):
+                    continue
+                dst = self.workdir / rel
+                if path.is_symlink():
+                    target = os.readlink(path)
+                    if not os.path.islink(dst) or os.readlink(dst) != target:
+                        dst.parent.mkdir(parents=True, exist_ok=True)
+                        if dst.exists() or dst.is_symlink():
+                            dst.unlink()
+                        os.symlink(target, dst)
+                        synced.append(rel)
+                    continue
+                try:
+                    stat = _stat(path)
+                    if self._synced.get(rel) == stat:
+                        continue
+                    verified_copy(path, dst)
+                except FileNotFoundError:
+                    continue  # removed during the sync (e.g. backup files of mdrun)
+                self._synced[rel] = stat
+                synced.append(rel)
+        if synced:
+            logger.debug(f"{len(synced)} files are synced from {self.scratchdir} to {self.workdir}")
+        return synced
+
+    def _background_sync(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warn(f"background sync of {self.scratchdir} failed: {e}")
+
+
+def scratch_settings(setting_general: dict) -> dict:
+    """keyword arguments of ScratchStage from the general settings"""
+    return {
+        "scratch_root": setting_general["scratch"],
+        "discard": setting_general.get("scratch_discard") or [],
+        "interval": setting_general.get("scratch_sync_interval", 300),
+    }
@@ -0,0 +1,208 @@
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Union
+
+import gridData
+import numpy as np
+import numpy.typing as npt
+
+
+class SparseGrid(object):
+    """
+    Sparse voxel representation of a PMAP-like grid.
+
+    A voxel takes one of three kinds of values:
+        - ``values[i]`` if it is listed in ``indices`` (flat indices in C order),
+        - ``background`` if it is inside ``mask`` but not listed
+          (e.g. zero occupancy),
+        - ``fill`` if it is outside ``mask`` (e.g. -1 for PMAPs).
+    The geometry (``origin``, ``delta``) follows gridData.Grid:
+    ``origin`` is the center of the voxel (0, 0, 0).
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, int, int],
+        origin: npt.ArrayLike,
+        delta: npt.ArrayLike,
+        mask: npt.NDArray[np.bool_],
+        indices: npt.NDArray[np.int64],
+        values: npt.NDArray[np.float_],
+        background: float = 0.0,
+        fill: float = -1.0,
+    ):
+        self.shape = tuple(int(n) for n in shape)
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.delta = np.asarray(delta, dtype=np.float64)
+        self.mask = np.asarray(mask, dtype=bool).reshape(self.shape)
+        order = np.argsort(indices, kind="stable")
+        self.indices = np.asarray(indices, dtype=np.int64)[order]
+        self.values = np.asarray(values, dtype=np.float64)[order]
+        self.background = float(background)
+        self.fill = float(fill)
+
+    @classmethod
+    def from_grid(
+        cls, g: gridData.Grid, mask: Optional[npt.NDArray] = None, background: float = 0.0, fill: float = -1.0
+    ) -> "SparseGrid":
+        """
+        Create a sparse grid from a dense grid.
+        If ``mask`` is not given, voxels whose values differ from ``fill`` are regarded as masked.
+        """
+        mask = g.grid != fill if mask is None else np.asarray(mask, dtype=bool)
+        flat = g.grid.reshape(-1)
+        indices = np.flatnonzero(mask.reshape(-1) & (flat != background))
+        return cls(g.grid.shape, g.origin, g.delta, mask, indices, flat[indices], background=background, fill=fill)
+
+    def copy(self) -> "SparseGrid":
+        return SparseGrid(
+            self.shape,
+            self.origin.copy(),
+            self.delta.copy(),
+            self.mask.copy(),
+            self.indices.copy(),
+            self.values.copy(),
+            background=self.background,
+            fill=self.fill,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """memory of the arrays (the mask has a byte per voxel; its bits are packed only by save)"""
+        return self.indices.nbytes + self.values.nbytes + self.mask.nbytes
+
+    def to_dense(self) -> npt.NDArray[np.float_]:
+        dense = np.full(self.shape, self.fill, dtype=np.float64)
+        dense[self.mask] = self.background
+        dense.reshape(-1)[self.indices] = self.values
+        return dense
+
+    def to_grid(self) -> gridData.Grid:
+        return gridData.Grid(self.to_dense(), origin=self.origin, delta=self.delta)
+
+    def export(self, path: Union[str, Path], type: str = "double") -> None:
+        """export as a dense grid (e.g. OpenDX)"""
+        self.to_grid().export(str(path), type=type)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """save as a compressed npz file"""
+        index_dtype = np.uint32 if np.prod(self.shape) < 2**32 else np.int64
+        np.savez_compressed(
+            path,
+            shape=np.array(self.shape),
+            origin=self.origin,
+            delta=self.delta,
+            mask=np.packbits(self.mask.reshape(-1)),
+            indices=self.indices.astype(index_dtype),
+            values=self.values,
+            background=self.background,
+            fill=self.fill,
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "SparseGrid":
+        with np.load(path) as data:
+            shape = tuple(int(n) for n in data["shape"])
+            mask = np.unpackbits(data["mask"], count=int(np.prod(shape))).astype(bool)
+            return cls(
+                shape,
+                data["origin"],
+                data["delta"],
+                mask,
+                data["indices"].astype(np.int64),
+                data["values"],
+                background=float(data["background"]),
+                fill=float(data["fill"]),
+            )
+
+    def apply(self, func: Callable[[npt.NDArray[np.float_]], npt.NDArray[np.float_]]) -> "SparseGrid":
+        """apply an element-wise function to all voxels in place"""
+        self.values = np.asarray(func(self.values), dtype=np.float64)
+        self.background = float(func(np.array([self.background], dtype=np.float64))[0])
+        self.fill = float(func(np.array([self.fill], dtype=np.float64))[0])
+        return self
+
+    def normalize(self, normalize: str = "snapshot", frames: int = 1) -> "SparseGrid":
+        """
+        Convert counts into probabilities in place.
+        Voxels outside of the mask keep the fill value
+        (or the minimum value in the mask if it is smaller than -1), as in genpmap.convert_to_proba.
+        """
+        if normalize == "snapshot":
+            denominator = frames
+        elif normalize == "total":
+            n_background = np.count_nonzero(self.mask) - len(self.indices)
+            denominator = np.sum(self.values) + self.background * n_background
+        else:
+            raise ValueError("Invalid normalization method")
+        self.values = self.values / denominator
+        self.background = self.background / denominator
+        in_mask = (
+            self.values if len(self.indices) == np.count_nonzero(self.mask) else np.r_[self.values, self.background]
+        )
+        self.fill = float(min(np.min(in_mask, initial=np.inf), -1))
+        return self
+
+    def values_at(self, flat_indices: npt.NDArray[np.int64]) -> npt.NDArray[np.float_]:
+        """values of voxels specified with flat indices"""
+        flat_indices = np.asarray(flat_indices, dtype=np.int64)
+        ret = np.where(self.mask.reshape(-1)[flat_indices], self.background, self.fill)
+        if len(self.indices) == 0:
+            return ret
+        pos = np.minimum(np.searchsorted(self.indices, flat_indices), len(self.indices) - 1)
+        listed = self.indices[pos] == flat_indices
+        ret[listed] = self.values[pos[listed]]
+        return ret
+
+    def lookup(self, coords: npt.ArrayLike, fill_value: float = -1) -> npt.NDArray[np.float_]:
+        """
+        Nearest-neighbor lookup of values at given coordinates.
+        Coordinates outside of the voxel centers return ``fill_value``
+        (the same behavior as RegularGridInterpolator(method="nearest", bounds_error=False)).
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        scaled = (coords - self.origin) / self.delta
+        inside = np.all((scaled >= 0) & (scaled <= np.array(self.shape) - 1), axis=1)
+        ret = np.full(len(coords), fill_value, dtype=np.float64)
+        if np.any(inside):
+            idx = np.ceil(scaled[inside] - 0.5).astype(np.int64)  # ties go to the lower voxel
+            ret[inside] = self.values_at(np.ravel_multi_index(idx.T, self.shape))
+        return ret
+
+
+def _check(gs: List[SparseGrid]) -> None:
+    reference = gs[0]
+    for g in gs[1:]:
+        if g.shape != reference.shape:
+            raise ValueError("Grids have different sizes")
+        if not np.allclose(g.origin, reference.origin):
+            raise ValueError("Grids have different origins")
+        if not np.allclose(g.delta, reference.delta):
+            raise ValueError("Grids have different deltas")
+
+
+def _aggregate(gs: List[SparseGrid], reducer: Callable[..., npt.NDArray]) -> SparseGrid:
+    if not gs:
+        raise ValueError("Empty grid list")
+    _check(gs)
+
+    union_mask = np.logical_or.reduce([g.mask for g in gs])
+    common_mask = np.logical_and.reduce([g.mask for g in gs])
+    # voxels whose values cannot be represented by a common background are listed explicitly
+    indices = np.union1d(
+        np.concatenate([g.indices for g in gs]),
+        np.flatnonzero((union_mask & ~common_mask).reshape(-1)),
+    )
+    values = reducer(np.stack([g.values_at(indices) for g in gs]), axis=0)
+    background = float(reducer(np.array([g.background for g in gs])))
+    fill = float(reducer(np.array([g.fill for g in gs])))
+    return SparseGrid(gs[0].shape, gs[0].origin, gs[0].delta, union_mask, indices, values, background, fill)
+
+
+def sparse_max(gs: List[SparseGrid]) -> SparseGrid:
+    """voxel-wise maximum of sparse grids"""
+    return _aggregate(gs, np.max)
+
+
+def sparse_mean(gs: List[SparseGrid]) -> SparseGrid:
+    """voxel-wise mean of sparse grids"""
+    return _aggregate(gs, np.mean)
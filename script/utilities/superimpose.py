@@ -0,0 +1,145 @@
+"""
+Superposition of point sets (Kabsch algorithm) in NumPy
+
+The rotation and translation follow Bio.SVDSuperimposer:
+transformed = coords @ rot + tran
+The batched functions superimpose many models (e.g. probe environments) with one stacked SVD.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+VERSION = "1.0.0"
+
+
+def _normalized_weights(weights: npt.ArrayLike, n_points: int) -> npt.NDArray[np.float_]:
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != (n_points,) or np.any(weights < 0) or weights.sum() == 0:
+        raise ValueError("weights must be non-negative values of each point (not all zero)")
+    return weights / weights.sum()
+
+
+def _det3(mat: npt.NDArray[np.float_]) -> float:
+    # faster than np.linalg.det for a single 3x3 matrix
+    (a, b, c), (d, e, f), (g, h, i) = mat.tolist()
+    return a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+
+
+def kabsch(
+    coords: npt.ArrayLike, reference_coords: npt.ArrayLike, weights: Optional[npt.ArrayLike] = None
+) -> Tuple[npt.NDArray[np.float_], npt.NDArray[np.float_]]:
+    """
+    rotation and translation minimizing the (weighted) RMSD of coords to reference_coords
+    input:
+        coords: (n_points, 3) moving points
+        reference_coords: (n_points, 3)
+        weights: (n_points,) non-negative weights of the points (uniform if None)
+    output:
+        rot: (3, 3), tran: (3,)
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    reference_coords = np.asarray(reference_coords, dtype=np.float64)
+    if coords.ndim != 2 or coords.shape[1] != 3 or coords.shape != reference_coords.shape:
+        raise ValueError(f"coords {coords.shape} and reference {reference_coords.shape} must be (n_points, 3)")
+    if weights is None:
+        center = coords.mean(axis=0)
+        ref_center = reference_coords.mean(axis=0)
+        corr = (coords - center).T @ (reference_coords - ref_center)
+    else:
+        weights = _normalized_weights(weights, len(coords))
+        center = weights @ coords
+        ref_center = weights @ reference_coords
+        corr = ((coords - center) * weights[:, None]).T @ (reference_coords - ref_center)
+    u, _, vt = np.linalg.svd(corr)
+    rot = u @ vt
+    if _det3(rot) < 0:
+        # a reflection is corrected by flipping the axis of the smallest singular value
+        vt[2] *= -1
+        rot = u @ vt
+    return rot, ref_center - center @ rot
+
+
+def kabsch_batch(
+    coords: npt.ArrayLike, reference_coords: npt.ArrayLike, weights: Optional[npt.ArrayLike] = None
+) -> Tuple[npt.NDArray[np.float_], npt.NDArray[np.float_]]:
+    """
+    kabsch of many models with one stacked SVD
+    input:
+        coords: (n_models, n_points, 3) moving points
+        reference_coords: (n_points, 3) or (n_models, n_points, 3)
+        weights: (n_points,) non-negative weights of the points (uniform if None)
+    output:
+        rot: (n_models, 3, 3), tran: (n_models, 3)
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    reference_coords = np.asarray(reference_coords, dtype=np.float64)
+    if coords.ndim != 3 or coords.shape[-1] != 3:
+        raise ValueError(f"coords must be an array of (n_models, n_points, 3), not {coords.shape}")
+    if reference_coords.shape[-2:] != coords.shape[-2:]:
+        raise ValueError(f"the shapes of coords {coords.shape} and reference {reference_coords.shape} differ")
+    if weights is None:
+        weights = np.full(coords.shape[1], 1.0 / coords.shape[1])
+    else:
+        weights = _normalized_weights(weights, coords.shape[1])
+    reference_coords = np.broadcast_to(reference_coords, coords.shape)
+
+    center = np.einsum("i,mij->mj", weights, coords)
+    ref_center = np.einsum("i,mij->mj", weights, reference_coords)
+    corr = np.einsum(
+        "mij,mik->mjk", (coords - center[:, None]) * weights[:, None], reference_coords - ref_center[:, None]
+    )
+    u, _, vt = np.linalg.svd(corr)
+    flip = np.linalg.det(u) * np.linalg.det(vt) < 0
+    vt[flip, 2] *= -1
+    rot = u @ vt
+    tran = ref_center - np.einsum("mj,mjk->mk", center, rot)
+    return rot, tran
+
+
+def transform_batch(
+    coords: npt.ArrayLike, rot: npt.NDArray[np.float_], tran: npt.NDArray[np.float_]
+) -> npt.NDArray[np.float_]:
+    """
+    move (n_models, n_atoms, 3) coordinates with the rotations and translations of kabsch_batch
+    """
+    return np.asarray(coords) @ rot + tran[:, None]
+
+
+def rmsd(coords: npt.ArrayLike, reference_coords: npt.ArrayLike, weights: Optional[npt.ArrayLike] = None) -> float:
+    """(weighted) RMSD without superposition"""
+    sq = np.sum((np.asarray(coords) - np.asarray(reference_coords)) ** 2, axis=-1)
+    return float(np.sqrt(np.average(sq, weights=weights)))
+
+
+class SuperImposer(object):
+    """
+    fit/transform/inverse_transform interface of the Kabsch superposition
+    (the same as script.utilities.Bio.sklearn_interface.SuperImposer without scikit-learn)
+    """
+
+    rot_: npt.NDArray[np.float_]
+    tran_: npt.NDArray[np.float_]
+
+    def fit(
+        self, coords: npt.ArrayLike, reference_coords: npt.ArrayLike, sample_weight: Optional[npt.ArrayLike] = None
+    ) -> "SuperImposer":
+        """
+        translation and rotation superimposing coords on reference_coords
+        (the i-th points of both are paired)
+        """
+        self.rot_, self.tran_ = kabsch(coords, reference_coords, sample_weight)
+        return self
+
+    def _check_is_fitted(self) -> None:
+        if not hasattr(self, "rot_"):
+            raise RuntimeError("SuperImposer is not fitted yet. Call fit() before transform()")
+
+    def transform(self, coords: npt.ArrayLike) -> npt.NDArray[np.float_]:
+        self._check_is_fitted()
+        return np.asarray(coords) @ self.rot_ + self.tran_
+
+    def inverse_transform(self, coords: npt.ArrayLike) -> npt.NDArray[np.float_]:
+        self._check_is_fitted()
+        return (np.asarray(coords) - self.tran_) @ self.rot_.T  # rot is orthogonal
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from script.utilities.box import (
+    box_vectors,
+    box_volume,
+    cell_extent,
+    cell_faces,
+    inside_cell,
+    required_size,
+    wrap_to_cell,
+)
+
+
+@pytest.mark.parametrize(
+    "shape, n_faces, ratio",
+    [("cubic", 6, 1.0), ("dodecahedron", 12, 1 / np.sqrt(2)), ("octahedron", 14, 4 / (3 * np.sqrt(3)))],
+)
+def test_cell(shape, n_faces, ratio):
+    size = 10.0
+    assert len(cell_faces(shape, size)) == n_faces
+    assert box_volume(shape, size) == pytest.approx(ratio * size**3)
+    # the image distance is the box size
+    assert np.min(np.linalg.norm(cell_faces(shape, size), axis=1)) == pytest.approx(size)
+    vectors = box_vectors(shape, size)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), size)
+    assert np.allclose(np.triu(vectors, 1), 0.0)
+
+    # the Wigner-Seitz cell fills the volume of the box
+    rng = np.random.default_rng(0)
+    extent = cell_extent(shape, size)
+    points = rng.uniform(-extent, extent, size=(200000, 3))
+    volume = np.mean(inside_cell(points, shape, size)) * np.prod(2 * extent)
+    assert volume == pytest.approx(box_volume(shape, size), rel=0.02)
+
+
+@pytest.mark.parametrize("shape", ["cubic", "dodecahedron", "octahedron"])
+def test_wrap_to_cell(shape):
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-30, 30, size=(1000, 3))
+    shifts = wrap_to_cell(points, shape, 10.0)
+    assert np.all(inside_cell(points + shifts, shape, 10.0))
+    # shifts are lattice vectors
+    indices = shifts @ np.linalg.inv(box_vectors(shape, 10.0))
+    assert np.allclose(indices, np.round(indices), atol=1e-6)
+
+
+def test_required_size():
+    rng = np.random.default_rng(0)
+    sphere = rng.normal(size=(1000, 3))
+    sphere = 20.0 * sphere / np.linalg.norm(sphere, axis=1)[:, None]
+    for shape in ["cubic", "dodecahedron", "octahedron"]:
+        assert required_size(sphere, shape, 10.0) == pytest.approx(60.0, abs=0.5)
+
+    # the nearest image along z is at 1.41 * size in the dodecahedron
+    rod = np.array([[0.0, 0.0, z] for z in np.linspace(-20, 20, 41)])
+    assert required_size(rod, "cubic", 10.0) == pytest.approx(60.0)
+    assert required_size(rod, "dodecahedron", 10.0) == pytest.approx(40.0 / np.sqrt(2) + 20.0)
+
+
+def test_invalid_shape():
+    with pytest.raises(ValueError):
+        box_volume("sphere", 10.0)
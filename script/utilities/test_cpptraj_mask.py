@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from script.utilities.cpptraj_mask import evaluate_mask
+
+RESNAMES = ["A11", "A11", "A11", "A11", "ALA", "ALA"]
+ATOMNAMES = ["C1", "H1", "VIS", "O1", "CA", "HA"]
+RESIDS = [1, 1, 1, 2, 3, 3]
+
+
+@pytest.mark.parametrize(
+    "mask,expected",
+    [
+        (":A11", [1, 1, 1, 1, 0, 0]),
+        (":A11&(!@VIS)&(!@H*)", [1, 0, 0, 1, 0, 0]),
+        ("(!@VIS)", [1, 1, 0, 1, 1, 1]),
+        ("@C1,CA|@O1", [1, 0, 0, 1, 1, 0]),
+        (":ALA@H?", [0, 0, 0, 0, 0, 1]),
+        (":2-3&!@CA", [0, 0, 0, 1, 0, 1]),
+        ("!:A11|@C1", [1, 0, 0, 0, 1, 1]),
+        ("!(:A11|@C1)", [0, 0, 0, 0, 1, 1]),
+    ],
+)
+def test_evaluate_mask(mask, expected):
+    np.testing.assert_array_equal(evaluate_mask(mask, RESNAMES, ATOMNAMES, RESIDS), np.array(expected, dtype=bool))
+
+
+@pytest.mark.parametrize("mask", ["(:A11", ":A11&", "A11", "@1-3"])
+def test_invalid_mask(mask):
+    with pytest.raises(ValueError):
+        evaluate_mask(mask, RESNAMES, ATOMNAMES, RESIDS)
@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import pytest
+
+from script.utilities.gmx_log import parse_log
+
+LOG = Path(__file__).parent / "test_data" / "gmx_log" / "pr.log"
+
+
+def test_parse_log():
+    first, second = parse_log(LOG)
+    assert first["opened"] == "Mon Oct 19 13:00:06 2026"
+    assert first["host"] == "node01"
+    assert first["gromacs_version"] == "2023.3"
+    assert first["cuda_driver"] == "12.20"
+    assert first["cpu"] == "AMD EPYC 7543 32-Core Processor"
+    assert first["gpu"] == "NVIDIA A100-SXM4-40GB"
+    assert first["ns_per_day"] == pytest.approx(474.25)
+    assert (first["core_time_s"], first["wall_time_s"]) == pytest.approx((145.76, 18.22))
+    assert first["pme_mesh_force_load"] == pytest.approx(0.877)
+    assert first["pme_imbalance_percent"] == pytest.approx(2.3)
+    assert first["gpu_cpu_force_ratio"] == pytest.approx(2.498)
+    assert first["finished"]
+
+
+def test_cycle_table():
+    first, second = parse_log(LOG)
+    cycles = first["cycles"]
+    assert list(cycles) == [
+        "Neighbor search",
+        "Launch GPU ops.",
+        "Force",
+        "Wait GPU NB local",
+        "Update",
+        "Rest",
+        "Total",
+    ]
+    assert cycles["Launch GPU ops."] == {
+        "ranks": 1,
+        "threads": 8,
+        "count": 50002,
+        "wall_s": 2.345,
+        "giga_cycles": 45.011,
+        "percent": 12.9,
+    }
+    assert cycles["Rest"]["ranks"] is None and cycles["Rest"]["wall_s"] == pytest.approx(6.219)
+    assert first["gpu_wait_percent"] == pytest.approx(100 * 1.2 / 18.22)
+    assert second["gpu_wait_percent"] == pytest.approx(40.0)
+
+
+def test_resumed_run():
+    _, second = parse_log(LOG)
+    assert second["host"] == "node02"
+    assert second["gromacs_version"] == "2023.3"  # the header is written once
+    assert second["ns_per_day"] == pytest.approx(300.0)
+    assert "pme_mesh_force_load" not in second
+
+
+def test_unfinished_run(tmp_path):
+    log = tmp_path / "md1.log"
+    log.write_text(LOG.read_text().split("     R E A L")[0])
+    (run,) = parse_log(log)
+    assert not run["finished"]
+    assert "ns_per_day" not in run and "cycles" not in run
@@ -189,6 +189,15 @@ class TestGro:
         assert gro.atoms[-1].resi == 2
         assert gro.atoms[-1].atom_id == 4
 
+    def test_triclinic_box(self, mock_gro_file):
+        """Test for writing a triclinic box"""
+        box = "   5.0   5.0   3.5   0.0   0.0   0.0   0.0  -2.5  -2.5"
+        mock_gro_file.write_text(mock_gro_file.read_text().replace("   5.0   5.0   5.0", box))
+        gro = Gro(str(mock_gro_file))
+        assert len(gro.box_size) == 9
+        assert [float(v) for v in str(gro).splitlines()[-1].split()] == [float(v) for v in box.split()]
+        assert gro.molar("WAT") == pytest.approx(1 / constants.N_A / (5.0 * 5.0 * 3.5 * 1e-24))
+
     def test_add_invalid_atom(self):
         """Test for invalid atom addition"""
         gro = Gro()
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+import pytest
+
+from script.utilities.importtime import heavy_imports, measure_imports, total_time
+
+ROOT = Path(__file__).parents[2]
+
+
+@pytest.mark.parametrize("entry_point", ["exprorer_msmd", "probe_profile", "protein_hotspot", "regrid"])
+def test_entry_points_start_without_heavy_imports(entry_point):
+    imports = measure_imports([entry_point, "--version"], cwd=ROOT)
+    assert heavy_imports(imports) == []
+    assert "script.setting" in imports
+
+
+def test_measure_imports():
+    imports = measure_imports(["-c", "import json"])
+    assert imports["json"][2] == 0
+    assert imports["json.decoder"][2] > 0
+    assert total_time(imports) >= imports["json"][1]
+    assert heavy_imports(imports) == []
+    assert heavy_imports({"scipy.spatial": (1, 1, 0), "numpy": (1, 1, 1)}) == ["scipy", "numpy"]
@@ -0,0 +1,122 @@
+import json
+
+from script.utilities import util
+from script.utilities.fake_executable import BIN_DIR
+from script.utilities.manifest import StageManifest, file_hash
+
+
+def _stage(manifest, inputs, settings):
+    return manifest.fingerprint(inputs, settings=settings, versions={"genpmap": "1.0.0"})
+
+
+def test_skip_unchanged_stage(tmp_path):
+    inp = tmp_path / "traj.xtc"
+    out = tmp_path / "grid.dx"
+    inp.write_text("trajectory")
+    manifest = StageManifest(tmp_path / "manifest.json")
+
+    fingerprint = _stage(manifest, [inp], {"map_size": 80})
+    assert not manifest.is_up_to_date("gridding", fingerprint)
+    manifest.start("gridding", fingerprint)
+    assert not manifest.is_up_to_date("gridding", fingerprint)  # not finished
+    out.write_text("grid")
+    manifest.finish("gridding", fingerprint, [out])
+
+    # the manifest is reloaded by the next run
+    manifest = StageManifest(tmp_path / "manifest.json")
+    fingerprint = _stage(manifest, [inp], {"map_size": 80})
+    assert manifest.is_up_to_date("gridding", fingerprint)
+    assert not manifest.is_stale("gridding", fingerprint)
+
+    # changed settings
+    changed = _stage(manifest, [inp], {"map_size": 100})
+    assert not manifest.is_up_to_date("gridding", changed)
+    assert manifest.is_stale("gridding", changed)
+    assert manifest.changes("gridding", changed) == ["settings.map_size"]
+
+    # changed input files
+    inp.write_text("another trajectory")
+    changed = _stage(manifest, [inp], {"map_size": 80})
+    assert not manifest.is_up_to_date("gridding", changed)
+    assert manifest.changes("gridding", changed) == [str(inp)]
+
+    # changed or removed outputs
+    inp.write_text("trajectory")
+    assert manifest.is_up_to_date("gridding", _stage(manifest, [inp], {"map_size": 80}))
+    out.write_text("modified grid")
+    assert not manifest.is_up_to_date("gridding", _stage(manifest, [inp], {"map_size": 80}))
+    out.unlink()
+    assert not manifest.is_up_to_date("gridding", _stage(manifest, [inp], {"map_size": 80}))
+
+
+def test_downstream_invalidation(tmp_path):
+    """a downstream stage is invalidated only if the outputs of the upstream stage are changed"""
+    traj, grid, pmap = tmp_path / "traj.xtc", tmp_path / "grid.dx", tmp_path / "PMAP.dx"
+    traj.write_text("trajectory")
+    manifest = StageManifest(tmp_path / "manifest.json")
+
+    def run(map_size, valid_dist):
+        ran = []
+        fingerprint = _stage(manifest, [traj], {"map_size": map_size})
+        if not manifest.is_up_to_date("gridding", fingerprint):
+            grid.write_text(f"grid {map_size}")
+            manifest.finish("gridding", fingerprint, [grid])
+            ran.append("gridding")
+        fingerprint = _stage(manifest, [grid], {"valid_dist": valid_dist})
+        if not manifest.is_up_to_date("pmap", fingerprint):
+            pmap.write_text(f"pmap {valid_dist}")
+            manifest.finish("pmap", fingerprint, [pmap])
+            ran.append("pmap")
+        return ran
+
+    assert run(80, 5.0) == ["gridding", "pmap"]
+    assert run(80, 5.0) == []
+    assert run(80, 3.0) == ["pmap"]
+    assert run(100, 3.0) == ["gridding", "pmap"]
+
+
+def test_hash_cache(tmp_path):
+    path = tmp_path / "large.xtc"
+    path.write_bytes(b"0" * 1000)
+    manifest = StageManifest(tmp_path / "manifest.json")
+    digest = manifest.hash(path)
+    assert digest == file_hash(path)
+
+    # files are not read again if the size and mtime are unchanged
+    manifest.files[str(path)][2] = "cached"
+    assert manifest.hash(path) == "cached"
+    path.write_bytes(b"1" * 1001)
+    assert manifest.hash(path) == file_hash(path)
+
+
+def test_directory_output(tmp_path):
+    outdir = tmp_path / "probe_table"
+    outdir.mkdir()
+    (outdir / "meta.json").write_text(json.dumps({"frames": 1}))
+    manifest = StageManifest(tmp_path / "manifest.json")
+    fingerprint = manifest.fingerprint([], settings={"cid": "A11"})
+    manifest.finish("probe_table", fingerprint, [outdir])
+    assert manifest.is_up_to_date("probe_table", fingerprint)
+    (outdir / "shard_00000.npz").write_bytes(b"data")
+    assert not manifest.is_up_to_date("probe_table", fingerprint)
+
+
+def test_invalidate(tmp_path):
+    manifest = StageManifest(tmp_path / "manifest.json")
+    fingerprint = manifest.fingerprint([])
+    manifest.finish("preprocess", fingerprint, [])
+    assert manifest.is_up_to_date("preprocess", fingerprint)
+    manifest.invalidate("preprocess")
+    assert not StageManifest(tmp_path / "manifest.json").is_up_to_date("preprocess", fingerprint)
+
+
+def test_executable_version(tmp_path):
+    script = tmp_path / "tool"
+    script.write_text("#!/bin/sh\necho \"$0 $@\" >> $0.calls\necho banner\necho 'Tool  version: 1.2'\n")
+    script.chmod(0o755)
+    assert util.executable_version(str(script)) == "Tool version: 1.2"
+    assert util.executable_version(str(script)) == "Tool version: 1.2"
+    assert (tmp_path / "tool.calls").read_text() == f"{script} --version\n"  # cached
+    assert util.executable_version(str(BIN_DIR / "gmx")).startswith("GROMACS version:")
+    missing = str(tmp_path / "missing")
+    assert util.executable_version(missing) == missing
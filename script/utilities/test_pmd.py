@@ -1,8 +1,14 @@
+import os
+import shutil
 import tempfile
 from pathlib import Path
 from unittest import TestCase
 
+import numpy as np
+import parmed
+
 from script.utilities import pmd
+from script.utilities.box import inside_cell
 
 
 class TestConversion(TestCase):
@@ -30,6 +36,49 @@ class TestConversion(TestCase):
         # Ignore the first 15 lines including the timestamp and command to run test
         self.assertEqual(open(out_top).readlines()[15:], open(self.expected_topfile).readlines()[15:])
 
+    def test_strip_solvent(self):
+        out_top = Path(tempfile.mkstemp(suffix=".top")[1])
+        shutil.copy(self.expected_topfile, out_top)
+        n_atoms = 38269 - 11813 * 3 - 2  # without water and 2 Na+
+        with self.assertRaises(ValueError):
+            pmd.strip_solvent(out_top, n_atoms - 1)
+        pmd.strip_solvent(out_top, n_atoms)
+        self.assertEqual(len(parmed.load_file(str(out_top)).atoms), n_atoms)
+        os.remove(out_top)
+
+    def test_count_parm7_atoms(self):
+        top = Path(tempfile.mkstemp(suffix=".parm7")[1])
+        top.write_text(
+            "%VERSION  VERSION_STAMP = V0001.000\n%FLAG TITLE\n%FORMAT(20a4)\ntest\n"
+            "%FLAG POINTERS\n%FORMAT(10I8)\n      12       3       6\n"
+        )
+        self.assertEqual(pmd.count_parm7_atoms(top), 12)
+        top.write_text("%FLAG TITLE\n")
+        with self.assertRaises(ValueError):
+            pmd.count_parm7_atoms(top)
+        os.remove(top)
+
+    def test_cut_box(self):
+        tmpdir = Path(tempfile.mkdtemp())
+        top, xyz = tmpdir / "system.parm7", tmpdir / "system.rst7"
+        shutil.copy("script/test_data/tripeptide_A11.parm7", top)
+        shutil.copy("script/test_data/tripeptide_A11.rst7", xyz)
+        before = parmed.load_file(str(top), xyz=str(xyz))
+        origin = before.box[:3] / 2
+        pmd.cut_box(top, xyz, "octahedron", 40.0, origin)
+
+        after = parmed.load_file(str(top), xyz=str(xyz))
+        self.assertEqual(list(after.box), [40.0, 40.0, 40.0] + [109.4712206] * 3)
+        n_waters = [len([r for r in s.residues if r.name == "WAT"]) for s in (before, after)]
+        self.assertLess(n_waters[1], n_waters[0] * 0.85)
+        # probes are wrapped (not removed), and all molecules are in the cell
+        self.assertEqual(
+            len([r for r in after.residues if r.name == "A11"]), len([r for r in before.residues if r.name == "A11"])
+        )
+        oxygens = np.array([[r.atoms[0].xx, r.atoms[0].xy, r.atoms[0].xz] for r in after.residues])
+        self.assertTrue(np.all(inside_cell(oxygens[[r.name == "WAT" for r in after.residues]], "octahedron", 40.0)))
+        shutil.rmtree(tmpdir)
+
     def __del__(self):
         pass
         # os.system("rm -rf script/utilities/test_data/pmd/output")
@@ -0,0 +1,107 @@
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from script.utilities.box import inside_cell
+from script.utilities.probe_packer import CellList, ProbePacker, _read_pdb_atoms
+
+
+@pytest.fixture
+def test_files():
+    test_data_dir = Path("script/utilities/executable/test_data")
+    return {
+        "protein_pdb": test_data_dir / "tripeptide.pdb",
+        "cosolv_pdb": test_data_dir / "A11.pdb",
+    }
+
+
+def _run(test_files, tmp_path, molar=0.5, seed=1, name="box.pdb"):
+    packer = ProbePacker()
+    packer.set(protein_pdb=test_files["protein_pdb"], cosolv_pdb=test_files["cosolv_pdb"], box_size=20, molar=molar)
+    return packer.run(tmp_path / name, seed=seed)
+
+
+def test_run_probe_packer(test_files, tmp_path):
+    packer = _run(test_files, tmp_path)
+    lines, coords = _read_pdb_atoms(packer.box_pdb)
+    probe_lines, probe_coords = _read_pdb_atoms(test_files["cosolv_pdb"])
+    n_probes = sum(1 for line in lines if line[17:20] == "A11") // len(probe_lines)
+    assert n_probes == packer._num_probes()
+    assert packer.throughput > 0
+
+    # all probe atoms are inside the box and do not clash with each other
+    is_probe = np.array([line[17:20] == "A11" for line in lines])
+    probes = coords[is_probe].reshape(n_probes, len(probe_lines), 3)
+    assert np.all(np.abs(probes) <= 10.0 + 1e-3)
+    for i in range(n_probes):
+        for j in range(i + 1, n_probes):
+            d = np.linalg.norm(probes[i][:, None] - probes[j][None], axis=-1)
+            assert np.min(d) >= 2.0 - 1e-3
+
+
+def test_ter_records(test_files, tmp_path):
+    packer = _run(test_files, tmp_path)
+    lines = open(packer.box_pdb).read().splitlines()
+    assert lines[-1] == "END"
+    assert lines[-2] == "TER"
+    n_probes = packer._num_probes()
+    assert lines.count("TER") == n_probes + 1  # a protein chain + probes
+
+
+def test_reproducibility(test_files, tmp_path):
+    first = _run(test_files, tmp_path, seed=42, name="first.pdb")
+    second = _run(test_files, tmp_path, seed=42, name="second.pdb")
+    third = _run(test_files, tmp_path, seed=43, name="third.pdb")
+    assert open(first.box_pdb).read() == open(second.box_pdb).read()
+    assert open(first.box_pdb).read() != open(third.box_pdb).read()
+
+
+def test_no_probe(test_files, tmp_path):
+    with pytest.warns(RuntimeWarning):
+        packer = _run(test_files, tmp_path, molar=0)
+    lines, _ = _read_pdb_atoms(packer.box_pdb)
+    assert all(line[17:20] != "A11" for line in lines)
+
+
+def test_extremely_high_molar(test_files, tmp_path):
+    with pytest.raises(RuntimeError):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            _run(test_files, tmp_path, molar=1e10)
+
+
+def test_cell_list_clashes():
+    cells = CellList(np.zeros(3), np.full(3, 10.0), tolerance=2.0)
+    cells.add(np.array([[5.0, 5.0, 5.0], [5.1, 5.0, 5.0], [1.0, 1.0, 1.0]]))
+    candidates = np.array(
+        [
+            [[6.5, 5.0, 5.0]],  # 1.4 A from the second atom
+            [[8.0, 8.0, 8.0]],  # far from any atom
+            [[2.0, 2.0, 2.9]],  # 2.1 A from the third atom
+        ]
+    )
+    np.testing.assert_array_equal(cells.clashes(candidates), [True, False, False])
+
+
+def test_cell_list_grows():
+    cells = CellList(np.zeros(3), np.full(3, 10.0), tolerance=2.0, capacity=1)
+    cells.add(np.array([[5.0, 5.0, 5.0 + 0.1 * i] for i in range(5)]))
+    assert cells.capacity >= 5
+    assert cells.count.sum() == 5
+    assert cells.clashes(np.array([[[5.0, 5.0, 6.5]]]))[0]
+
+
+@pytest.mark.parametrize("shape", ["dodecahedron", "octahedron"])
+def test_box_shape(test_files, tmp_path, shape):
+    packer = ProbePacker()
+    packer.set(test_files["protein_pdb"], test_files["cosolv_pdb"], box_size=30, molar=0.5, box_shape=shape)
+    cubic = ProbePacker().set(test_files["protein_pdb"], test_files["cosolv_pdb"], box_size=30, molar=0.5)
+    assert packer._num_probes() < cubic._num_probes()
+
+    packer.run(tmp_path / "box.pdb", seed=1)
+    lines, coords = _read_pdb_atoms(packer.box_pdb)
+    is_probe = np.array([line[17:20] == "A11" for line in lines])
+    assert np.sum(is_probe) > 0
+    assert np.all(inside_cell(coords[is_probe], shape, 30))
@@ -0,0 +1,97 @@
+import pstats
+import threading
+import time
+
+import pytest
+
+from script.utilities.profiler import Profiler, collapse, profiled, profiler
+from script.utilities.trace import span
+
+
+def busy(seconds: float) -> float:
+    end = time.perf_counter() + seconds
+    total = 0.0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+def square(x: int) -> int:
+    busy(0.05)
+    return x * x
+
+
+@pytest.fixture
+def started(tmp_path):
+    profiler.start(tmp_path / "profile")
+    yield profiler
+    profiler.enabled = False
+    profiler.directory = None
+    profiler.stats = {}
+
+
+def _functions(path) -> set:
+    return {name for _, _, name in pstats.Stats(str(path)).stats}
+
+
+def _calls(stats: pstats.Stats, name: str) -> int:
+    return sum(values[1] for (_, _, func), values in stats.stats.items() if func == name)
+
+
+def test_disabled_profiler_records_nothing():
+    p = Profiler()
+    with p.stage("stage"):
+        busy(0.01)
+    assert p.stats == {}
+    assert profiled(square, "stage") is square
+
+
+def test_stages_of_threads_are_merged(started):
+    def work():
+        with span("preprocess"):
+            with span("tleap"):  # nested spans are a part of the outer stage
+                busy(0.05)
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert list(started.stats) == ["preprocess"]
+    assert _calls(started.stats["preprocess"], "busy") == 3
+
+    started.save()
+    directory = started.directory
+    assert "busy" in _functions(directory / "preprocess.prof")
+    lines = (directory / "preprocess.collapsed").read_text().splitlines()
+    assert lines and all(line.startswith("preprocess;") for line in lines)
+    assert any(";busy (test_profiler.py:" in line for line in lines)
+
+
+def test_collapse_distributes_time_to_callers(started):
+    def caller_a():
+        busy(0.06)
+
+    def caller_b():
+        busy(0.02)
+
+    with started.stage("stage"):
+        caller_a()
+        caller_b()
+    stacks = collapse(started.stats["stage"], "stage")
+    total = started.stats["stage"].total_tt * 1e6
+    assert sum(stacks.values()) == pytest.approx(total, rel=0.05)
+    a = sum(v for k, v in stacks.items() if "caller_a" in k)
+    b = sum(v for k, v in stacks.items() if "caller_b" in k)
+    assert a > 2 * b > 0
+
+
+def test_profiled_in_processes(started):
+    from joblib import Parallel, delayed
+
+    assert Parallel(n_jobs=2)(delayed(profiled(square, "resenv"))(x) for x in range(4)) == [0, 1, 4, 9]
+    with span("resenv"):
+        pass
+    started.save()
+    assert list(started.directory.glob("*.part.prof")) == []
+    assert _calls(pstats.Stats(str(started.directory / "resenv.prof")), "square") == 4
@@ -0,0 +1,95 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from script.utilities import scratch
+from script.utilities.scratch import ScratchStage, verified_copy
+
+
+@pytest.fixture
+def simdir(tmp_path):
+    simdir = tmp_path / "system0" / "simulation"
+    simdir.mkdir(parents=True)
+    (simdir / "input.gro").write_text("gro")
+    (simdir / "pr.xtc").write_text("partial trajectory")
+    os.symlink("pr.xtc", simdir / "TEST.xtc")
+    return simdir
+
+
+def test_stage_in_and_sync(tmp_path, simdir):
+    with ScratchStage(simdir, tmp_path / "scratch", interval=0) as rundir:
+        assert rundir.parent == tmp_path / "scratch"
+        assert (rundir / "input.gro").read_text() == "gro"
+        assert os.readlink(rundir / "TEST.xtc") == "pr.xtc"
+        (rundir / "pr.xtc").write_text("full trajectory")
+        (rundir / "pr.cpt").write_text("checkpoint")
+        (rundir / "input.gro").touch()  # only modified files are synced
+        mtime = (simdir / "input.gro").stat().st_mtime_ns
+        assert not (simdir / "pr.cpt").exists()  # synced after the work
+
+    assert (simdir / "pr.xtc").read_text() == "full trajectory"
+    assert (simdir / "TEST.xtc").read_text() == "full trajectory"
+    assert (simdir / "pr.cpt").read_text() == "checkpoint"
+    assert (simdir / "input.gro").stat().st_mtime_ns != mtime
+    assert not rundir.exists()
+    assert not list(simdir.glob(".*.sync"))
+
+
+def test_unchanged_inputs_are_not_synced(tmp_path, simdir):
+    stage = ScratchStage(simdir, tmp_path / "scratch", interval=0)
+    with stage as rundir:
+        (rundir / "pr.log").write_text("log")
+        assert stage.sync() == [Path("pr.log")]
+        assert stage.sync() == []
+
+
+def test_discard(tmp_path, simdir):
+    with ScratchStage(simdir, tmp_path / "scratch", discard=["equil*.xtc", "*.trr"], interval=0) as rundir:
+        (rundir / "equil1.xtc").write_text("equilibration")
+        (rundir / "pr.trr").write_text("velocities")
+        (rundir / "equil1.gro").write_text("gro")
+    assert not (simdir / "equil1.xtc").exists()
+    assert not (simdir / "pr.trr").exists()
+    assert (simdir / "equil1.gro").exists()
+
+
+def test_inputs(tmp_path, simdir):
+    sysdir = simdir.parent
+    with ScratchStage(sysdir, tmp_path / "scratch", inputs=[simdir / "TEST.xtc"], interval=0) as rundir:
+        staged = rundir / "simulation" / "TEST.xtc"
+        assert not staged.is_symlink()  # symbolic links given as inputs are resolved
+        assert staged.read_text() == "partial trajectory"
+        assert not (rundir / "simulation" / "input.gro").exists()
+        (rundir / "TEST_nVH.dx").write_text("grid")
+    assert (sysdir / "TEST_nVH.dx").read_text() == "grid"
+    assert (simdir / "TEST.xtc").is_symlink()
+
+
+def test_background_sync(tmp_path, simdir):
+    with ScratchStage(simdir, tmp_path / "scratch", interval=0.05) as rundir:
+        (rundir / "pr.log").write_text("step 1000")
+        for _ in range(100):
+            if (simdir / "pr.log").exists():
+                break
+            time.sleep(0.05)
+        assert (simdir / "pr.log").read_text() == "step 1000"
+
+
+def test_sync_on_error(tmp_path, simdir):
+    with pytest.raises(RuntimeError):
+        with ScratchStage(simdir, tmp_path / "scratch", interval=0) as rundir:
+            (rundir / "pr.cpt").write_text("checkpoint")
+            raise RuntimeError("mdrun failed")
+    assert (simdir / "pr.cpt").read_text() == "checkpoint"
+
+
+def test_verified_copy_mismatch(tmp_path, monkeypatch):
+    src = tmp_path / "src.xtc"
+    src.write_text("trajectory")
+    monkeypatch.setattr(scratch, "_hash", lambda path: "corrupted")
+    with pytest.raises(RuntimeError, match="checksum mismatch"):
+        verified_copy(src, tmp_path / "dst" / "dst.xtc")
+    assert not (tmp_path / "dst" / "dst.xtc").exists()
+    assert not list((tmp_path / "dst").iterdir())
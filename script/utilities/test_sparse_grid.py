@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from gridData import Grid
+from scipy.interpolate import RegularGridInterpolator
+
+from script.utilities.sparse_grid import SparseGrid, sparse_max, sparse_mean
+
+
+@pytest.fixture
+def pmap():
+    """a PMAP-like grid: -1 outside of a sphere, mostly zero inside"""
+    rng = np.random.default_rng(0)
+    ii, jj, kk = np.indices((40, 40, 40))
+    mask = (ii - 20) ** 2 + (jj - 20) ** 2 + (kk - 20) ** 2 < 10**2
+    grid = np.where(mask, rng.poisson(0.05, size=mask.shape) / 100, -1.0)
+    return Grid(grid, origin=[-10.0, 5.0, 0.0], delta=[1.0, 1.0, 1.0])
+
+
+def _random_grid(seed, shape=(6, 7, 8), mask=None):
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(0.3, size=shape).astype(np.float64)
+    if mask is None:
+        mask = rng.random(shape) < 0.5
+    return Grid(counts, origin=[1.0, -2.0, 3.0], delta=[0.5, 0.5, 0.5]), mask
+
+
+def test_round_trip(pmap, tmp_path):
+    sparse = SparseGrid.from_grid(pmap)
+    np.testing.assert_array_equal(sparse.to_dense(), pmap.grid)
+    assert sparse.nbytes == sparse.indices.nbytes + sparse.values.nbytes + pmap.grid.size
+    assert sparse.nbytes < pmap.grid.nbytes / 4  # the bool mask alone is 1/8 of a float64 grid
+    sparse.save(tmp_path / "pmap.npz")
+    assert (tmp_path / "pmap.npz").stat().st_size < pmap.grid.nbytes / 10
+
+
+def test_save_load(pmap, tmp_path):
+    sparse = SparseGrid.from_grid(pmap)
+    sparse.save(tmp_path / "pmap.npz")
+    loaded = SparseGrid.load(tmp_path / "pmap.npz")
+    np.testing.assert_array_equal(loaded.to_dense(), pmap.grid)
+    np.testing.assert_allclose(loaded.origin, pmap.origin)
+    np.testing.assert_allclose(loaded.delta, pmap.delta)
+
+    loaded.export(tmp_path / "pmap.dx")
+    np.testing.assert_allclose(Grid(str(tmp_path / "pmap.dx")).grid, pmap.grid)
+
+
+@pytest.mark.parametrize("normalize", ["snapshot", "total"])
+def test_normalize(normalize):
+    g, mask = _random_grid(0)
+    sparse = SparseGrid.from_grid(g, mask).normalize(normalize, frames=10)
+
+    expected = g.grid / (10 if normalize == "snapshot" else g.grid[mask].sum())
+    expected[~mask] = -1
+    np.testing.assert_allclose(sparse.to_dense(), expected)
+
+
+@pytest.mark.parametrize("aggregate,reducer", [(sparse_max, np.max), (sparse_mean, np.mean)])
+def test_aggregate(aggregate, reducer):
+    gs = []
+    for seed in range(3):  # masks differ among grids
+        g, mask = _random_grid(seed)
+        gs.append(SparseGrid.from_grid(g, mask).normalize("snapshot", frames=4))
+
+    expected = reducer([g.to_dense() for g in gs], axis=0)
+    np.testing.assert_allclose(aggregate(gs).to_dense(), expected)
+
+
+def test_aggregate_different_sizes():
+    g1, mask1 = _random_grid(0)
+    g2, mask2 = _random_grid(1, shape=(6, 7, 9))
+    with pytest.raises(ValueError, match="Grids have different sizes"):
+        sparse_max([SparseGrid.from_grid(g1, mask1), SparseGrid.from_grid(g2, mask2)])
+
+
+def test_lookup_matches_interpolator(pmap):
+    g = pmap
+    sparse = SparseGrid.from_grid(g)
+    rng = np.random.default_rng(0)
+    lower, upper = g.origin - 2, g.origin + np.array(g.grid.shape) * g.delta + 2
+    coords = rng.uniform(lower, upper, size=(5000, 3))
+
+    interp = RegularGridInterpolator(g.midpoints, g.grid, method="nearest", fill_value=-1, bounds_error=False)
+    np.testing.assert_allclose(sparse.lookup(coords), interp(coords))
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from Bio.SVDSuperimposer import SVDSuperimposer
+
+from script.utilities.superimpose import SuperImposer, kabsch, kabsch_batch, rmsd, transform_batch
+
+
+def _random_rotation(rng):
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    if np.linalg.det(q) < 0:
+        q[:, 0] *= -1
+    return q
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def test_kabsch_recovers_rigid_motion(rng):
+    ref = rng.normal(size=(10, 3)) * 5
+    rot = _random_rotation(rng)
+    coords = (ref - 3.0) @ rot.T  # moved copy of ref
+    fit_rot, fit_tran = kabsch(coords, ref)
+    np.testing.assert_allclose(coords @ fit_rot + fit_tran, ref, atol=1e-10)
+    assert np.isclose(np.linalg.det(fit_rot), 1.0)
+
+
+def test_kabsch_same_as_biopython(rng):
+    ref = rng.normal(size=(8, 3))
+    coords = ref @ _random_rotation(rng) + rng.normal(scale=0.3, size=(8, 3))
+    sup = SVDSuperimposer()
+    sup.set(ref, coords)
+    sup.run()
+    bio_rot, bio_tran = sup.get_rotran()
+    rot, tran = kabsch(coords, ref)
+    np.testing.assert_allclose(rot, bio_rot, atol=1e-10)
+    np.testing.assert_allclose(tran, bio_tran, atol=1e-10)
+    assert np.isclose(rmsd(coords @ rot + tran, ref), sup.get_rms())
+
+
+def test_kabsch_no_reflection(rng):
+    ref = rng.normal(size=(6, 3))
+    mirrored = ref * np.array([-1, 1, 1])
+    rot, _ = kabsch(mirrored, ref)
+    assert np.isclose(np.linalg.det(rot), 1.0)
+
+
+def test_weighted_fit(rng):
+    ref = rng.normal(size=(6, 3))
+    coords = ref @ _random_rotation(rng)
+    coords[5] += 10.0  # outlier
+    weights = np.array([1, 1, 1, 1, 1, 0])
+    rot, tran = kabsch(coords, ref, weights)
+    np.testing.assert_allclose((coords @ rot + tran)[:5], ref[:5], atol=1e-10)
+    with pytest.raises(ValueError):
+        kabsch(coords, ref, np.zeros(6))
+    with pytest.raises(ValueError):
+        kabsch(coords, ref, np.ones(5))
+
+
+def test_batch_same_as_single(rng):
+    ref = rng.normal(size=(7, 3))
+    coords = np.array([ref @ _random_rotation(rng) + rng.normal(size=3) for _ in range(4)])
+    rots, trans = kabsch_batch(coords, ref)
+    for model, rot, tran in zip(coords, rots, trans):
+        single_rot, single_tran = kabsch(model, ref)
+        np.testing.assert_allclose(rot, single_rot, atol=1e-10)
+        np.testing.assert_allclose(tran, single_tran, atol=1e-10)
+    np.testing.assert_allclose(transform_batch(coords, rots, trans), np.broadcast_to(ref, coords.shape), atol=1e-10)
+    with pytest.raises(ValueError):
+        kabsch_batch(coords, ref[:5])
+
+
+def test_superimposer(rng):
+    ref = rng.normal(size=(5, 3))
+    coords = ref @ _random_rotation(rng) + 1.0
+    sup = SuperImposer()
+    with pytest.raises(RuntimeError):
+        sup.transform(coords)
+    assert sup.fit(coords, ref) is sup
+    np.testing.assert_allclose(sup.transform(coords), ref, atol=1e-10)
+    np.testing.assert_allclose(sup.inverse_transform(ref), coords, atol=1e-10)
+
+
+def test_single_point():
+    rot, tran = kabsch([[1.0, 2.0, 3.0]], [[0.0, 0.0, 0.0]])
+    np.testing.assert_allclose(np.array([1.0, 2.0, 3.0]) @ rot + tran, 0.0, atol=1e-10)
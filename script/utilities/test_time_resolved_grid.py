@@ -0,0 +1,44 @@
+import gridData
+import numpy as np
+import pytest
+
+from script.utilities.time_resolved_grid import TimeResolvedGrid, write_time_resolved_grid
+
+
+def _grids(n_windows: int):
+    rng = np.random.default_rng(0)
+    return [
+        gridData.Grid(rng.integers(0, 5, size=(3, 4, 5)).astype(float), origin=[1, 2, 3], delta=[0.5, 0.5, 0.5])
+        for _ in range(n_windows)
+    ]
+
+
+def test_round_trip(tmp_path):
+    grids = _grids(4)
+    ranges = [(1, 10, 1), (11, 20, 1), (21, 30, 1), (31, 35, 1)]
+    write_time_resolved_grid(tmp_path / "g4d", grids, [10, 10, 10, 5], ranges, [(0, 9), (10, 19), (20, 29), (30, 34)])
+
+    grid4d = TimeResolvedGrid(tmp_path / "g4d")
+    assert grid4d.shape == (4, 3, 4, 5)
+    assert len(grid4d) == 4
+    np.testing.assert_array_equal(grid4d.origin, [1, 2, 3])
+    np.testing.assert_array_equal(grid4d.delta, [0.5, 0.5, 0.5])
+    np.testing.assert_array_equal(grid4d.frames, [10, 10, 10, 5])
+    assert grid4d.times[-1] == [30.0, 34.0]
+    np.testing.assert_array_equal(grid4d[-1], grids[-1].grid)
+    np.testing.assert_array_equal(grid4d[1:3], np.stack([grids[1].grid, grids[2].grid]))
+    assert grid4d[::2].shape == (2, 3, 4, 5)
+
+
+def test_sum(tmp_path):
+    grids = _grids(3)
+    write_time_resolved_grid(tmp_path / "g4d", grids, [2, 3, 4], [(1, 2, 1), (3, 5, 1), (6, 9, 1)])
+
+    grid4d = TimeResolvedGrid(tmp_path / "g4d")
+    g, frames = grid4d.sum(1)
+    np.testing.assert_array_equal(g.grid, grids[1].grid + grids[2].grid)
+    np.testing.assert_array_equal(g.origin, [1, 2, 3])
+    assert frames == 7
+    assert grid4d.sum()[1] == 9
+    with pytest.raises(ValueError):
+        grid4d.sum(2, 2)
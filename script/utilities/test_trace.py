@@ -0,0 +1,84 @@
+import json
+import subprocess
+import threading
+import time
+
+import pytest
+
+from script.utilities.trace import Tracer, span, trace_path, tracer
+
+
+@pytest.fixture
+def started():
+    tracer.start()
+    yield tracer
+    tracer.enabled = False
+    tracer.events = []
+
+
+def test_disabled_tracer_records_nothing():
+    t = Tracer()
+    with t.span("stage"):
+        pass
+    t.add_span("md:pr", time.time(), time.time() + 1)
+    assert t.events == []
+
+
+def test_span_and_decorator(started):
+    @span("convert")
+    def convert(x):
+        return x * 2
+
+    with span("stage", system=1):
+        assert convert(2) == 4
+        assert convert(3) == 6
+    names = [e["name"] for e in started.events]
+    assert names == ["convert", "convert", "stage"]
+    stage = started.events[-1]
+    assert stage["ph"] == "X" and stage["args"]["system"] == 1
+    assert stage["ts"] <= started.events[0]["ts"]
+    assert stage["dur"] >= started.events[0]["dur"] + started.events[1]["dur"]
+    assert {"cpu_s", "children_cpu_s", "peak_rss_mb", "children_peak_rss_mb"} <= set(stage["args"])
+
+
+def test_span_records_exceptions(started):
+    with pytest.raises(ValueError):
+        with span("failed"):
+            raise ValueError
+    assert started.events[0]["name"] == "failed"
+
+
+def test_child_process_time(started):
+    with span("child"):
+        subprocess.run(["python", "-c", "sum(range(3000000))"], check=True)
+    assert started.events[0]["args"]["children_cpu_s"] > 0
+
+
+def test_threads(started):
+    def work():
+        with span("thread"):
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert len({e["tid"] for e in started.events}) == 4
+
+
+def test_save(started, tmp_path):
+    with span("stage"):
+        pass
+    started.add_span("md:pr", started.epoch + 1.0, started.epoch + 3.0, system=0)
+    path = trace_path(tmp_path, "exprorer_msmd")
+    started.save(path)
+
+    trace = json.loads(path.read_text())
+    md = next(e for e in trace["traceEvents"] if e["name"] == "md:pr")
+    assert md["cat"] == "md"
+    assert md["ts"] == pytest.approx(1e6) and md["dur"] == pytest.approx(2e6)
+    summary = path.with_suffix(".txt").read_text()
+    assert "stage" in summary and "md:pr" in summary
+    rows = {row["name"]: row for row in started.summary()}
+    assert rows["md:pr"]["wall_s"] == pytest.approx(2.0)
@@ -0,0 +1,141 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from script.utilities import xtc as xtc_module
+from script.utilities.xtc import INDEX_SUFFIX, XTCReader, read_n_atoms, write_xtc
+
+XTC_PATH = Path("script/utilities/executable/test_data/cpptraj/trajectory.xtc")
+
+
+@pytest.fixture
+def xtc(tmp_path):
+    path = tmp_path / "trajectory.xtc"
+    shutil.copy(XTC_PATH, path)
+    return path
+
+
+def test_index(xtc):
+    reader = XTCReader(xtc)
+    assert reader.n_frames == 6
+    assert reader.n_atoms == 38317
+    np.testing.assert_array_equal(reader.steps, [0, 200, 400, 600, 800, 1000])
+    np.testing.assert_allclose(reader.times, [0.0, 0.4, 0.8, 1.2, 1.6, 2.0], atol=1e-6)
+    assert Path(str(xtc) + INDEX_SUFFIX).exists()
+
+
+def test_read_n_atoms(xtc, tmp_path):
+    assert read_n_atoms(xtc) == 38317
+    assert not Path(str(xtc) + INDEX_SUFFIX).exists()  # the index is not built
+    path = tmp_path / "broken.xtc"
+    path.write_bytes(b"\x00" * 100)
+    with pytest.raises(ValueError):
+        read_n_atoms(path)
+
+
+def test_index_is_reused_and_invalidated(xtc):
+    XTCReader(xtc)
+    index_path = Path(str(xtc) + INDEX_SUFFIX)
+    mtime = os.stat(index_path).st_mtime_ns
+
+    XTCReader(xtc)
+    assert os.stat(index_path).st_mtime_ns == mtime  # the sidecar is reused
+
+    # a trajectory extended by a restarted run
+    with open(xtc, "ab") as fout:
+        fout.write(open(XTC_PATH, "rb").read())
+    reader = XTCReader(xtc)
+    assert reader.n_frames == 12
+    np.testing.assert_array_equal(reader.read_frame(7), reader.read_frame(1))
+
+
+def test_read_frame(xtc):
+    # reference values from mdtraj
+    reader = XTCReader(xtc)
+    coords = reader.read_frame(4)
+    assert coords.dtype == np.float32
+    assert coords.shape == (38317, 3)
+    np.testing.assert_allclose(coords[0], [0.7942, 2.2402, 4.7363], atol=1e-4)
+    np.testing.assert_allclose(coords[1], [0.7206, 2.3087, 4.7270], atol=1e-4)
+    np.testing.assert_allclose(coords[-1], [6.9162, 0.5417, 1.7807], atol=1e-4)
+    np.testing.assert_allclose(np.diag(reader.read_box(4)), [7.273736, 7.280154, 7.284269], atol=1e-5)
+
+
+def test_strided_read_of_atom_subset(xtc):
+    reader = XTCReader(xtc)
+    atom_indices = [100, 3, 38316]
+    block = reader.read(1, None, 2, atom_indices=atom_indices)
+    assert block.shape == (3, 3, 3)
+    for i, frame in enumerate([1, 3, 5]):
+        np.testing.assert_array_equal(block[i], reader.read_frame(frame)[atom_indices])
+
+    head = reader.read(-2, atom_indices=[0, 1, 2])  # only leading atoms are decoded
+    np.testing.assert_array_equal(head[1], reader.read_frame(5)[:3])
+
+
+def test_invalid_file(tmp_path):
+    path = tmp_path / "broken.xtc"
+    path.write_bytes(b"\x00" * 100)
+    with pytest.raises(ValueError):
+        XTCReader(path)
+    with pytest.raises(FileNotFoundError):
+        XTCReader(tmp_path / "notfound.xtc")
+
+
+def test_write_xtc(xtc, tmp_path):
+    reader = XTCReader(xtc)
+    coords = reader.read(0, 2)
+    box = np.stack([reader.read_box(0), reader.read_box(1)])
+    path = write_xtc(tmp_path / "written.xtc", coords, box, steps=[0, 200], times=[0.0, 0.4])
+
+    written = XTCReader(path)
+    assert (written.n_frames, written.n_atoms) == (2, 38317)
+    np.testing.assert_array_equal(written.steps, [0, 200])
+    np.testing.assert_allclose(written.read(), coords, atol=0.0006)  # precision of 0.001 nm
+    np.testing.assert_allclose(written.read_box(1), box[1])
+
+    # frames appended by a resumed run, the same coordinates in all frames and a few atoms (not compressed)
+    write_xtc(path, coords[1], box[1], steps=[400, 600], times=[0.8, 1.2], append=True)
+    written = XTCReader(path)
+    assert written.n_frames == 4
+    np.testing.assert_array_equal(written.read_frame(3), written.read_frame(1))
+    small = write_xtc(tmp_path / "small.xtc", coords[0, :5], box[0], steps=[0], times=[0.0])
+    np.testing.assert_array_equal(XTCReader(small).read_frame(0), coords[0, :5])
+
+
+@pytest.mark.parametrize("scale", [1.0, 1e6])  # 1e6: coordinates are sent one by one (ranges > 0xFFFFFF)
+def test_decompress_without_runs(tmp_path, monkeypatch, scale):
+    rng = np.random.default_rng(0)
+    coords = rng.uniform(-1.0, 8.0, size=(2, 50, 3)) * scale
+    path = write_xtc(tmp_path / "written.xtc", coords, np.eye(3) * 8, steps=[0, 1], times=[0.0, 1.0], precision=10.0)
+    monkeypatch.setattr(XTCReader, "_read_compiled", lambda *args: False)
+    fast = XTCReader(path).read()
+    np.testing.assert_allclose(fast, coords, atol=0.05 + 1e-6 * scale)  # float32
+
+    monkeypatch.setattr(xtc_module, "_decompress_fixed", lambda *args: None)
+    np.testing.assert_array_equal(XTCReader(path).read(), fast)
+
+
+def test_gromacs_stream_has_runs(xtc, monkeypatch):
+    # GROMACS compresses water molecules with runs of small differences: decoded atom by atom
+    calls = []
+    decompress_fixed = xtc_module._decompress_fixed
+    monkeypatch.setattr(xtc_module, "_decompress_fixed", lambda *args: calls.append(decompress_fixed(*args)))
+    monkeypatch.setattr(XTCReader, "_read_compiled", lambda *args: False)
+    XTCReader(xtc).read(0, 1, atom_indices=[0])
+    assert calls == [None]
+
+
+@pytest.mark.parametrize("module", ["MDAnalysis", "mdtraj"])
+def test_compiled_decoder(xtc, monkeypatch, module):
+    pytest.importorskip(module)
+    if module == "mdtraj":
+        monkeypatch.setitem(sys.modules, "MDAnalysis.lib.formats.libmdaxdr", None)
+    reader = XTCReader(xtc)
+    block = reader.read(1, None, 2, atom_indices=[100, 3, 38316])
+    monkeypatch.setattr(XTCReader, "_read_compiled", lambda *args: False)
+    np.testing.assert_allclose(block, reader.read(1, None, 2, atom_indices=[100, 3, 38316]), atol=1e-6)
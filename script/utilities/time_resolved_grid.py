@@ -0,0 +1,109 @@
+import json
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import gridData
+import numpy as np
+import numpy.typing as npt
+
+META_FILE = "meta.json"
+
+
+def write_time_resolved_grid(
+    outdir: Path,
+    grids: Sequence[gridData.Grid],
+    frames: Sequence[int],
+    frame_ranges: Sequence[Tuple[int, int, int]],
+    times: Optional[Sequence[Tuple[float, float]]] = None,
+) -> Path:
+    """
+    Write per-window count grids as a 4D (window, x, y, z) array store.
+    Each window is stored in its own compressed chunk, so that windows can be loaded lazily.
+    input:
+        grids: count grid of each window
+        frames: the number of frames of each window
+        frame_ranges: (start, stop, offset) of each window (cpptraj frame numbers)
+        times: (first, last) simulation time of each window in ps
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    windows = []
+    for i, g in enumerate(grids):
+        name = f"window_{i:05d}.npz"
+        np.savez_compressed(outdir / name, counts=g.grid.astype(np.float32))
+        windows.append(
+            {
+                "file": name,
+                "frames": int(frames[i]),
+                "frame_range": [int(n) for n in frame_ranges[i]],
+                "time": None if times is None else [float(t) for t in times[i]],
+            }
+        )
+    meta = {
+        "shape": [int(n) for n in grids[0].grid.shape],
+        "origin": [float(x) for x in grids[0].origin],
+        "delta": [float(x) for x in grids[0].delta],
+        "windows": windows,
+    }
+    with open(outdir / META_FILE, "w") as fout:
+        json.dump(meta, fout, indent=1)
+    return outdir
+
+
+class TimeResolvedGrid(object):
+    """
+    Lazily-loaded 4D (window, x, y, z) count grids written by write_time_resolved_grid.
+
+    grid4d[i] or grid4d[i:j] loads only the requested windows,
+    and sum(i, j) accumulates them into a single count grid.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path / META_FILE) as fin:
+            self.meta = json.load(fin)
+        self.origin = np.array(self.meta["origin"])
+        self.delta = np.array(self.meta["delta"])
+
+    @property
+    def shape(self) -> Tuple[int, int, int, int]:
+        return (len(self.meta["windows"]), *self.meta["shape"])
+
+    def __len__(self) -> int:
+        return len(self.meta["windows"])
+
+    @property
+    def frames(self) -> npt.NDArray[np.int64]:
+        return np.array([w["frames"] for w in self.meta["windows"]], dtype=np.int64)
+
+    @property
+    def times(self) -> List[Optional[List[float]]]:
+        return [w["time"] for w in self.meta["windows"]]
+
+    def _load(self, window: int) -> npt.NDArray[np.float32]:
+        with np.load(self.path / self.meta["windows"][window]["file"]) as data:
+            return data["counts"]
+
+    def __getitem__(self, key: Union[int, slice]) -> npt.NDArray[np.float32]:
+        if isinstance(key, slice):
+            windows = range(len(self))[key]
+            ret = np.empty((len(windows), *self.meta["shape"]), dtype=np.float32)
+            for i, window in enumerate(windows):
+                ret[i] = self._load(window)
+            return ret
+        return self._load(range(len(self))[key])
+
+    def sum(self, start: Optional[int] = None, stop: Optional[int] = None) -> Tuple[gridData.Grid, int]:
+        """
+        sum count grids of windows[start:stop]
+        output:
+            count grid, the number of frames
+        """
+        windows = range(len(self))[start:stop]
+        if len(windows) == 0:
+            raise ValueError("No windows are selected")
+        counts = np.zeros(self.meta["shape"], dtype=np.float64)
+        for window in windows:
+            counts += self._load(window)
+        frames = int(self.frames[start:stop].sum())
+        return gridData.Grid(counts, origin=self.origin, delta=self.delta), frames
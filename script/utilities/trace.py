@@ -0,0 +1,184 @@
+"""
+Span-based timing and resource instrumentation
+
+with span("gridding", system=1):
+    ...
+
+@span("preprocess")
+def preprocess(...):
+    ...
+
+Each span records the wall time, the CPU time of its thread, the CPU time of child processes
+(packmol, tleap, gmx, cpptraj, ...) finished during the span and the peak RSS of the process and children.
+Spans are recorded only after tracer.start(), and tracer.save() writes a Chrome trace
+(chrome://tracing, https://ui.perfetto.dev) and a summary table of the spans.
+Child CPU time and peak RSS are process-wide: they include the work of spans running in other threads.
+After profiler.start() (--profile), the outermost span of each thread is also profiled (see utilities.profiler).
+"""
+
+import atexit
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .logger import logger
+from .profiler import profiler
+
+VERSION = "1.0.0"
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_mb(who: int) -> float:
+    return resource.getrusage(who).ru_maxrss / 1024  # KiB on Linux
+
+
+class Tracer(object):
+    """
+    spans of a run ("X" events of the Chrome trace format, times in us from the start of the run)
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events: List[dict] = []
+        self.epoch = time.time()
+        self._epoch_perf = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def start(self, path: Optional[Path] = None) -> None:
+        """
+        start recording spans (and write them to path at exit if given)
+        """
+        self.enabled = True
+        self.events = []
+        self.epoch = time.time()
+        self._epoch_perf = time.perf_counter()
+        if path is not None:
+            atexit.register(self.save, Path(path))
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._epoch_perf) * 1e6
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[None]:
+        # the outermost span of a thread is also a stage of the profiler (--profile)
+        with profiler.stage(name):
+            with self._span(name, **args):
+                yield
+
+    @contextmanager
+    def _span(self, name: str, **args) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = self._now_us()
+        cpu = time.thread_time()
+        children_cpu = _children_cpu()
+        try:
+            yield
+        finally:
+            args.update(
+                cpu_s=round(time.thread_time() - cpu, 6),
+                children_cpu_s=round(_children_cpu() - children_cpu, 6),
+                peak_rss_mb=round(_peak_rss_mb(resource.RUSAGE_SELF), 1),
+                children_peak_rss_mb=round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            )
+            self._add(name, start, self._now_us() - start, threading.get_native_id(), args)
+
+    def add_span(self, name: str, start: float, end: float, tid: Optional[int] = None, **args) -> None:
+        """
+        record a span measured outside the process (e.g. an MD step from its log)
+        start, end: UNIX time [s]
+        """
+        if self.enabled:
+            start_us = (start - self.epoch) * 1e6
+            self._add(name, start_us, (end - start) * 1e6, tid or threading.get_native_id(), args)
+
+    def _add(self, name: str, start_us: float, dur_us: float, tid: int, args: dict) -> None:
+        event = {
+            "name": name,
+            "cat": name.split(":")[0],
+            "ph": "X",
+            "ts": round(start_us, 1),
+            "dur": round(dur_us, 1),
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> List[Dict]:
+        """
+        spans aggregated by name (in the order of the first start)
+        """
+        rows: Dict[str, dict] = {}
+        for event in sorted(self.events, key=lambda e: e["ts"]):
+            row = rows.setdefault(
+                event["name"],
+                {
+                    "name": event["name"],
+                    "count": 0,
+                    "wall_s": 0.0,
+                    "cpu_s": 0.0,
+                    "children_cpu_s": 0.0,
+                    "peak_rss_mb": 0,
+                },
+            )
+            row["count"] += 1
+            row["wall_s"] += event["dur"] / 1e6
+            row["cpu_s"] += event["args"].get("cpu_s", 0.0)
+            row["children_cpu_s"] += event["args"].get("children_cpu_s", 0.0)
+            row["peak_rss_mb"] = max(row["peak_rss_mb"], event["args"].get("peak_rss_mb", 0))
+        return list(rows.values())
+
+    def format_summary(self) -> str:
+        lines = [f"{'span':40s} {'count':>6s} {'wall [s]':>10s} {'cpu [s]':>10s} {'child [s]':>10s} {'rss [MB]':>9s}"]
+        for row in self.summary():
+            lines.append(
+                f"{row['name'][:40]:40s} {row['count']:6d} {row['wall_s']:10.2f} {row['cpu_s']:10.2f} "
+                f"{row['children_cpu_s']:10.2f} {row['peak_rss_mb']:9.1f}"
+            )
+        return "\n".join(lines)
+
+    def save(self, path: Path) -> None:
+        """
+        write the Chrome trace to path and the summary table to path.with_suffix(".txt")
+        """
+        if not self.events:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        trace = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"start": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.epoch))},
+        }
+        path.write_text(json.dumps(trace))
+        summary = self.format_summary()
+        path.with_suffix(".txt").write_text(summary + "\n")
+        logger.info(f"trace: {path}\n{summary}")
+
+
+tracer = Tracer()
+
+
+def span(name: str, **args):
+    """
+    context manager (or decorator) recording a span of the global tracer
+    """
+    return tracer.span(name, **args)
+
+
+def trace_path(workdir: Path, prog: str) -> Path:
+    """{workdir}/trace/{prog}_{YYYYmmdd-HHMMSS}_{pid}.json (array jobs may start at the same time)"""
+    return Path(workdir) / "trace" / f"{prog}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}.json"
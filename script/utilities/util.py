@@ -1,12 +1,21 @@
 import collections.abc
 import os
 import random
+import re
+import shutil
 import string
+import subprocess
 from pathlib import Path
-from typing import Union
+from typing import Dict, List, Union
 
 from .logger import logger
 
+# arguments printing the version (packmol prints it in the header of an empty input)
+VERSION_ARGS = {"gmx": ["--version"], "cpptraj": ["--version"], "packmol": [], "tleap": ["-h"]}
+VERSION_TIMEOUT = 60
+
+_versions: Dict[str, str] = {}
+
 
 def update_dict(d: dict, u: dict):
     for k, v in u.items():
@@ -43,6 +52,38 @@ def randomname(n: int):
     return "".join(randlst)
 
 
+def _version_args(exe: str) -> List[str]:
+    name = Path(exe).name
+    for key, args in VERSION_ARGS.items():
+        if name.startswith(key):  # e.g. gmx_mpi, cpptraj.OMP
+            return args
+    return ["--version"]
+
+
+def executable_version(exe: str) -> str:
+    """
+    the first line containing "version" printed by the executable (cached per executable),
+    or the resolved path of the executable if it does not print the version
+    """
+    if exe not in _versions:
+        path = shutil.which(exe) or exe
+        try:
+            res = subprocess.run(
+                [exe, *_version_args(exe)],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=VERSION_TIMEOUT,
+            )
+            lines = res.stdout.decode("utf-8", errors="replace").splitlines()
+            found = [" ".join(line.split()) for line in lines if re.search("version", line, re.IGNORECASE)]
+            _versions[exe] = found[0] if found else path
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warn(f"version of {exe} is unknown: {e}")
+            _versions[exe] = path
+    return _versions[exe]
+
+
 def dat_dump(dat):
     for section in dat.sections():
         logger.debug("[%s]" % section)
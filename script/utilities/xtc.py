@@ -0,0 +1,438 @@
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from .logger import logger
+
+# XTC magic numbers (2023: 64-bit byte count for huge systems)
+_MAGIC = 1995
+_MAGIC_LARGE = 2023
+
+# magic, natoms, step, time, box (3x3), natoms
+_HEADER = struct.Struct(">iiif9fi")
+# precision, minint (3), maxint (3), smallidx
+_COMPRESSED_HEADER = struct.Struct(">f3i3ii")
+
+_MAGICINTS = (
+    0, 0, 0, 0, 0, 0, 0, 0, 0, 8, 10, 12, 16, 20, 25, 32, 40, 50, 64,
+    80, 101, 128, 161, 203, 256, 322, 406, 512, 645, 812, 1024, 1290,
+    1625, 2048, 2580, 3250, 4096, 5060, 6501, 8192, 10321, 13003,
+    16384, 20642, 26007, 32768, 41285, 52015, 65536, 82570, 104031,
+    131072, 165140, 208063, 262144, 330280, 416127, 524287, 660561,
+    832255, 1048576, 1321122, 1664510, 2097152, 2642245, 3329021,
+    4194304, 5284491, 6658042, 8388607, 10568983, 13316085, 16777216,
+)  # fmt: skip
+_FIRSTIDX = 9
+
+INDEX_SUFFIX = ".offsets.npz"
+
+
+def _padded(nbytes: int) -> int:
+    return (nbytes + 3) // 4 * 4
+
+
+def _decompress_fixed(
+    data: bytes, natoms: int, sizeint: Sequence[int], bitsizeint: Sequence[int], bitsize: int
+) -> Optional[npt.NDArray[np.int64]]:
+    """
+    Decode a stream without runs of small differences (e.g. written by _compress) with numpy.
+    Every atom then has the same number of bits, so all atoms are decoded at once.
+    output:
+        (natoms, 3) integer coordinates relative to minint, or None if the stream has a run
+    """
+    if bitsize >= 64:
+        return None
+    widths = list(bitsizeint) if bitsize == 0 else [min(8, bitsize - shift) for shift in range(0, bitsize, 8)]
+    stride = sum(widths) + 1  # + the flag of a run
+    if len(data) * 8 < natoms * stride:
+        return None
+    fields = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=natoms * stride).reshape(natoms, stride)
+    if fields[:, -1].any():
+        return None  # atoms after a run are not aligned
+    values = []
+    start = 0
+    for width in widths:
+        weights = np.left_shift(np.uint64(1), np.arange(width - 1, -1, -1, dtype=np.uint64))
+        values.append(fields[:, start : start + width].astype(np.uint64) @ weights)
+        start += width
+    if bitsize == 0:
+        return np.stack(values, axis=1).astype(np.int64)
+    # the packed integer is sent as little-endian bytes
+    value = np.zeros(natoms, dtype=np.uint64)
+    for k, byte in enumerate(values):
+        value |= byte << np.uint64(8 * k)
+    value, z = np.divmod(value, np.uint64(sizeint[2]))
+    x, y = np.divmod(value, np.uint64(sizeint[1]))
+    return np.stack([x, y, z], axis=1).astype(np.int64)
+
+
+def _decompress(
+    data: bytes, natoms: int, minint, maxint, smallidx: int, n_decode: Optional[int] = None
+) -> npt.NDArray[np.int64]:
+    """
+    Decode xtc-compressed integer coordinates (a port of xdrfile_decompress_coord_float)
+    Streams without runs of small differences are decoded with numpy (_decompress_fixed).
+    Those written by GROMACS are decoded atom by atom in pure python,
+    which takes ~0.1 s per frame of 30,000 atoms (XTCReader uses MDAnalysis or mdtraj instead if installed).
+    input:
+        n_decode: decoding stops after the first ``n_decode`` atoms (the rest of the output is undefined)
+    output:
+        (natoms, 3) integer coordinates (not yet divided by the precision)
+    """
+    n_decode = natoms if n_decode is None else min(n_decode, natoms)
+    pos = 0  # bit position in data
+
+    def bits(nbits: int) -> int:
+        nonlocal pos
+        start = pos >> 3
+        end = (pos + nbits + 7) >> 3
+        pos += nbits
+        return (int.from_bytes(data[start:end], "big") >> (end * 8 - pos)) & ((1 << nbits) - 1)
+
+    def ints(nbits: int, sizes: Sequence[int]) -> Tuple[int, int, int]:
+        # the packed integer is sent as little-endian bytes
+        value = 0
+        shift = 0
+        while nbits > 8:
+            value |= bits(8) << shift
+            shift += 8
+            nbits -= 8
+        if nbits > 0:
+            value |= bits(nbits) << shift
+        value, z = divmod(value, sizes[2])
+        x, y = divmod(value, sizes[1])
+        return x, y, z
+
+    sizeint = [maxint[i] - minint[i] + 1 for i in range(3)]
+    if (sizeint[0] | sizeint[1] | sizeint[2]) > 0xFFFFFF:
+        bitsizeint = [int(s).bit_length() if s > 0 else 0 for s in sizeint]
+        bitsize = 0  # large coordinates are sent one by one
+    else:
+        bitsizeint = []
+        bitsize = (sizeint[0] * sizeint[1] * sizeint[2]).bit_length()
+
+    fixed = _decompress_fixed(data, natoms, sizeint, bitsizeint, bitsize)
+    if fixed is not None:
+        return fixed + np.array(minint, dtype=np.int64)
+
+    smaller = _MAGICINTS[max(_FIRSTIDX, smallidx - 1)] // 2
+    smallnum = _MAGICINTS[smallidx] // 2
+    sizesmall = [_MAGICINTS[smallidx]] * 3
+
+    ret = np.empty((natoms, 3), dtype=np.int64)
+    out = 0
+    run = 0
+    while out < n_decode:
+        if bitsize == 0:
+            x, y, z = bits(bitsizeint[0]), bits(bitsizeint[1]), bits(bitsizeint[2])
+        else:
+            x, y, z = ints(bitsize, sizeint)
+        px, py, pz = x + minint[0], y + minint[1], z + minint[2]
+
+        is_smaller = 0
+        if bits(1) == 1:
+            run = bits(5)
+            is_smaller = run % 3
+            run -= is_smaller
+            is_smaller -= 1
+
+        if run > 0:
+            for k in range(0, run, 3):
+                x, y, z = ints(smallidx, sizesmall)
+                x += px - smallnum
+                y += py - smallnum
+                z += pz - smallnum
+                if k == 0:
+                    # the first two atoms are interchanged for better compression of water molecules
+                    x, px = px, x
+                    y, py = py, y
+                    z, pz = pz, z
+                    ret[out] = (px, py, pz)
+                    out += 1
+                else:
+                    px, py, pz = x, y, z
+                ret[out] = (x, y, z)
+                out += 1
+        else:
+            ret[out] = (px, py, pz)
+            out += 1
+
+        smallidx += is_smaller
+        if is_smaller < 0:
+            smallnum = smaller
+            smaller = _MAGICINTS[smallidx - 1] // 2 if smallidx > _FIRSTIDX else 0
+        elif is_smaller > 0:
+            smaller = smallnum
+            smallnum = _MAGICINTS[smallidx] // 2
+        sizesmall = [_MAGICINTS[smallidx]] * 3
+
+    return ret
+
+
+def _field_bits(values: npt.NDArray, nbits: int) -> npt.NDArray[np.uint8]:
+    """(n,) unsigned integers -> (n, nbits) bits (the most significant bit first)"""
+    shifts = np.arange(nbits - 1, -1, -1, dtype=np.uint64)
+    return ((values.astype(np.uint64)[:, None] >> shifts) & 1).astype(np.uint8)
+
+
+def _compress(coords: npt.NDArray[np.int64]) -> Tuple[Tuple[int, ...], Tuple[int, ...], bytes]:
+    """
+    Encode integer coordinates in the xtc format readable by _decompress (and GROMACS, cpptraj, ...)
+    Atoms are written one by one without the run-length coding of small differences,
+    so the output is valid but less compressed than that of GROMACS.
+    output:
+        minint, maxint, data
+    """
+    minint = coords.min(axis=0)
+    maxint = coords.max(axis=0)
+    sizeint = [int(maxint[i] - minint[i] + 1) for i in range(3)]
+    offsets = coords - minint
+    if (sizeint[0] | sizeint[1] | sizeint[2]) > 0xFFFFFF:
+        fields = [_field_bits(offsets[:, i], int(sizeint[i]).bit_length()) for i in range(3)]
+    else:
+        bitsize = (sizeint[0] * sizeint[1] * sizeint[2]).bit_length()
+        # object arrays of python integers for more than 64 bits
+        x, y, z = (offsets[:, i].astype(np.uint64 if bitsize < 64 else object) for i in range(3))
+        value = (x * x.dtype.type(sizeint[1]) + y) * x.dtype.type(sizeint[2]) + z
+        # the packed integer is sent as little-endian bytes (the last one has the remaining bits)
+        fields = [_field_bits((value >> shift) & 0xFF, min(8, bitsize - shift)) for shift in range(0, bitsize, 8)]
+    fields.append(np.zeros((len(coords), 1), dtype=np.uint8))  # no run of small differences
+    data = np.packbits(np.concatenate(fields, axis=1).reshape(-1)).tobytes()
+    return tuple(int(v) for v in minint), tuple(int(v) for v in maxint), data
+
+
+def read_n_atoms(path: Union[str, Path]) -> int:
+    """the number of atoms in the first frame of an xtc file (without building the frame index)"""
+    with open(path, "rb") as fin:
+        header = fin.read(8)
+    if len(header) < 8:
+        raise ValueError(f"truncated xtc frame 0: {path}")
+    magic, natoms = struct.unpack(">ii", header)
+    if magic not in (_MAGIC, _MAGIC_LARGE):
+        raise ValueError(f"invalid xtc magic number {magic} at byte 0: {path}")
+    return natoms
+
+
+class XTCReader(object):
+    """
+    Random-access reader of GROMACS xtc trajectories.
+
+    The byte offset of each frame is stored in a sidecar file
+    (``<trajectory>.offsets.npz``), which is rebuilt when the size or
+    the modification time of the trajectory changes.
+    Coordinates are returned in nm as in the xtc file.
+    They are decoded by the compiled xdrfile of MDAnalysis or mdtraj if either is installed,
+    otherwise by _decompress (slow for trajectories written by GROMACS).
+    """
+
+    def __init__(self, path: Union[str, Path], index_path: Optional[Union[str, Path]] = None):
+        self.path = Path(path)
+        self.index_path = Path(index_path) if index_path is not None else Path(str(self.path) + INDEX_SUFFIX)
+        if not self.path.exists():
+            raise FileNotFoundError(f"xtc file not found: {self.path}")
+        self._load_or_build_index()
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.offsets)
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load_or_build_index(self) -> None:
+        size, mtime = self._stat()
+        if self.index_path.exists():
+            try:
+                with np.load(self.index_path) as index:
+                    if int(index["size"]) == size and int(index["mtime"]) == mtime:
+                        self.offsets = index["offsets"]
+                        self.steps = index["steps"]
+                        self.times = index["times"]
+                        self.n_atoms = int(index["n_atoms"])
+                        return
+                logger.debug(f"xtc index is outdated: {self.index_path}")
+            except (OSError, KeyError, ValueError):
+                logger.warn(f"broken xtc index is ignored: {self.index_path}")
+
+        self._build_index()
+        try:
+            with open(self.index_path, "wb") as fout:  # np.savez appends ".npz" to a str path
+                np.savez(
+                    fout,
+                    offsets=self.offsets,
+                    steps=self.steps,
+                    times=self.times,
+                    n_atoms=self.n_atoms,
+                    size=size,
+                    mtime=mtime,
+                )
+        except OSError:
+            logger.debug(f"xtc index is not saved: {self.index_path}")
+
+    def _read_header(self, fin: BinaryIO) -> Optional[Tuple]:
+        buf = fin.read(_HEADER.size)
+        if len(buf) < _HEADER.size:
+            return None
+        header = _HEADER.unpack(buf)
+        if header[0] not in (_MAGIC, _MAGIC_LARGE):
+            raise ValueError(f"invalid xtc magic number {header[0]} at byte {fin.tell() - _HEADER.size}: {self.path}")
+        return header
+
+    def _read_byte_count(self, fin: BinaryIO, magic: int) -> int:
+        if magic == _MAGIC_LARGE:
+            return struct.unpack(">q", fin.read(8))[0]
+        return struct.unpack(">i", fin.read(4))[0]
+
+    def _build_index(self) -> None:
+        """scan frame headers and skip coordinate blocks without decoding them"""
+        offsets, steps, times = [], [], []
+        self.n_atoms = 0
+        with open(self.path, "rb") as fin:
+            while True:
+                offset = fin.tell()
+                header = self._read_header(fin)
+                if header is None:
+                    break
+                magic, natoms, step, time = header[:4]
+                if natoms <= 9:
+                    fin.seek(natoms * 3 * 4, os.SEEK_CUR)
+                else:
+                    fin.seek(_COMPRESSED_HEADER.size, os.SEEK_CUR)
+                    fin.seek(_padded(self._read_byte_count(fin, magic)), os.SEEK_CUR)
+                offsets.append(offset)
+                steps.append(step)
+                times.append(time)
+                self.n_atoms = natoms
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.steps = np.array(steps, dtype=np.int64)
+        self.times = np.array(times, dtype=np.float32)
+
+    def _read_frame(
+        self, fin: BinaryIO, frame: int, n_decode: Optional[int] = None
+    ) -> Tuple[npt.NDArray[np.float32], npt.NDArray[np.float32]]:
+        fin.seek(int(self.offsets[frame]))
+        header = self._read_header(fin)
+        if header is None:
+            raise ValueError(f"truncated xtc frame {frame}: {self.path}")
+        magic, natoms = header[:2]
+        box = np.array(header[4:13], dtype=np.float32).reshape(3, 3)
+        if natoms <= 9:
+            coords = np.frombuffer(fin.read(natoms * 3 * 4), dtype=">f4").reshape(natoms, 3)
+            return coords.astype(np.float32), box
+
+        precision, *rest = _COMPRESSED_HEADER.unpack(fin.read(_COMPRESSED_HEADER.size))
+        minint, maxint, smallidx = rest[0:3], rest[3:6], rest[6]
+        data = fin.read(self._read_byte_count(fin, magic))
+        coords = _decompress(data, natoms, minint, maxint, smallidx, n_decode)
+        return (coords / precision).astype(np.float32), box
+
+    def read_frame(self, frame: int) -> npt.NDArray[np.float32]:
+        """read coordinates of a frame: (n_atoms, 3) array"""
+        return self.read(frame, frame + 1)[0]
+
+    def read_box(self, frame: int) -> npt.NDArray[np.float32]:
+        """read box vectors of a frame: (3, 3) array"""
+        with open(self.path, "rb") as fin:
+            return self._read_frame(fin, range(self.n_frames)[frame])[1]
+
+    def read(
+        self,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+        step: Optional[int] = None,
+        atom_indices: Optional[Sequence[int]] = None,
+    ) -> npt.NDArray[np.float32]:
+        """
+        read coordinates of frames[start:stop:step] (0-based, the same as python slicing)
+        input:
+            atom_indices: indices of atoms to be returned (all atoms if None)
+        output:
+            (n_frames, n_atoms, 3) float32 array in nm
+        """
+        frames = range(self.n_frames)[slice(start, stop, step)]
+        n_atoms = self.n_atoms if atom_indices is None else len(atom_indices)
+        # atoms are decoded sequentially, so atoms after the last selected one are skipped
+        n_decode = None if atom_indices is None or n_atoms == 0 else int(np.max(atom_indices)) + 1
+        ret = np.empty((len(frames), n_atoms, 3), dtype=np.float32)
+        if self.n_atoms > 9 and self._read_compiled(frames, atom_indices, ret):
+            return ret
+        with open(self.path, "rb") as fin:
+            for i, frame in enumerate(frames):
+                coords, _ = self._read_frame(fin, frame, n_decode)
+                ret[i] = coords if atom_indices is None else coords[atom_indices]
+        return ret
+
+    def _read_compiled(
+        self, frames: range, atom_indices: Optional[Sequence[int]], ret: npt.NDArray[np.float32]
+    ) -> bool:
+        """
+        read frames with the compiled xdrfile of MDAnalysis or mdtraj (optional dependencies)
+        output:
+            False if neither is installed
+        """
+        try:
+            from MDAnalysis.lib.formats.libmdaxdr import XTCFile
+        except ImportError:
+            XTCFile = None
+        if XTCFile is not None:
+            with XTCFile(str(self.path)) as xtc:
+                xtc.set_offsets(self.offsets)
+                for i, frame in enumerate(frames):
+                    xtc.seek(frame)
+                    coords = xtc.read().x
+                    ret[i] = coords if atom_indices is None else coords[atom_indices]
+            return True
+        try:
+            from mdtraj.formats import XTCTrajectoryFile
+        except ImportError:
+            return False
+        with XTCTrajectoryFile(str(self.path), "r") as xtc:
+            for i, frame in enumerate(frames):
+                xtc.seek(frame)
+                ret[i] = xtc.read(n_frames=1, atom_indices=atom_indices)[0][0]
+        return True
+
+
+def write_xtc(
+    path: Union[str, Path],
+    coords: npt.ArrayLike,
+    box: npt.ArrayLike,
+    steps: Sequence[int],
+    times: Sequence[float],
+    precision: float = 1000.0,
+    append: bool = False,
+) -> Path:
+    """
+    write frames to an xtc file
+    input:
+        coords: (n_frames, n_atoms, 3) coordinates [nm] (or (n_atoms, 3) for the same coordinates in all frames)
+        box: (3, 3) or (n_frames, 3, 3) box vectors [nm]
+        steps, times: step and time [ps] of each frame
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    n_frames = len(steps)
+    box = np.broadcast_to(np.asarray(box, dtype=np.float32).reshape(-1, 3, 3), (n_frames, 3, 3))
+    same = coords.ndim == 2
+    encoded = None
+    with open(path, "ab" if append else "wb") as fout:
+        for k in range(n_frames):
+            frame = coords if same else coords[k]
+            natoms = len(frame)
+            fout.write(_HEADER.pack(_MAGIC, natoms, int(steps[k]), float(times[k]), *box[k].reshape(-1), natoms))
+            if natoms <= 9:
+                fout.write(frame.astype(">f4").tobytes())
+                continue
+            if encoded is None or not same:
+                minint, maxint, data = _compress(np.rint(frame * precision).astype(np.int64))
+                encoded = _COMPRESSED_HEADER.pack(precision, *minint, *maxint, _FIRSTIDX)
+                encoded += struct.pack(">i", len(data)) + data + bytes(_padded(len(data)) - len(data))
+            fout.write(encoded)
+    return Path(path)